@@ -0,0 +1,61 @@
+"""Seed the velocity window of existing wallet fraud state
+
+Revision ID: 0e5a7c3b9d18
+Revises: b7e3d91c4a52
+Create Date: 2026-10-19 15:27:06.914530
+
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.fraud import engine
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0e5a7c3b9d18'
+down_revision: Union[str, None] = 'b7e3d91c4a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+transactions = sa.table(
+    'transactions',
+    sa.column('wallet_id', sa.Integer), sa.column('timestamp', sa.DateTime), sa.column('deleted', sa.Boolean),
+)
+fraud_state = sa.table('wallet_fraud_state', sa.column('wallet_id', sa.Integer), sa.column('recent_json', sa.String))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # State seeded by 3f9c1ab27d4e started with an empty window; fill it with each
+    # wallet's last max_txn + 1 transactions inside the velocity period.
+    velocity = engine.params()["velocity"]
+    since = datetime.utcnow() - timedelta(minutes=velocity["period_minutes"])
+    conn = op.get_bind()
+    recent = defaultdict(list)
+    rows = conn.execute(
+        sa.select(transactions.c.wallet_id, transactions.c.timestamp)
+        .where(transactions.c.deleted == sa.false(), transactions.c.timestamp > since)
+        .where(transactions.c.wallet_id.in_(
+            sa.select(fraud_state.c.wallet_id).where(fraud_state.c.recent_json == '[]')
+        ))
+        .order_by(transactions.c.wallet_id, transactions.c.timestamp)
+    )
+    for wallet_id, timestamp in rows:
+        recent[wallet_id].append(timestamp)
+    for wallet_id, timestamps in recent.items():
+        conn.execute(
+            fraud_state.update()
+            .where(fraud_state.c.wallet_id == wallet_id, fraud_state.c.recent_json == '[]')
+            .values(recent_json=json.dumps([ts.isoformat() for ts in timestamps[-(velocity["max_txn"] + 1):]]))
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Nothing to undo; the window refills itself as transactions arrive.
+    pass
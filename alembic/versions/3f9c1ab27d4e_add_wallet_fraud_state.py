@@ -0,0 +1,40 @@
+"""Add wallet fraud state
+
+Revision ID: 3f9c1ab27d4e
+Revises: 56cc387c0d88
+Create Date: 2026-10-18 09:12:44.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c1ab27d4e'
+down_revision: Union[str, None] = '56cc387c0d88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'wallet_fraud_state',
+        sa.Column('wallet_id', sa.Integer(), sa.ForeignKey('wallets.id'), primary_key=True),
+        sa.Column('txn_count', sa.Integer(), nullable=False),
+        sa.Column('amount_sum', sa.Float(), nullable=False),
+        sa.Column('recent_json', sa.String(), nullable=False),
+    )
+    # Seed running aggregates from existing history; 0e5a7c3b9d18 fills the velocity window.
+    op.execute(
+        "INSERT INTO wallet_fraud_state (wallet_id, txn_count, amount_sum, recent_json) "
+        "SELECT wallet_id, COUNT(id), COALESCE(SUM(amount), 0), '[]' FROM transactions "
+        "WHERE NOT deleted AND wallet_id IS NOT NULL GROUP BY wallet_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('wallet_fraud_state')
@@ -0,0 +1,47 @@
+"""Add alert outbox
+
+Revision ID: 5d0f3b8e2a61
+Revises: c41e9a07d5b2
+Create Date: 2026-10-18 14:22:10.675431
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0f3b8e2a61'
+down_revision: Union[str, None] = 'c41e9a07d5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'alert_outbox',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('wallet_id', sa.Integer(), sa.ForeignKey('wallets.id'), nullable=True),
+        sa.Column('to_email', sa.String(), nullable=False),
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('message', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index(
+        'ix_alert_outbox_pending',
+        'alert_outbox',
+        ['next_attempt_at'],
+        sqlite_where=sa.text('sent_at IS NULL'),
+        postgresql_where=sa.text('sent_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_alert_outbox_pending', table_name='alert_outbox')
+    op.drop_table('alert_outbox')
@@ -0,0 +1,47 @@
+"""Add transaction archive catalog and soft-deleted index
+
+Revision ID: 6c1d8f4b2e95
+Revises: 2b8f5e3a7c10
+Create Date: 2026-10-18 19:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c1d8f4b2e95'
+down_revision: Union[str, None] = '2b8f5e3a7c10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'transaction_archives',
+        sa.Column('month', sa.String(), primary_key=True),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('newest', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index(
+        'ix_transactions_deleted',
+        'transactions',
+        ['id'],
+        sqlite_where=sa.text('deleted = 1'),
+        postgresql_where=sa.text('deleted'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    The monthly transactions_archive_YYYYMM tables are left in place; their
+    rows are not moved back.
+    """
+    op.drop_index('ix_transactions_deleted', table_name='transactions')
+    op.drop_table('transaction_archives')
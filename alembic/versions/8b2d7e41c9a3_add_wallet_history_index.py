@@ -0,0 +1,32 @@
+"""Add wallet history index
+
+Revision ID: 8b2d7e41c9a3
+Revises: 3f9c1ab27d4e
+Create Date: 2026-10-18 11:40:03.512870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2d7e41c9a3'
+down_revision: Union[str, None] = '3f9c1ab27d4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_transactions_wallet_history',
+        'transactions',
+        ['wallet_id', 'deleted', 'timestamp', 'id'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transactions_wallet_history', table_name='transactions')
@@ -0,0 +1,68 @@
+"""Store money as integer minor units
+
+Revision ID: 9a4e6d2c1f37
+Revises: e7a2c5f19d84
+Create Date: 2026-10-18 16:10:31.448902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import CURRENCY_SCALE
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4e6d2c1f37'
+down_revision: Union[str, None] = 'e7a2c5f19d84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, nullable)
+MONEY_COLUMNS = [
+    ('wallets', 'balance', True),
+    ('transactions', 'amount', True),
+    ('wallet_fraud_state', 'amount_sum', False),
+    ('fraud_report_summaries', 'amount', False),
+]
+
+
+def _drop_flagged_queue_index() -> None:
+    # SQLite batch mode recreates the table and would lose the partial index's WHERE clause.
+    op.drop_index('ix_transactions_flagged_queue', table_name='transactions')
+
+
+def _create_flagged_queue_index() -> None:
+    op.create_index(
+        'ix_transactions_flagged_queue',
+        'transactions',
+        ['timestamp', 'id'],
+        sqlite_where=sa.text('flagged = 1 AND deleted = 0'),
+        postgresql_where=sa.text('flagged AND NOT deleted'),
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _drop_flagged_queue_index()
+    for table, column, nullable in MONEY_COLUMNS:
+        op.execute(f'UPDATE {table} SET {column} = ROUND({column} * {CURRENCY_SCALE})')
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                column, existing_type=sa.Float(), type_=sa.Integer(), existing_nullable=nullable,
+                postgresql_using=f'{column}::integer',
+            )
+    _create_flagged_queue_index()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _drop_flagged_queue_index()
+    for table, column, nullable in MONEY_COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                column, existing_type=sa.Integer(), type_=sa.Float(), existing_nullable=nullable,
+            )
+        op.execute(f'UPDATE {table} SET {column} = {column} * 1.0 / {CURRENCY_SCALE}')
+    _create_flagged_queue_index()
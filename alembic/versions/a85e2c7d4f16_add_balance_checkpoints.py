@@ -0,0 +1,38 @@
+"""Add balance checkpoints and target wallet index
+
+Revision ID: a85e2c7d4f16
+Revises: 6c1d8f4b2e95
+Create Date: 2026-10-18 20:41:07.339512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a85e2c7d4f16'
+down_revision: Union[str, None] = '6c1d8f4b2e95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'balance_checkpoints',
+        sa.Column('wallet_id', sa.Integer(), sa.ForeignKey('wallets.id'), primary_key=True),
+        sa.Column('last_id', sa.Integer(), primary_key=True),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+        sa.Column('balance', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_balance_checkpoints_wallet_as_of', 'balance_checkpoints', ['wallet_id', 'as_of'])
+    op.create_index('ix_transactions_target_wallet', 'transactions', ['target_wallet_id', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transactions_target_wallet', table_name='transactions')
+    op.drop_index('ix_balance_checkpoints_wallet_as_of', table_name='balance_checkpoints')
+    op.drop_table('balance_checkpoints')
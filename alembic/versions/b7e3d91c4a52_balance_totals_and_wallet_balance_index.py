@@ -0,0 +1,40 @@
+"""Keep the admin balance total in the database and index wallet balances
+
+Revision ID: b7e3d91c4a52
+Revises: f4c8a1d6b357
+Create Date: 2026-10-19 11:03:17.508342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3d91c4a52'
+down_revision: Union[str, None] = 'f4c8a1d6b357'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'balance_totals',
+        sa.Column('shard', sa.Integer(), primary_key=True),
+        sa.Column('total', sa.Integer(), nullable=False),
+    )
+    # Seed the whole current total into shard 0; writers spread later changes.
+    op.execute(
+        'INSERT INTO balance_totals (shard, total) '
+        'SELECT 0, COALESCE(SUM(w.balance), 0) FROM wallets w JOIN users u ON w.user_id = u.id '
+        'WHERE u.is_active AND NOT u.deleted'
+    )
+    op.create_index('ix_wallets_balance', 'wallets', ['balance'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_wallets_balance', table_name='wallets')
+    op.drop_table('balance_totals')
@@ -0,0 +1,53 @@
+"""Add flagged queue index and flag reason counts
+
+Revision ID: c41e9a07d5b2
+Revises: 8b2d7e41c9a3
+Create Date: 2026-10-18 13:05:27.904116
+
+"""
+from collections import Counter
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e9a07d5b2'
+down_revision: Union[str, None] = '8b2d7e41c9a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_transactions_flagged_queue',
+        'transactions',
+        ['timestamp', 'id'],
+        sqlite_where=sa.text('flagged = 1 AND deleted = 0'),
+        postgresql_where=sa.text('flagged AND NOT deleted'),
+    )
+    counts_table = op.create_table(
+        'flag_reason_counts',
+        sa.Column('reason', sa.String(), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+    )
+    # Seed the counters; reasons are stored comma-joined, so split them here.
+    counts = Counter()
+    rows = op.get_bind().execute(sa.text(
+        'SELECT flag_reason, COUNT(*) FROM transactions '
+        'WHERE flagged AND NOT deleted AND flag_reason IS NOT NULL GROUP BY flag_reason'
+    ))
+    for flag_reason, n in rows:
+        counts['__all__'] += n
+        for reason in flag_reason.split(', '):
+            counts[reason] += n
+    if counts:
+        op.bulk_insert(counts_table, [{'reason': r, 'count': n} for r, n in counts.items()])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('flag_reason_counts')
+    op.drop_index('ix_transactions_flagged_queue', table_name='transactions')
@@ -0,0 +1,34 @@
+"""Add scheduler leases
+
+Revision ID: d3b9f0e6a218
+Revises: a85e2c7d4f16
+Create Date: 2026-10-18 21:55:32.804716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3b9f0e6a218'
+down_revision: Union[str, None] = 'a85e2c7d4f16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'scheduler_leases',
+        sa.Column('name', sa.String(), primary_key=True),
+        sa.Column('holder', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('scheduler_leases')
@@ -0,0 +1,42 @@
+"""Add fraud report watermark and summaries
+
+Revision ID: e7a2c5f19d84
+Revises: 5d0f3b8e2a61
+Create Date: 2026-10-18 15:02:48.119504
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c5f19d84'
+down_revision: Union[str, None] = '5d0f3b8e2a61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'job_watermarks',
+        sa.Column('name', sa.String(), primary_key=True),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.Column('last_timestamp', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        'fraud_report_summaries',
+        sa.Column('period_start', sa.DateTime(), primary_key=True),
+        sa.Column('reason', sa.String(), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('fraud_report_summaries')
+    op.drop_table('job_watermarks')
@@ -0,0 +1,44 @@
+"""Dead-letter alerts that ran out of attempts
+
+Revision ID: f4c8a1d6b357
+Revises: d3b9f0e6a218
+Create Date: 2026-10-19 09:12:41.220918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c8a1d6b357'
+down_revision: Union[str, None] = 'd3b9f0e6a218'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('alert_outbox', sa.Column('dead_at', sa.DateTime(), nullable=True))
+    op.drop_index('ix_alert_outbox_pending', table_name='alert_outbox')
+    op.create_index(
+        'ix_alert_outbox_pending',
+        'alert_outbox',
+        ['next_attempt_at'],
+        sqlite_where=sa.text('sent_at IS NULL AND dead_at IS NULL'),
+        postgresql_where=sa.text('sent_at IS NULL AND dead_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_alert_outbox_pending', table_name='alert_outbox')
+    op.create_index(
+        'ix_alert_outbox_pending',
+        'alert_outbox',
+        ['next_attempt_at'],
+        sqlite_where=sa.text('sent_at IS NULL'),
+        postgresql_where=sa.text('sent_at IS NULL'),
+    )
+    op.drop_column('alert_outbox', 'dead_at')
@@ -1,11 +1,52 @@
-from sqlalchemy import func
-from app.models import Transaction, User, Wallet
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func, or_, select
+from app.crud import HISTORY_COLUMNS, fetch_page, keyset_before
+from app.models import FlagReasonCount, Transaction, User, Wallet
 
-def get_flagged_transactions(db):
-    return db.query(Transaction).filter(Transaction.flagged == True).all()
+def has_reason(column, reason: str):
+    """`column` (a ", "-joined flag_reason) lists exactly `reason`, not just text containing it."""
+    return or_(
+        column == reason,
+        column.startswith(reason + ", ", autoescape=True),
+        column.endswith(", " + reason, autoescape=True),
+        column.contains(", " + reason + ", ", autoescape=True),
+    )
+
+def flagged_query(
+    cursor: Optional[str] = None, reason: Optional[str] = None, wallet_id: Optional[int] = None,
+    since: Optional[datetime] = None, until: Optional[datetime] = None,
+):
+    """Newest-first flagged, non-deleted transactions (served by the partial flagged-queue index)."""
+    stmt = select(*HISTORY_COLUMNS, Transaction.wallet_id).where(Transaction.flagged == True, Transaction.deleted == False)
+    if reason is not None:
+        stmt = stmt.where(has_reason(Transaction.flag_reason, reason))
+    if wallet_id is not None:
+        stmt = stmt.where(Transaction.wallet_id == wallet_id)
+    if since is not None:
+        stmt = stmt.where(Transaction.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(Transaction.timestamp < until)
+    if cursor is not None:
+        stmt = stmt.where(keyset_before(cursor))
+    return stmt.order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+
+def get_flagged_transactions(db, limit=100, cursor=None, reason=None, wallet_id=None, since=None, until=None):
+    if reason is not None and not db.scalar(select(FlagReasonCount.count).where(FlagReasonCount.reason == reason)):
+        return [], None  # no flagged transaction has this reason; don't walk the queue looking
+    return fetch_page(db, flagged_query(cursor, reason, wallet_id, since, until), limit)
 
 def get_total_balances(db):
     return db.query(func.sum(Wallet.balance)).scalar()
 
+# The user fields /admin/top-users returns, read as plain columns (never the password hash).
+USER_COLUMNS = (User.id, User.username, User.is_active, User.is_admin, User.deleted)
+
 def get_top_users(db, limit=10):
-    return db.query(User).join(Wallet).order_by(Wallet.balance.desc()).limit(limit).all()
+    """Owners of the largest wallets of active users, read down the wallets.balance index."""
+    rows = db.execute(
+        select(*USER_COLUMNS).join(Wallet, Wallet.user_id == User.id)
+        .where(User.is_active == True, User.deleted == False)
+        .order_by(Wallet.balance.desc()).limit(limit)
+    ).all()
+    return [row._asdict() for row in rows]
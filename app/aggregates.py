@@ -0,0 +1,71 @@
+from collections import defaultdict
+from typing import Dict
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import BALANCE_TOTAL_SHARDS
+from app.models import BalanceTotal, User, Wallet
+
+# Running total of the balances of active, non-deleted users, kept in the
+# database so every worker reads the same number. Writers stage balance deltas
+# on their session; they are added to `balance_totals` just before it commits,
+# in the same transaction as the balance change. The total is spread over
+# BALANCE_TOTAL_SHARDS rows (by wallet id) so concurrent writes rarely wait on
+# the same row; only the sum of all rows means anything.
+
+def stage(db: Session, wallet_id: int, delta: int) -> None:
+    """Record a balance change to add to the total when `db` commits (dropped on rollback)."""
+    if delta:
+        db.info.setdefault("balance_deltas", []).append((wallet_id, delta))
+
+def _add(db: Session, shard: int, delta: int) -> None:
+    stmt = update(BalanceTotal).where(BalanceTotal.shard == shard).values(total=BalanceTotal.total + delta)
+    if db.execute(stmt).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(BalanceTotal).values(shard=shard, total=delta))
+    except IntegrityError:
+        # Another writer created the shard first.
+        db.execute(stmt)
+
+def remove_user(db: Session, user: User) -> None:
+    """Take an active user's wallets out of the total; call before marking them deleted or inactive."""
+    if user.deleted or not user.is_active:
+        return
+    # Lock the wallets so a concurrent balance change lands before or after this, not in between.
+    balances = db.execute(
+        select(Wallet.id, Wallet.balance).where(Wallet.user_id == user.id).order_by(Wallet.id).with_for_update()
+    ).all()
+    for wallet_id, balance in balances:
+        if balance:
+            _add(db, wallet_id % BALANCE_TOTAL_SHARDS, -balance)
+
+def total_balance(db: Session) -> int:
+    """Sum of the balances of active, non-deleted users, in minor units."""
+    return db.scalar(select(func.sum(BalanceTotal.total))) or 0
+
+@event.listens_for(Session, "before_commit")
+def _write_staged(session: Session) -> None:
+    if session.in_nested_transaction() or not session.info.get("balance_deltas"):
+        return
+    staged = session.info.pop("balance_deltas")
+    # Only wallets of users who are still active count; a deletion committed
+    # after this request loaded its user is seen here, under the wallet lock.
+    active = set(session.scalars(
+        select(Wallet.id).join(User, Wallet.user_id == User.id)
+        .where(Wallet.id.in_({wallet_id for wallet_id, _ in staged}), User.is_active == True, User.deleted == False)
+    ))
+    by_shard: Dict[int, int] = defaultdict(int)
+    for wallet_id, delta in staged:
+        if wallet_id in active:
+            by_shard[wallet_id % BALANCE_TOTAL_SHARDS] += delta
+    # Shards in a fixed order so two commits cannot deadlock on them.
+    for shard in sorted(by_shard):
+        if by_shard[shard]:
+            _add(session, shard, by_shard[shard])
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_staged(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop("balance_deltas", None)
@@ -0,0 +1,125 @@
+"""Transactional alert outbox.
+
+Request handlers only insert `AlertOutbox` rows in the same commit as the
+flagged transaction. A new row is held for ALERT_COLLAPSE_SECONDS so that
+later alerts for the same wallet can join it. `dispatch_alerts` runs in the
+scheduler: it takes due rows in batches, together with the held rows created
+within the window of a due one, sends one message per wallet and window,
+and retries failures with exponential backoff. After ALERT_MAX_ATTEMPTS
+failures a row is dead-lettered (`dead_at`) and no longer retried.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, List
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.config import (
+    ALERT_BATCH_SIZE, ALERT_COLLAPSE_SECONDS, ALERT_MAX_ATTEMPTS,
+    ALERT_RETRY_BASE_SECONDS, ALERT_RETRY_MAX_SECONDS,
+)
+from app.models import AlertOutbox
+from app.utils import send_email_alert
+
+ADMIN_EMAIL = "admin@example.com"
+FLAGGED_SUBJECT = "Suspicious Transaction Detected"
+
+def enqueue_alert(db: Session, wallet_id: int, message: str, subject: str = FLAGGED_SUBJECT, to_email: str = ADMIN_EMAIL) -> None:
+    """Queue an alert; it is only delivered if the caller's transaction commits."""
+    now = datetime.utcnow()
+    due = now + timedelta(seconds=ALERT_COLLAPSE_SECONDS)
+    db.add(AlertOutbox(wallet_id=wallet_id, to_email=to_email, subject=subject, message=message, created_at=now, next_attempt_at=due))
+
+class FakeSink:
+    """In-memory sink for local runs, benchmarks and tests; fails the first `fail_times` sends."""
+    def __init__(self, fail_times: int = 0):
+        self.sent = []
+        self.fail_times = fail_times
+
+    def __call__(self, to_email, subject, message):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("fake sink failure")
+        self.sent.append((to_email, subject, message))
+
+PENDING = (AlertOutbox.sent_at.is_(None), AlertOutbox.dead_at.is_(None))
+
+def _collapse(rows: List[AlertOutbox]) -> List[List[AlertOutbox]]:
+    """Group rows per wallet/recipient/subject into runs spanning at most the collapse window."""
+    window = timedelta(seconds=ALERT_COLLAPSE_SECONDS)
+    key = lambda r: (r.wallet_id or 0, r.to_email, r.subject)
+    groups = []
+    for row in sorted(rows, key=lambda r: (key(r), r.created_at, r.id)):
+        if groups and key(groups[-1][0]) == key(row) and row.created_at - groups[-1][0].created_at <= window:
+            groups[-1].append(row)
+        else:
+            groups.append([row])
+    return groups
+
+def _message(group: List[AlertOutbox]) -> str:
+    if len(group) == 1:
+        return group[0].message
+    return f"{len(group)} alerts for wallet {group[0].wallet_id}:\n" + "\n".join(r.message for r in group)
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(ALERT_RETRY_BASE_SECONDS * 2 ** (attempts - 1), ALERT_RETRY_MAX_SECONDS))
+
+def _held(db: Session, due: List[AlertOutbox], now: datetime) -> List[AlertOutbox]:
+    """Not-yet-due rows of the same wallets that may fall inside a due row's window."""
+    wallet_ids = {r.wallet_id for r in due if r.wallet_id is not None}
+    if not wallet_ids:
+        return []
+    latest = max(r.created_at for r in due) + timedelta(seconds=ALERT_COLLAPSE_SECONDS)
+    return db.scalars(
+        select(AlertOutbox)
+        .where(*PENDING, AlertOutbox.next_attempt_at > now)
+        .where(AlertOutbox.wallet_id.in_(wallet_ids), AlertOutbox.created_at <= latest)
+    ).all()
+
+def _give_up(rows: List[AlertOutbox], now: datetime) -> None:
+    for row in rows:
+        row.dead_at = now
+    print(f"[ALERTS] giving up on {len(rows)} alert(s) after {ALERT_MAX_ATTEMPTS} attempts: ids {[r.id for r in rows]}")
+
+def dispatch_alerts(db: Session, sink: Callable = send_email_alert, batch_size: int = ALERT_BATCH_SIZE) -> dict:
+    """Deliver due alerts batch by batch until none are left; returns counts."""
+    sent = failed = messages = dead = 0
+    while True:
+        now = datetime.utcnow()
+        due = db.scalars(
+            select(AlertOutbox)
+            .where(*PENDING, AlertOutbox.next_attempt_at <= now)
+            .order_by(AlertOutbox.next_attempt_at, AlertOutbox.id)
+            .limit(batch_size)
+        ).all()
+        if not due:
+            break
+        # Rows left over from a higher ALERT_MAX_ATTEMPTS are dead-lettered, not retried.
+        spent = [r for r in due if r.attempts >= ALERT_MAX_ATTEMPTS]
+        if spent:
+            _give_up(spent, now)
+            dead += len(spent)
+        rows = [r for r in due if r.attempts < ALERT_MAX_ATTEMPTS]
+        for group in _collapse(rows + _held(db, rows, now)):
+            if all(r.next_attempt_at > now for r in group):
+                continue  # still collecting; sent when its first row is due
+            ids = [r.id for r in group]
+            try:
+                sink(group[0].to_email, group[0].subject, _message(group))
+            except Exception:
+                # Held rows only rode along; they keep their own attempts and due time.
+                tried = [r for r in group if r.next_attempt_at <= now]
+                for row in tried:
+                    row.attempts += 1
+                    row.next_attempt_at = now + _backoff(row.attempts)
+                failed += len(tried)
+                spent = [r for r in tried if r.attempts >= ALERT_MAX_ATTEMPTS]
+                if spent:
+                    _give_up(spent, now)
+                    dead += len(spent)
+            else:
+                db.execute(update(AlertOutbox).where(AlertOutbox.id.in_(ids)).values(sent_at=now))
+                sent += len(group)
+                messages += 1
+        db.commit()
+        if len(due) < batch_size:
+            break
+    return {"sent": sent, "failed": failed, "messages": messages, "dead": dead}
@@ -0,0 +1,274 @@
+"""Moving cold transactions out of the hot `transactions` table.
+
+    python -m app.archive [--all] [--horizon-days N] [--batch-size N]
+
+Rows older than ARCHIVE_HORIZON_DAYS, and soft-deleted rows, are copied into
+monthly tables (transactions_archive_YYYYMM, catalogued in
+`transaction_archives`) and deleted from `transactions`, one short
+transaction per batch. Only rows that both the fraud report and the balance
+checkpoints have already read (id at or below their watermarks), and that no
+live Idempotency-Key points at, are moved.
+
+Archived rows still count towards a wallet's fraud aggregates
+(`archived_totals`), and wallet history pages continue into the archive
+tables (`archived_history`). The per-reason flag counters describe the hot
+review queue, so they drop archived flagged rows.
+"""
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Boolean, Column, case, DateTime, Index, Integer, MetaData, String, Table, delete, func, insert, select, tuple_
+from sqlalchemy.orm import Session
+from app.config import ARCHIVE_BATCH_SIZE, ARCHIVE_HORIZON_DAYS, ARCHIVE_MAX_BATCHES
+from app.flag_counts import add_flag_counts
+from app.models import IdempotencyKey, JobWatermark, Transaction, TransactionArchive
+
+# Archive tables are created on demand, outside the app's (and Alembic's) metadata.
+archive_metadata = MetaData()
+_tables_lock = threading.Lock()
+# Serializes scheduled runs inside one process.
+_running = threading.Lock()
+
+COLUMNS = ("id", "wallet_id", "type", "amount", "timestamp", "target_wallet_id", "flagged", "flag_reason", "deleted")
+EPOCH = datetime(1970, 1, 1)
+
+def month_of(ts: Optional[datetime]) -> str:
+    ts = ts or EPOCH
+    return f"{ts.year:04d}{ts.month:02d}"
+
+def archive_table(month: str) -> Table:
+    name = f"transactions_archive_{month}"
+    with _tables_lock:
+        table = archive_metadata.tables.get(name)
+        if table is None:
+            table = Table(
+                name, archive_metadata,
+                Column("id", Integer, primary_key=True),
+                Column("wallet_id", Integer),
+                Column("type", String),
+                Column("amount", Integer),
+                Column("timestamp", DateTime),
+                Column("target_wallet_id", Integer),
+                Column("flagged", Boolean),
+                Column("flag_reason", String),
+                Column("deleted", Boolean),
+                Index(f"ix_{name}_wallet_history", "wallet_id", "deleted", "timestamp", "id"),
+                Index(f"ix_{name}_target_wallet", "target_wallet_id", "id"),
+            )
+        return table
+
+def archives(db: Session) -> List[TransactionArchive]:
+    """Catalog entries, newest month first."""
+    return db.scalars(select(TransactionArchive).order_by(TransactionArchive.month.desc())).all()
+
+# --- Reading ---
+
+def archived_totals(db: Session, wallet_id: int) -> Tuple[int, int]:
+    """(count, sum of amounts) of a wallet's archived, non-deleted transactions."""
+    count = total = 0
+    for entry in archives(db):
+        table = archive_table(entry.month)
+        c, s = db.execute(
+            select(func.count(), func.sum(table.c.amount)).where(table.c.wallet_id == wallet_id, table.c.deleted == False)
+        ).one()
+        count += c or 0
+        total += s or 0
+    return count, total
+
+def archived_wallet_totals(conn) -> Dict[int, Tuple[int, int]]:
+    """(count, sum) of archived, non-deleted transactions for every wallet."""
+    totals: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+    for (month,) in conn.execute(select(TransactionArchive.month)):
+        table = archive_table(month)
+        stmt = (
+            select(table.c.wallet_id, func.count(), func.sum(table.c.amount))
+            .where(table.c.deleted == False)
+            .group_by(table.c.wallet_id)
+        )
+        for wallet_id, count, total in conn.execute(stmt):
+            totals[wallet_id][0] += count
+            totals[wallet_id][1] += total or 0
+    return {wallet_id: (c, s) for wallet_id, (c, s) in totals.items()}
+
+def archived_deltas(
+    conn, wallet_id: Optional[int] = None, until: Optional[datetime] = None,
+    after_id: Optional[int] = None, since: Optional[datetime] = None,
+) -> Dict[int, int]:
+    """Net balance change per wallet from archived transactions (soft-deleted ones moved money too).
+
+    `after_id` keeps only rows with a larger id; `since` only skips months
+    that end before it, it does not filter rows.
+    """
+    deltas: Dict[int, int] = defaultdict(int)
+    for (month,) in conn.execute(select(TransactionArchive.month)):
+        if until is not None and month > month_of(until):
+            continue
+        if since is not None and month < month_of(since):
+            continue
+        t = archive_table(month)
+        signed = case((t.c.type == "deposit", t.c.amount), else_=-t.c.amount)
+        out = select(t.c.wallet_id, func.sum(signed)).group_by(t.c.wallet_id)
+        incoming = select(t.c.target_wallet_id, func.sum(t.c.amount)).where(t.c.type == "transfer").group_by(t.c.target_wallet_id)
+        if wallet_id is not None:
+            out = out.where(t.c.wallet_id == wallet_id)
+            incoming = incoming.where(t.c.target_wallet_id == wallet_id)
+        else:
+            incoming = incoming.where(t.c.target_wallet_id.is_not(None))
+        if until is not None:
+            out = out.where(t.c.timestamp <= until)
+            incoming = incoming.where(t.c.timestamp <= until)
+        if after_id is not None:
+            out = out.where(t.c.id > after_id)
+            incoming = incoming.where(t.c.id > after_id)
+        for stmt in (out, incoming):
+            for wid, amount in conn.execute(stmt):
+                deltas[wid] += amount or 0
+    return dict(deltas)
+
+def archived_history(
+    db: Session, wallet_id: int, limit: int, before: Optional[Tuple[datetime, int]] = None,
+    since: Optional[datetime] = None, until: Optional[datetime] = None, floor: Optional[datetime] = None,
+) -> list:
+    """Up to `limit` newest-first archived history rows of a wallet, older than the `before` keyset.
+
+    Months whose newest row is older than `floor` are skipped, so a history
+    page that is already full from the hot table normally reads no archive.
+    """
+    rows = []
+    for entry in archives(db):
+        if entry.newest is None or (floor is not None and entry.newest < floor):
+            continue
+        if before is not None and entry.month > month_of(before[0]):
+            continue
+        if since is not None and entry.month < month_of(since):
+            break
+        t = archive_table(entry.month)
+        stmt = select(t.c.id, t.c.type, t.c.amount, t.c.timestamp, t.c.flagged, t.c.flag_reason).where(
+            t.c.wallet_id == wallet_id, t.c.deleted == False
+        )
+        if since is not None:
+            stmt = stmt.where(t.c.timestamp >= since)
+        if until is not None:
+            stmt = stmt.where(t.c.timestamp < until)
+        if before is not None:
+            stmt = stmt.where(tuple_(t.c.timestamp, t.c.id) < before)
+        rows.extend(db.execute(stmt.order_by(t.c.timestamp.desc(), t.c.id.desc()).limit(limit)).all())
+        if len(rows) >= limit:
+            break
+    return rows
+
+# --- Archiving ---
+
+def _boundary(db: Session, cutoff: datetime) -> int:
+    """First id whose row is not older than `cutoff`.
+
+    Ids grow with time, so this is a binary search over primary-key lookups
+    instead of a scan for an unindexed timestamp.
+    """
+    lo = db.scalar(select(func.min(Transaction.id)))
+    hi = db.scalar(select(func.max(Transaction.id)))
+    if lo is None:
+        return 0
+    hi += 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        row = db.execute(
+            select(Transaction.id, Transaction.timestamp).where(Transaction.id >= mid).order_by(Transaction.id).limit(1)
+        ).first()
+        if row is None or row.timestamp is None or row.timestamp >= cutoff:
+            hi = mid
+        else:
+            lo = row.id + 1
+    return lo
+
+def _candidates(db: Session, cutoff: datetime, boundary: int, last_reported: int, batch_size: int) -> list:
+    cols = [Transaction.__table__.c[name] for name in COLUMNS]
+    movable = (Transaction.id <= last_reported, ~Transaction.id.in_(select(IdempotencyKey.transaction_id)))
+    rows = db.execute(
+        select(*cols)
+        .where(Transaction.id < boundary, Transaction.timestamp < cutoff, *movable)
+        .order_by(Transaction.id).limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if len(rows) < batch_size:
+        seen = {row.id for row in rows}
+        deleted = db.execute(
+            select(*cols)
+            .where(Transaction.deleted == True, *movable)
+            .order_by(Transaction.id).limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        rows += [row for row in deleted if row.id not in seen][: batch_size - len(rows)]
+    return rows
+
+def _move(db: Session, rows) -> None:
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[month_of(row.timestamp)].append(row._asdict())
+    for month, batch in by_month.items():
+        table = archive_table(month)
+        entry = db.get(TransactionArchive, month)
+        if entry is None:
+            table.create(db.connection(), checkfirst=True)
+            entry = TransactionArchive(month=month, table_name=table.name, rows=0)
+            db.add(entry)
+        db.execute(insert(table), batch)
+        entry.rows += len(batch)
+        live = [r["timestamp"] for r in batch if not r["deleted"] and r["timestamp"] is not None]
+        if live and (entry.newest is None or max(live) > entry.newest):
+            entry.newest = max(live)
+        entry.updated_at = datetime.utcnow()
+    flagged = [row.flag_reason for row in rows if row.flagged and not row.deleted]
+    if flagged:
+        add_flag_counts(db, flagged, sign=-1)
+    db.execute(delete(Transaction).where(Transaction.id.in_([row.id for row in rows])))
+
+def archive_transactions(
+    db: Session, horizon_days: float = ARCHIVE_HORIZON_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+    max_batches: Optional[int] = ARCHIVE_MAX_BATCHES,
+) -> dict:
+    """Move old and soft-deleted transactions to the archive tables, one commit per batch."""
+    cutoff = datetime.utcnow() - timedelta(days=horizon_days)
+    marks = [db.get(JobWatermark, name) for name in ("fraud_report", "balance_checkpoint")]
+    last_reported = min(mark.last_id if mark is not None else 0 for mark in marks)
+    boundary = _boundary(db, cutoff)
+    db.commit()
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = _candidates(db, cutoff, boundary, last_reported, batch_size)
+        if not rows:
+            db.rollback()
+            break
+        _move(db, rows)
+        db.commit()
+        moved += len(rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+    return {"rows": moved, "batches": batches}
+
+def archive_job(db: Session) -> Optional[dict]:
+    """Scheduler entry point; skips the run if another one is still going in this process."""
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        return archive_transactions(db)
+    finally:
+        _running.release()
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Move old and soft-deleted transactions to monthly archive tables.")
+    parser.add_argument("--all", action="store_true", help="keep going until nothing is left, not just one run's worth")
+    parser.add_argument("--horizon-days", type=float, default=ARCHIVE_HORIZON_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        result = archive_transactions(db, args.horizon_days, args.batch_size, None if args.all else ARCHIVE_MAX_BATCHES)
+    print(f"archived {result['rows']} transactions in {result['batches']} batches")
+
+if __name__ == "__main__":
+    main()
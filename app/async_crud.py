@@ -0,0 +1,53 @@
+"""Async counterparts of app.crud.
+
+Each operation runs the sync implementation through `AsyncSession.run_sync`,
+so the business rules live in one place while the I/O goes through the async
+driver and never blocks the event loop. Writes that crud retries on a
+conflict are retried here instead, with the backoff awaited, since a sleep
+inside `run_sync` would stall the event loop.
+"""
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from app import crud
+from app.config import WRITE_RETRY_ATTEMPTS
+from app.auth import get_user
+from app.models import User, Transaction
+
+async def _retrying(db: AsyncSession, write, *args):
+    """Run a @_retry_on_conflict crud write once per attempt, backing off with asyncio.sleep."""
+    for attempt in range(WRITE_RETRY_ATTEMPTS):
+        try:
+            return await db.run_sync(write.__wrapped__, *args)
+        except crud.RETRYABLE:
+            await db.rollback()
+            if attempt < WRITE_RETRY_ATTEMPTS - 1:
+                await asyncio.sleep(crud.retry_delay(attempt))
+    raise crud.busy_error()
+
+async def get_user_by_username(db: AsyncSession, username: str) -> User | None:
+    return await db.run_sync(get_user, username)
+
+async def create_user(db: AsyncSession, username: str, hashed_password: str) -> User:
+    return await db.run_sync(crud.create_user, username, hashed_password)
+
+async def deposit(db: AsyncSession, user: User, amount: int) -> Transaction:
+    return await _retrying(db, crud.deposit, user, amount)
+
+async def withdraw(db: AsyncSession, user: User, amount: int) -> Transaction:
+    return await _retrying(db, crud.withdraw, user, amount)
+
+async def transfer(db: AsyncSession, sender: User, recipient: User, amount: int) -> Transaction:
+    return await _retrying(db, crud.transfer, sender, recipient, amount)
+
+async def apply_batch(db: AsyncSession, user: User, items) -> List[dict]:
+    return await _retrying(db, crud.apply_batch, user, items)
+
+async def get_transaction_history(db: AsyncSession, user: User) -> List[Transaction]:
+    return await db.run_sync(crud.get_transaction_history, user)
+
+async def soft_delete_user(db: AsyncSession, user_id: int) -> None:
+    await db.run_sync(crud.soft_delete_user, user_id)
+
+async def soft_delete_transaction(db: AsyncSession, txn_id: int) -> None:
+    await db.run_sync(crud.soft_delete_transaction, txn_id)
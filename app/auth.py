@@ -3,19 +3,39 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session, selectinload
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from app.cache import TTLCache
+from app.config import BCRYPT_ROUNDS, AUTH_TOKEN_CACHE_SIZE, AUTH_PRINCIPAL_CACHE_SIZE, AUTH_PRINCIPAL_CACHE_TTL_SECONDS
 from app.models import User
-from app.database import get_db
+from app.database import get_db, get_async_db, read_sessionmaker, read_sessionmaker_async
 
 # Load SECRET_KEY securely from environment variables
 SECRET_KEY = os.getenv("SECRET_KEY", "default_fallback_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/user/login")
 
+@dataclass(frozen=True)
+class Principal:
+    """What request handlers need to know about the caller, without a DB round trip."""
+    user_id: int
+    username: str
+    wallet_id: int | None
+    is_admin: bool
+
+# token -> (username, exp) for tokens that already passed signature verification
+token_cache = TTLCache(AUTH_TOKEN_CACHE_SIZE)
+# username -> Principal; never outlives the token that loaded it. ORM changes to
+# is_admin/is_active drop it on commit; changes made outside the app (raw SQL)
+# show up within AUTH_PRINCIPAL_CACHE_TTL_SECONDS.
+principal_cache = TTLCache(AUTH_PRINCIPAL_CACHE_SIZE, ttl=AUTH_PRINCIPAL_CACHE_TTL_SECONDS)
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -37,7 +57,11 @@ def authenticate_user(db: Session, username: str, password: str) -> User | None:
         return None
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def decode_token(token: str) -> tuple[str, float]:
+    """Verify a JWT and return (username, exp), using the token cache when possible."""
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub", "")
@@ -45,9 +69,104 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token: username missing")
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token: decoding failed")
+    claims = (username, float(payload.get("exp", 0)))
+    token_cache.set(token, claims, expires_at=claims[1])
+    return claims
 
-    user = get_user(db, username)
+def _remember_principal(user: User, expires_at: float) -> Principal:
+    principal = Principal(
+        user_id=user.id,
+        username=user.username,
+        wallet_id=user.wallet.id if user.wallet else None,
+        is_admin=bool(user.is_admin),
+    )
+    # A wallet may still be created by hand; keep looking until there is one.
+    if principal.wallet_id is not None:
+        principal_cache.set(user.username, principal, expires_at=expires_at)
+    return principal
+
+def invalidate_user(username: str) -> None:
+    """Forget cached tokens and principal for a user, e.g. after a soft delete."""
+    principal_cache.pop(username)
+    token_cache.discard_where(lambda claims: claims[0] == username)
+
+@event.listens_for(User.is_admin, "set")
+@event.listens_for(User.is_active, "set")
+def _access_changed(user: User, value, oldvalue, initiator) -> None:
+    """Forget a user's cached principal once a change to their admin flag or active status commits."""
+    if value == oldvalue or inspect(user).key is None:
+        return  # unchanged, or a new user with nothing cached yet
+    session = object_session(user)
+    if session is None:
+        invalidate_user(user.username)
+    else:
+        session.info.setdefault("changed_users", set()).add(user.username)
+
+@event.listens_for(Session, "after_commit")
+def _forget_changed(session: Session) -> None:
+    for username in session.info.pop("changed_users", ()):
+        invalidate_user(username)
+
+def auth_cache_stats() -> dict:
+    return {"tokens": token_cache.stats(), "principals": principal_cache.stats()}
+
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    username, expires_at = decode_token(token)
+    principal = principal_cache.get(username)
+    if principal is None:
+        user = get_user(db, username)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        principal = _remember_principal(user, expires_at)
+    # Writes committed on this request's session are attributed to the caller (read-your-writes).
+    db.info["user_id"] = principal.user_id
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    principal = get_current_principal(token, db)
+    # Identity-map hit when the principal was just loaded; a primary-key lookup otherwise.
+    user = db.get(User, principal.user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
     return user
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> User:
+    username, expires_at = decode_token(token)
+    principal = principal_cache.get(username)
+    # Eager-load the wallet: lazy loads are not allowed outside run_sync.
+    query = select(User).options(selectinload(User.wallet))
+    query = query.where(User.id == principal.user_id) if principal else query.where(User.username == username)
+    user = (await db.execute(query)).scalars().first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    if principal is None:
+        _remember_principal(user, expires_at)
+    db.info["user_id"] = user.id
+
+    return user
+
+async def get_current_principal_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    username, expires_at = decode_token(token)
+    principal = principal_cache.get(username)
+    if principal is None:
+        query = select(User).options(selectinload(User.wallet)).where(User.username == username)
+        user = (await db.execute(query)).scalars().first()
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        principal = _remember_principal(user, expires_at)
+    db.info["user_id"] = principal.user_id
+    return principal
+
+# Reads that may come from the replica, except right after the caller's own writes.
+
+def get_user_read_db(principal: Principal = Depends(get_current_principal)):
+    db = read_sessionmaker(principal.user_id)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_user_read_db_async(principal: Principal = Depends(get_current_principal_async)):
+    async with (await read_sessionmaker_async(principal.user_id))() as db:
+        yield db
@@ -0,0 +1,266 @@
+"""Periodic per-wallet balance checkpoints, point-in-time balances and reconciliation.
+
+    python -m app.checkpoints [--catch-up] [--reconcile] [--workers N]
+
+A run reads transactions past its watermark in primary-key batches, like the
+fraud report, nets them per wallet (deposits in, withdrawals out, transfers
+out of `wallet_id` and into `target_wallet_id`; soft-deleted rows moved money
+too, so they count) and writes one checkpoint for every wallet it touched:
+the previous checkpoint plus the net change. The checkpoints and the new
+watermark are written in a single commit.
+
+`balance_at` finds the wallet's newest checkpoint at or before T and replays
+only the transactions after it, hot or archived. `reconcile` checks every wallet's stored
+balance against its latest checkpoint plus what happened since, one chunk of
+wallet ids per worker thread.
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.archive import archived_deltas
+from app.config import (
+    BALANCE_CHECKPOINT_BATCH_SIZE, BALANCE_CHECKPOINT_LAG_SECONDS, BALANCE_CHECKPOINT_MAX_BATCHES,
+    RECONCILE_CHUNK_SIZE, RECONCILE_WORKERS,
+)
+from app.models import BalanceCheckpoint, JobWatermark, Transaction, Wallet
+
+JOB_NAME = "balance_checkpoint"
+# Serializes the scheduled run and a startup catch-up inside one process.
+_running = threading.Lock()
+
+# Net effect of a transaction on the wallet in `wallet_id`.
+SIGNED_AMOUNT = case((Transaction.type == "deposit", Transaction.amount), else_=-Transaction.amount)
+
+def _watermark(db: Session) -> JobWatermark:
+    mark = db.get(JobWatermark, JOB_NAME)
+    if mark is None:
+        try:
+            with db.begin_nested():
+                mark = JobWatermark(name=JOB_NAME, last_id=0, updated_at=datetime.utcnow())
+                db.add(mark)
+        except IntegrityError:
+            mark = db.get(JobWatermark, JOB_NAME)
+    return mark
+
+def _latest_balances(conn, *where) -> Dict[int, int]:
+    """Balance of the newest checkpoint of each wallet matching `where`."""
+    latest = (
+        select(BalanceCheckpoint.wallet_id, func.max(BalanceCheckpoint.last_id).label("last_id"))
+        .where(*where)
+        .group_by(BalanceCheckpoint.wallet_id)
+        .subquery()
+    )
+    stmt = select(BalanceCheckpoint.wallet_id, BalanceCheckpoint.balance).join(
+        latest, and_(BalanceCheckpoint.wallet_id == latest.c.wallet_id, BalanceCheckpoint.last_id == latest.c.last_id)
+    )
+    return dict(conn.execute(stmt).all())
+
+def run_checkpoints(
+    db: Session, batch_size: int = BALANCE_CHECKPOINT_BATCH_SIZE, max_batches: Optional[int] = BALANCE_CHECKPOINT_MAX_BATCHES,
+) -> dict:
+    """Checkpoint every wallet with transactions past the watermark; returns rows read and wallets written."""
+    start_id = _watermark(db).last_id
+    cutoff = datetime.utcnow() - timedelta(seconds=BALANCE_CHECKPOINT_LAG_SECONDS)
+    deltas: Dict[int, int] = defaultdict(int)
+    last = None
+    after, batches, read = start_id, 0, 0
+    while max_batches is None or batches < max_batches:
+        rows = db.execute(
+            select(
+                Transaction.id, Transaction.wallet_id, Transaction.type, Transaction.amount,
+                Transaction.timestamp, Transaction.target_wallet_id,
+            )
+            .where(Transaction.id > after)
+            .order_by(Transaction.id)
+            .limit(batch_size)
+        ).all()
+        done = len(rows) < batch_size
+        for row in rows:
+            if row.timestamp is not None and row.timestamp >= cutoff:
+                done = True
+                break
+            if row.wallet_id is not None:
+                deltas[row.wallet_id] += row.amount if row.type == "deposit" else -row.amount
+            if row.type == "transfer" and row.target_wallet_id is not None:
+                deltas[row.target_wallet_id] += row.amount
+            last = row
+            read += 1
+        batches += 1
+        if done:
+            break
+        after = rows[-1].id
+    if last is None:
+        db.rollback()
+        return {"rows": 0, "wallets": 0}
+    if start_id == 0:
+        # First run: rows archived before checkpoints existed are only in the archive tables.
+        for wallet_id, delta in archived_deltas(db).items():
+            deltas[wallet_id] += delta
+
+    wallet_ids = list(deltas)
+    bases: Dict[int, int] = {}
+    for offset in range(0, len(wallet_ids), 500):
+        bases.update(_latest_balances(db, BalanceCheckpoint.wallet_id.in_(wallet_ids[offset: offset + 500])))
+    db.add_all(
+        BalanceCheckpoint(wallet_id=wallet_id, last_id=last.id, as_of=last.timestamp, balance=bases.get(wallet_id, 0) + delta)
+        for wallet_id, delta in deltas.items()
+    )
+    # Only advance from the mark this run started at; if another worker got there first, drop this run.
+    moved = db.execute(
+        update(JobWatermark)
+        .where(JobWatermark.name == JOB_NAME, JobWatermark.last_id == start_id)
+        .values(last_id=last.id, last_timestamp=last.timestamp, updated_at=datetime.utcnow())
+    ).rowcount
+    if not moved:
+        db.rollback()
+        return {"rows": 0, "wallets": 0}
+    db.commit()
+    return {"rows": read, "wallets": len(deltas)}
+
+def checkpoint_job(db: Session, catch_up: bool = False) -> Optional[dict]:
+    """Scheduler entry point; a catch-up run repeats until it reaches the newest transactions."""
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        total = {"rows": 0, "wallets": 0}
+        while True:
+            result = run_checkpoints(db)
+            total["rows"] += result["rows"]
+            total["wallets"] += result["wallets"]
+            if not catch_up or not result["rows"]:
+                return total
+    finally:
+        _running.release()
+
+# --- Reading ---
+
+def _tail(db: Session, wallet_id: int, after_id: int, until: datetime, since: Optional[datetime] = None) -> int:
+    """Net change from the wallet's transactions with id above `after_id` and timestamp up to `until`."""
+    out = select(func.sum(SIGNED_AMOUNT)).where(
+        Transaction.wallet_id == wallet_id,
+        Transaction.deleted.in_([False, True]),  # keeps the history index usable for the timestamp range
+        Transaction.timestamp <= until,
+        Transaction.id > after_id,
+    )
+    incoming = select(func.sum(Transaction.amount)).where(
+        Transaction.target_wallet_id == wallet_id,
+        Transaction.id > after_id,
+        Transaction.type == "transfer",
+        Transaction.timestamp <= until,
+    )
+    if since is not None:
+        out = out.where(Transaction.timestamp >= since)
+    return (db.scalar(out) or 0) + (db.scalar(incoming) or 0)
+
+def balance_at(db: Session, wallet_id: int, at: datetime) -> int:
+    """Balance of a wallet at time `at`, in minor units."""
+    checkpoint = db.scalars(
+        select(BalanceCheckpoint)
+        .where(BalanceCheckpoint.wallet_id == wallet_id, BalanceCheckpoint.as_of <= at)
+        .order_by(BalanceCheckpoint.as_of.desc(), BalanceCheckpoint.last_id.desc())
+        .limit(1)
+    ).first()
+    if checkpoint is None:
+        # Nothing to start from: replay everything, including archived transactions.
+        return archived_deltas(db, wallet_id, until=at).get(wallet_id, 0) + _tail(db, wallet_id, 0, at)
+    # Ids and timestamps only disagree by commit latency, which the lag bounds.
+    since = checkpoint.as_of - timedelta(seconds=BALANCE_CHECKPOINT_LAG_SECONDS)
+    # Rows after this checkpoint may have been archived since a newer one was written.
+    archived = archived_deltas(db, wallet_id, until=at, after_id=checkpoint.last_id, since=since).get(wallet_id, 0)
+    return checkpoint.balance + archived + _tail(db, wallet_id, checkpoint.last_id, at, since)
+
+def expected_balance(db: Session, wallet_id: int) -> int:
+    """What the wallet's balance should be now according to its checkpoints and transactions."""
+    return balance_at(db, wallet_id, datetime.max)
+
+# --- Reconciliation ---
+
+def _reconcile_chunk(engine, start: int, end: int, last_id: int) -> tuple:
+    in_chunk = lambda column: and_(column >= start, column < end)
+    with engine.connect() as conn:
+        balances = dict(conn.execute(select(Wallet.id, Wallet.balance).where(in_chunk(Wallet.id))).all())
+        expected = defaultdict(int, _latest_balances(conn, in_chunk(BalanceCheckpoint.wallet_id)))
+        if last_id == 0:
+            for wallet_id, delta in archived_deltas(conn).items():
+                if start <= wallet_id < end:
+                    expected[wallet_id] += delta
+        out = (
+            select(Transaction.wallet_id, func.sum(SIGNED_AMOUNT))
+            .where(Transaction.id > last_id, in_chunk(Transaction.wallet_id))
+            .group_by(Transaction.wallet_id)
+        )
+        incoming = (
+            select(Transaction.target_wallet_id, func.sum(Transaction.amount))
+            .where(Transaction.id > last_id, Transaction.type == "transfer", in_chunk(Transaction.target_wallet_id))
+            .group_by(Transaction.target_wallet_id)
+        )
+        for stmt in (out, incoming):
+            for wallet_id, delta in conn.execute(stmt):
+                expected[wallet_id] += delta or 0
+    mismatches = [
+        wallet_id for wallet_id, balance in balances.items() if (balance or 0) != expected[wallet_id]
+    ]
+    return len(balances), mismatches
+
+def reconcile(engine, chunk_size: int = RECONCILE_CHUNK_SIZE, workers: int = RECONCILE_WORKERS) -> dict:
+    """Compare every wallet's balance with its checkpoints plus later transactions.
+
+    Chunks of wallet ids are checked in parallel on `engine`, which may be
+    the read replica's. A wallet that disagrees is checked once more on its
+    own against the primary, so a transfer committed mid-scan (or not yet
+    replicated) is not reported; what still disagrees is returned with both
+    numbers.
+    """
+    from app.database import SessionLocal
+
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        mark = conn.execute(select(JobWatermark.last_id).where(JobWatermark.name == JOB_NAME)).scalar()
+        low, high = conn.execute(select(func.min(Wallet.id), func.max(Wallet.id))).one()
+    if low is None:
+        return {"wallets": 0, "mismatches": [], "seconds": 0.0}
+    starts = range(low, high + 1, chunk_size)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda start: _reconcile_chunk(engine, start, start + chunk_size, mark or 0), starts))
+
+    mismatches = []
+    with SessionLocal() as db:
+        for wallet_id in (w for _, chunk in results for w in chunk):
+            balance = db.scalar(select(Wallet.balance).where(Wallet.id == wallet_id)) or 0
+            expected = expected_balance(db, wallet_id)
+            if balance != expected:
+                mismatches.append({"wallet_id": wallet_id, "balance": balance, "expected": expected})
+    return {
+        "wallets": sum(n for n, _ in results),
+        "mismatches": mismatches,
+        "seconds": time.perf_counter() - started,
+    }
+
+def main():
+    from app.database import SessionLocal, read_engine
+
+    parser = argparse.ArgumentParser(description="Write balance checkpoints and reconcile wallet balances.")
+    parser.add_argument("--catch-up", action="store_true", help="keep going until the newest transactions are checkpointed")
+    parser.add_argument("--reconcile", action="store_true", help="check every wallet balance afterwards")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=RECONCILE_WORKERS)
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        result = checkpoint_job(db, catch_up=args.catch_up)
+    print(f"checkpointed {result['wallets']} wallets from {result['rows']} transactions")
+    if args.reconcile:
+        result = reconcile(read_engine, args.chunk_size, args.workers)
+        print(f"reconciled {result['wallets']} wallets in {result['seconds']:.2f}s, {len(result['mismatches'])} mismatches")
+        for m in result["mismatches"]:
+            print(f"  wallet {m['wallet_id']}: balance {m['balance']}, expected {m['expected']}")
+        raise SystemExit(1 if result["mismatches"] else 0)
+
+if __name__ == "__main__":
+    main()
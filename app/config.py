@@ -0,0 +1,173 @@
+import os
+
+# Database
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./wallet.db")
+# "sync" serves requests from the threadpool with SessionLocal; "async" mounts the
+# async routers backed by AsyncSession (aiosqlite locally, asyncpg on Postgres).
+DB_MODE = os.getenv("DB_MODE", "sync")
+
+def _async_url(url: str) -> str:
+    for sync_prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+# Engine profile (see app/database.py). "tuned" applies the settings below; "stock"
+# keeps SQLAlchemy/SQLite defaults, e.g. to compare against.
+DB_PROFILE = os.getenv("DB_PROFILE", "tuned")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are KiB, positive values are pages (SQLite convention)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Read replica (see app/database.py): admin, history and report reads use their own
+# engine. REPLICA_DATABASE_URL points it at a replica; left unset on SQLite it is a
+# second, read-only connection pool on the same (WAL-mode) file.
+REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "true").lower() in ("1", "true", "yes")
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL", "")
+ASYNC_REPLICA_DATABASE_URL = os.getenv("ASYNC_REPLICA_DATABASE_URL", _async_url(REPLICA_DATABASE_URL))
+# Reads go to the primary while the replica is further behind than this, and for this
+# long after the requesting user's own last write
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "1"))
+
+# Auth caches: decoded tokens (until their exp) and user principals
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+AUTH_PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+
+# Password hashing (bcrypt runs in a process pool, see app/hashing.py)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+# Hash/verify calls allowed to wait for a worker before new ones are rejected with 503
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "256"))
+# Re-hash on successful login when a stored hash uses a different cost than BCRYPT_ROUNDS
+BCRYPT_REHASH_ON_LOGIN = os.getenv("BCRYPT_REHASH_ON_LOGIN", "false").lower() in ("1", "true", "yes")
+
+# POST /transactions/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+
+# Wallet history pagination
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "1000"))
+
+# Admin total balance: rows the running total is spread over, to keep writers off one hot row
+BALANCE_TOTAL_SHARDS = int(os.getenv("BALANCE_TOTAL_SHARDS", "16"))
+
+# Alert outbox (see app/alerts.py)
+ALERT_DISPATCH_INTERVAL_SECONDS = float(os.getenv("ALERT_DISPATCH_INTERVAL_SECONDS", "5"))
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "500"))
+# Alerts for the same wallet created within this many seconds are sent as one message
+ALERT_COLLAPSE_SECONDS = float(os.getenv("ALERT_COLLAPSE_SECONDS", "60"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "8"))
+ALERT_RETRY_BASE_SECONDS = float(os.getenv("ALERT_RETRY_BASE_SECONDS", "5"))
+ALERT_RETRY_MAX_SECONDS = float(os.getenv("ALERT_RETRY_MAX_SECONDS", "3600"))
+
+# Incremental fraud report (see app/fraud_report.py)
+FRAUD_REPORT_INTERVAL_SECONDS = float(os.getenv("FRAUD_REPORT_INTERVAL_SECONDS", "60"))
+FRAUD_REPORT_BATCH_SIZE = int(os.getenv("FRAUD_REPORT_BATCH_SIZE", "1000"))
+# Batches per scheduled run; a catch-up run keeps going until the watermark reaches the end
+FRAUD_REPORT_MAX_BATCHES = int(os.getenv("FRAUD_REPORT_MAX_BATCHES", "10"))
+FRAUD_REPORT_PERIOD_MINUTES = int(os.getenv("FRAUD_REPORT_PERIOD_MINUTES", "60"))
+# Transactions younger than this are left for the next run, so rows still being committed are not skipped
+FRAUD_REPORT_LAG_SECONDS = float(os.getenv("FRAUD_REPORT_LAG_SECONDS", "5"))
+
+# Balance writes are re-run this many times on lock/serialization conflicts before a 503
+WRITE_RETRY_ATTEMPTS = int(os.getenv("WRITE_RETRY_ATTEMPTS", "5"))
+WRITE_RETRY_BACKOFF_SECONDS = float(os.getenv("WRITE_RETRY_BACKOFF_SECONDS", "0.01"))
+
+# Money is stored as integer minor units; this many minor units make one unit of currency
+CURRENCY_SCALE = int(os.getenv("CURRENCY_SCALE", "100"))
+# Largest amount accepted in one request, in minor units; capped to what a signed 64-bit column holds
+MAX_AMOUNT_MINOR = min(int(os.getenv("MAX_AMOUNT_MINOR", str(10**12))), 2**63 - 1)
+
+# Idempotency-Key on POST /deposit, /withdraw and /transfer
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# How long a duplicate waits for the in-flight request with the same key
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+# Rate limiting (see app/ratelimit.py): token buckets per user and route,
+# refilled at *_PER_MINUTE with room for *_BURST requests at once
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# "memory" limits each worker separately; "redis" shares buckets between workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", "60"))
+RATE_LIMIT_DEPOSIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_DEPOSIT_PER_MINUTE", "60"))
+RATE_LIMIT_DEPOSIT_BURST = int(os.getenv("RATE_LIMIT_DEPOSIT_BURST", "10"))
+RATE_LIMIT_WITHDRAW_PER_MINUTE = float(os.getenv("RATE_LIMIT_WITHDRAW_PER_MINUTE", "60"))
+RATE_LIMIT_WITHDRAW_BURST = int(os.getenv("RATE_LIMIT_WITHDRAW_BURST", "10"))
+RATE_LIMIT_TRANSFER_PER_MINUTE = float(os.getenv("RATE_LIMIT_TRANSFER_PER_MINUTE", "30"))
+RATE_LIMIT_TRANSFER_BURST = int(os.getenv("RATE_LIMIT_TRANSFER_BURST", "5"))
+RATE_LIMIT_LOGIN_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOGIN_PER_MINUTE", "10"))
+RATE_LIMIT_LOGIN_BURST = int(os.getenv("RATE_LIMIT_LOGIN_BURST", "5"))
+# Looser cap per account across all clients, against guessing spread over many addresses
+RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE", "60"))
+RATE_LIMIT_LOGIN_ACCOUNT_BURST = int(os.getenv("RATE_LIMIT_LOGIN_ACCOUNT_BURST", "30"))
+
+# Prometheus-text metrics at GET /metrics (see app/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Fraud rules (see app/fraud.py): optional JSON file overriding rule parameters,
+# re-read by every worker when it changes
+FRAUD_RULES_FILE = os.getenv("FRAUD_RULES_FILE", "")
+FRAUD_RULES_RELOAD_SECONDS = float(os.getenv("FRAUD_RULES_RELOAD_SECONDS", "5"))
+# Evaluations between re-ordering the rules by measured cost
+FRAUD_RULES_REORDER_EVERY = int(os.getenv("FRAUD_RULES_REORDER_EVERY", "1000"))
+
+# Transfer graph (see app/transfer_graph.py): recent transfers checked for rings,
+# fan-in/fan-out bursts and pass-through chains
+TRANSFER_GRAPH_WINDOW_MINUTES = float(os.getenv("TRANSFER_GRAPH_WINDOW_MINUTES", "60"))
+TRANSFER_GRAPH_BUCKET_SECONDS = float(os.getenv("TRANSFER_GRAPH_BUCKET_SECONDS", "60"))
+# Longest ring (in wallets) flagged when a transfer closes it
+TRANSFER_GRAPH_MAX_CYCLE_LENGTH = int(os.getenv("TRANSFER_GRAPH_MAX_CYCLE_LENGTH", "4"))
+# Distinct senders into (or recipients from) one wallet within the burst window
+TRANSFER_GRAPH_FAN_THRESHOLD = int(os.getenv("TRANSFER_GRAPH_FAN_THRESHOLD", "5"))
+TRANSFER_GRAPH_BURST_MINUTES = float(os.getenv("TRANSFER_GRAPH_BURST_MINUTES", "10"))
+# Hops of money forwarded within PASS_THROUGH_MINUTES of arriving, keeping at least RATIO of it
+TRANSFER_GRAPH_CHAIN_HOPS = int(os.getenv("TRANSFER_GRAPH_CHAIN_HOPS", "3"))
+TRANSFER_GRAPH_PASS_THROUGH_MINUTES = float(os.getenv("TRANSFER_GRAPH_PASS_THROUGH_MINUTES", "10"))
+TRANSFER_GRAPH_PASS_THROUGH_RATIO = float(os.getenv("TRANSFER_GRAPH_PASS_THROUGH_RATIO", "0.8"))
+# Upper bound on edges looked at per check, to keep per-transfer latency flat
+TRANSFER_GRAPH_MAX_VISITS = int(os.getenv("TRANSFER_GRAPH_MAX_VISITS", "500"))
+
+# Archival (see app/archive.py): transactions older than the horizon, and soft-deleted
+# ones, move to monthly archive tables in short batches
+ARCHIVE_HORIZON_DAYS = float(os.getenv("ARCHIVE_HORIZON_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+# Batches per scheduled run; the command line can run until nothing is left
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", "50"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+# Balance checkpoints (see app/checkpoints.py): per-wallet balance snapshots written
+# incrementally, for point-in-time balances and reconciliation
+BALANCE_CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("BALANCE_CHECKPOINT_INTERVAL_SECONDS", "3600"))
+BALANCE_CHECKPOINT_BATCH_SIZE = int(os.getenv("BALANCE_CHECKPOINT_BATCH_SIZE", "5000"))
+# Batches folded into one set of checkpoints
+BALANCE_CHECKPOINT_MAX_BATCHES = int(os.getenv("BALANCE_CHECKPOINT_MAX_BATCHES", "100"))
+# Transactions younger than this are left for the next run, so rows still being committed are not skipped
+BALANCE_CHECKPOINT_LAG_SECONDS = float(os.getenv("BALANCE_CHECKPOINT_LAG_SECONDS", "5"))
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "86400"))
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "1000"))
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", "4"))
+
+# Background jobs (see app/tasks.py): one worker holds a lease and runs them;
+# the others take over if it stops renewing for SCHEDULER_LEASE_SECONDS
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "30"))
+SCHEDULER_HEARTBEAT_SECONDS = float(os.getenv("SCHEDULER_HEARTBEAT_SECONDS", "10"))
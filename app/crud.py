@@ -1,9 +1,26 @@
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from app.models import User, Wallet, Transaction
-from app.fraud import advanced_fraud_check
-from app.utils import send_email_alert
-from typing import List
+from app.schemas import BatchItem
+from app.fraud import evaluate
+from app.fraud_state import get_fraud_state, record_transaction, forget_transaction
+from app.flag_counts import add_flag_counts
+from app.archive import archived_history
+from app import aggregates
+from app.transfer_graph import transfer_graph
+from app.auth import invalidate_user
+from app.alerts import enqueue_alert
+from app.money import to_major
+from app.config import WRITE_RETRY_ATTEMPTS, WRITE_RETRY_BACKOFF_SECONDS
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+import base64
+import functools
+import random
+import time
 
 def create_user(db: Session, username: str, hashed_password: str) -> User:
     """Create a new user and associated wallet."""
@@ -17,101 +34,346 @@ def create_user(db: Session, username: str, hashed_password: str) -> User:
     db.commit()
     return db_user
 
-def deposit(db: Session, user: User, amount: float) -> Transaction:
+class _BalanceConflict(Exception):
+    """A wallet's balance changed underneath a write that depended on it."""
+
+# Errors after which a write is rolled back and re-run from scratch.
+RETRYABLE = (OperationalError, _BalanceConflict)
+
+def retry_delay(attempt: int) -> float:
+    """Seconds to wait after failed attempt number `attempt` (from 0): exponential backoff with jitter."""
+    return WRITE_RETRY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+
+def busy_error() -> HTTPException:
+    return HTTPException(status_code=503, detail="Wallet is busy, try again", headers={"Retry-After": "1"})
+
+def _retry_on_conflict(fn):
+    """Re-run a write from scratch when the database reports a lock/serialization conflict.
+
+    The session is rolled back between attempts, so every attempt re-reads
+    current state. After WRITE_RETRY_ATTEMPTS the client gets a 503. The
+    backoff sleeps the calling thread; app.async_crud calls `fn.__wrapped__`
+    and awaits its own backoff instead.
+    """
+    @functools.wraps(fn)
+    def wrapper(db: Session, *args, **kwargs):
+        for attempt in range(WRITE_RETRY_ATTEMPTS):
+            try:
+                return fn(db, *args, **kwargs)
+            except RETRYABLE:
+                db.rollback()
+                if attempt < WRITE_RETRY_ATTEMPTS - 1:
+                    time.sleep(retry_delay(attempt))
+        raise busy_error()
+    return wrapper
+
+def _change_balance(db: Session, wallet: Wallet, delta: int, required: Optional[int] = None) -> bool:
+    """Atomically add `delta` to a wallet, only if its balance is at least `required`.
+
+    Returns False (and changes nothing) when the guard fails. The new balance is
+    copied onto `wallet` without another SELECT.
+    """
+    stmt = update(Wallet).where(Wallet.id == wallet.id)
+    if required is not None:
+        stmt = stmt.where(Wallet.balance >= required)
+    new_balance = db.execute(
+        stmt.values(balance=Wallet.balance + delta)
+        .returning(Wallet.balance)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if new_balance is None:
+        return False
+    set_committed_value(wallet, "balance", new_balance)
+    return True
+
+def _check_fraud(db: Session, wallet_id: int, amount: int, txn_type: str, now: datetime, graph_flags: List[str] = ()) -> List[str]:
+    """Score a new transaction against the wallet's running fraud state, then fold it in.
+
+    `graph_flags` are reasons from the transfer graph, appended after the rule engine's.
+    """
+    state = get_fraud_state(db, wallet_id)
+    verdict = evaluate(state, amount, txn_time=now, txn_type=txn_type)
+    if verdict.blocked:
+        db.rollback()
+        raise HTTPException(status_code=403, detail=f"Transaction blocked: {', '.join(verdict.flags)}")
+    record_transaction(state, amount, now)
+    flags = verdict.flags + list(graph_flags)
+    if flags:
+        add_flag_counts(db, [", ".join(flags)])
+    return flags
+
+@_retry_on_conflict
+def deposit(db: Session, user: User, amount: int) -> Transaction:
     """Deposit amount into user's wallet with fraud check and alert."""
     if not user.wallet:
         raise HTTPException(status_code=404, detail="Wallet not found for user")
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Invalid deposit amount")
-    user.wallet.balance += amount
-    transactions: List[Transaction] = db.query(Transaction).filter(
-        Transaction.wallet_id == user.wallet.id,
-        Transaction.deleted == False
-    ).all()
-    flags = advanced_fraud_check(transactions, amount, txn_type="deposit")
+    _change_balance(db, user.wallet, amount)
+    aggregates.stage(db, user.wallet.id, amount)
+    now = datetime.utcnow()
+    flags = _check_fraud(db, user.wallet.id, amount, "deposit", now)
     flagged = bool(flags)
     txn = Transaction(
         wallet_id=user.wallet.id,
         type="deposit",
         amount=amount,
+        timestamp=now,
         flagged=flagged,
         flag_reason=", ".join(flags) if flagged else None
     )
     db.add(txn)
-    db.commit()
-    db.refresh(txn)
     if flagged:
-        send_email_alert(
-            to_email="admin@example.com",
-            subject="Suspicious Transaction Detected",
-            message=f"User {user.username} made a flagged deposit of {amount}. Reason: {', '.join(flags)}"
+        enqueue_alert(
+            db, user.wallet.id,
+            message=f"User {user.username} made a flagged deposit of {to_major(amount)}. Reason: {', '.join(flags)}"
         )
+    db.commit()
+    db.refresh(txn)
     return txn
 
-def withdraw(db: Session, user: User, amount: float) -> Transaction:
+@_retry_on_conflict
+def withdraw(db: Session, user: User, amount: int) -> Transaction:
     """Withdraw amount from user's wallet with fraud check and alert."""
     if not user.wallet:
         raise HTTPException(status_code=404, detail="Wallet not found for user")
-    if amount <= 0 or user.wallet.balance < amount:
+    if amount <= 0 or not _change_balance(db, user.wallet, -amount, required=amount):
         raise HTTPException(status_code=400, detail="Insufficient funds or invalid amount")
-    user.wallet.balance -= amount
-    transactions: List[Transaction] = db.query(Transaction).filter(
-        Transaction.wallet_id == user.wallet.id,
-        Transaction.deleted == False
-    ).all()
-    flags = advanced_fraud_check(transactions, amount, txn_type="withdraw")
+    aggregates.stage(db, user.wallet.id, -amount)
+    now = datetime.utcnow()
+    flags = _check_fraud(db, user.wallet.id, amount, "withdraw", now)
     flagged = bool(flags)
     txn = Transaction(
         wallet_id=user.wallet.id,
         type="withdraw",
         amount=amount,
+        timestamp=now,
         flagged=flagged,
         flag_reason=", ".join(flags) if flagged else None
     )
     db.add(txn)
-    db.commit()
-    db.refresh(txn)
     if flagged:
-        send_email_alert(
-            to_email="admin@example.com",
-            subject="Suspicious Transaction Detected",
-            message=f"User {user.username} made a flagged withdrawal of {amount}. Reason: {', '.join(flags)}"
+        enqueue_alert(
+            db, user.wallet.id,
+            message=f"User {user.username} made a flagged withdrawal of {to_major(amount)}. Reason: {', '.join(flags)}"
         )
+    db.commit()
+    db.refresh(txn)
     return txn
 
-def transfer(db: Session, sender: User, recipient: User, amount: float) -> Transaction:
+@_retry_on_conflict
+def transfer(db: Session, sender: User, recipient: User, amount: int) -> Transaction:
     """Transfer amount from sender to recipient with fraud check and alert."""
     if not sender.wallet or not recipient.wallet:
         raise HTTPException(status_code=404, detail="Sender or recipient wallet not found")
-    if amount <= 0 or sender.wallet.balance < amount:
+    if amount <= 0:
         raise HTTPException(status_code=400, detail="Insufficient funds or invalid amount")
-    sender.wallet.balance -= amount
-    recipient.wallet.balance += amount
-    transactions: List[Transaction] = db.query(Transaction).filter(
-        Transaction.wallet_id == sender.wallet.id,
-        Transaction.deleted == False
-    ).all()
-    flags = advanced_fraud_check(transactions, amount, txn_type="transfer")
+    # Touch the wallets in id order so two opposite transfers cannot deadlock.
+    changes = [(sender.wallet, -amount, amount), (recipient.wallet, amount, None)]
+    for wallet, delta, required in sorted(changes, key=lambda change: change[0].id):
+        if not _change_balance(db, wallet, delta, required):
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Insufficient funds or invalid amount")
+    aggregates.stage(db, sender.wallet.id, -amount)
+    aggregates.stage(db, recipient.wallet.id, amount)
+    now = datetime.utcnow()
+    transfer_graph.ensure_built(db)
+    graph_flags = transfer_graph.check(sender.wallet.id, recipient.wallet.id, amount, now)
+    flags = _check_fraud(db, sender.wallet.id, amount, "transfer", now, graph_flags)
     flagged = bool(flags)
     txn = Transaction(
         wallet_id=sender.wallet.id,
         type="transfer",
         amount=amount,
+        timestamp=now,
         target_wallet_id=recipient.wallet.id,
         flagged=flagged,
         flag_reason=", ".join(flags) if flagged else None
     )
     db.add(txn)
-    db.commit()
-    db.refresh(txn)
+    transfer_graph.stage(db, sender.wallet.id, recipient.wallet.id, amount, now)
     if flagged:
-        send_email_alert(
-            to_email="admin@example.com",
-            subject="Suspicious Transaction Detected",
-            message=f"User {sender.username} made a flagged transfer of {amount} to {recipient.username}. Reason: {', '.join(flags)}"
+        enqueue_alert(
+            db, sender.wallet.id,
+            message=f"User {sender.username} made a flagged transfer of {to_major(amount)} to {recipient.username}. Reason: {', '.join(flags)}"
         )
+    db.commit()
+    db.refresh(txn)
     return txn
 
+@_retry_on_conflict
+def apply_batch(db: Session, user: User, items: List[BatchItem]) -> List[dict]:
+    """Apply many deposits/withdrawals/transfers from one wallet in a single DB transaction.
+
+    Items are validated in order against the running balance; an invalid item is
+    reported and skipped without affecting the others. Fraud checks run against
+    the wallet's fraud state loaded once for the whole batch, the valid items are
+    bulk-inserted, and everything is committed once.
+    """
+    if not user.wallet:
+        raise HTTPException(status_code=404, detail="Wallet not found for user")
+    wallet = user.wallet
+    names = {item.recipient_username for item in items if item.type == "transfer" and item.recipient_username}
+    recipients = {
+        u.username: u
+        for u in db.query(User).options(selectinload(User.wallet)).filter(User.username.in_(names))
+    } if names else {}
+
+    # Lock every wallet the batch touches in id order, as transfer() does, and
+    # before the fraud state (wallets first, then their fraud state).
+    involved = {wallet.id, *(u.wallet.id for u in recipients.values() if u.wallet)}
+    db.scalars(
+        select(Wallet).where(Wallet.id.in_(involved)).order_by(Wallet.id)
+        .with_for_update().execution_options(populate_existing=True)
+    ).all()
+    state = get_fraud_state(db, wallet.id)
+    balance = wallet.balance
+    # Net change per wallet, and how low the running balance dips below where it started.
+    deltas = {wallet.id: 0}
+    lowest = 0
+    results: List[dict] = []
+    rows: List[dict] = []
+    verbs = {"deposit": "deposit", "withdraw": "withdrawal", "transfer": "transfer"}
+    for index, item in enumerate(items):
+        amount = item.amount
+        recipient = recipients.get(item.recipient_username) if item.type == "transfer" else None
+        error = None
+        if item.type not in ("deposit", "withdraw", "transfer"):
+            error = f"Unknown transaction type '{item.type}'"
+        elif item.type == "transfer" and (recipient is None or recipient.wallet is None):
+            error = "Recipient not found"
+        elif amount <= 0 or (item.type != "deposit" and balance < amount):
+            error = "Insufficient funds or invalid amount"
+        if error:
+            results.append({"index": index, "ok": False, "error": error})
+            continue
+        now = datetime.utcnow()
+        verdict = evaluate(state, amount, txn_time=now, txn_type=item.type)
+        if verdict.blocked:
+            results.append({"index": index, "ok": False, "error": f"Transaction blocked: {', '.join(verdict.flags)}"})
+            continue
+        flags = verdict.flags
+        if recipient is not None and recipient.wallet.id != wallet.id:
+            transfer_graph.ensure_built(db)
+            flags = flags + transfer_graph.check(wallet.id, recipient.wallet.id, amount, now, transfer_graph.staged(db))
+            transfer_graph.stage(db, wallet.id, recipient.wallet.id, amount, now)
+
+        delta = amount if item.type == "deposit" else -amount
+        balance += delta
+        deltas[wallet.id] += delta
+        lowest = min(lowest, deltas[wallet.id])
+        aggregates.stage(db, wallet.id, delta)
+        if recipient is not None and recipient.wallet.id != wallet.id:
+            deltas[recipient.wallet.id] = deltas.get(recipient.wallet.id, 0) + amount
+            aggregates.stage(db, recipient.wallet.id, amount)
+        elif recipient is not None:
+            balance += amount
+            deltas[wallet.id] += amount
+            aggregates.stage(db, wallet.id, amount)
+        record_transaction(state, amount, now)
+        rows.append({
+            "wallet_id": wallet.id,
+            "type": item.type,
+            "amount": amount,
+            "timestamp": now,
+            "target_wallet_id": recipient.wallet.id if recipient is not None else None,
+            "flagged": bool(flags),
+            "flag_reason": ", ".join(flags) if flags else None,
+        })
+        results.append({"index": index, "ok": True})
+        if flags:
+            target = f" to {recipient.username}" if recipient is not None else ""
+            enqueue_alert(
+                db, wallet.id,
+                message=f"User {user.username} made a flagged {verbs[item.type]} of {to_major(amount)}{target}. Reason: {', '.join(flags)}"
+            )
+
+    if rows:
+        # Items were validated against the balance read above. Applying the net
+        # change is safe as long as the wallet still covers the deepest dip; if a
+        # concurrent write took that away, start over.
+        wallets = {wallet.id: wallet, **{u.wallet.id: u.wallet for u in recipients.values() if u.wallet}}
+        for wallet_id in sorted(deltas):
+            required = -lowest if wallet_id == wallet.id else None
+            if not _change_balance(db, wallets[wallet_id], deltas[wallet_id], required):
+                raise _BalanceConflict()
+        add_flag_counts(db, [row["flag_reason"] for row in rows])
+        txns = db.scalars(insert(Transaction).returning(Transaction, sort_by_parameter_order=True), rows).all()
+        for result, txn in zip((r for r in results if r["ok"]), txns):
+            result["transaction"] = txn
+    db.commit()
+    return results
+
+HISTORY_COLUMNS = (
+    Transaction.id, Transaction.type, Transaction.amount,
+    Transaction.timestamp, Transaction.flagged, Transaction.flag_reason,
+)
+
+def encode_cursor(timestamp: datetime, txn_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{txn_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, txn_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(txn_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_before(cursor: str):
+    """WHERE clause selecting rows after `cursor` in newest-first (timestamp, id) order."""
+    return tuple_(Transaction.timestamp, Transaction.id) < decode_cursor(cursor)
+
+def history_query(wallet_id: int, cursor: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Newest-first, non-deleted transactions of a wallet, resumable from a keyset cursor.
+
+    Served by the (wallet_id, deleted, timestamp, id) index, so cost depends on
+    the page size rather than on how long the history is.
+    """
+    stmt = select(*HISTORY_COLUMNS).where(Transaction.wallet_id == wallet_id, Transaction.deleted == False)
+    if since is not None:
+        stmt = stmt.where(Transaction.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(Transaction.timestamp < until)
+    if cursor is not None:
+        stmt = stmt.where(keyset_before(cursor))
+    return stmt.order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+
+def get_transaction_page(
+    db: Session, wallet_id: int, limit: int, cursor: Optional[str] = None,
+    since: Optional[datetime] = None, until: Optional[datetime] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of history plus the cursor for the next page (None on the last page).
+
+    Continues into the archive tables once the hot rows run out; a page the
+    hot table fills on its own only costs a look at the archive catalog.
+    """
+    rows = db.execute(history_query(wallet_id, cursor, since, until).limit(limit + 1)).all()
+    floor = rows[limit].timestamp if len(rows) > limit else None
+    before = decode_cursor(cursor) if cursor is not None else None
+    older = archived_history(db, wallet_id, limit + 1, before, since, until, floor)
+    if older:
+        rows = sorted(rows + older, key=lambda row: (row.timestamp, row.id), reverse=True)
+    return _page(rows, limit)
+
+def fetch_page(db: Session, stmt, limit: int) -> Tuple[List[dict], Optional[str]]:
+    """Run a newest-first keyset query for `limit` rows and build the cursor that follows them."""
+    return _page(db.execute(stmt.limit(limit + 1)).all(), limit)
+
+def _page(rows, limit: int) -> Tuple[List[dict], Optional[str]]:
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    return [row._asdict() for row in rows[:limit]], next_cursor
+
+def iter_transaction_history(
+    db: Session, wallet_id: int, cursor: Optional[str] = None, since: Optional[datetime] = None,
+    until: Optional[datetime] = None, batch_size: int = 500,
+) -> Iterator[dict]:
+    """Yield a wallet's whole history (hot and archived) page by page, without materializing it."""
+    while True:
+        rows, cursor = get_transaction_page(db, wallet_id, batch_size, cursor, since, until)
+        yield from rows
+        if cursor is None:
+            return
+
 def get_transaction_history(db: Session, user: User) -> List[Transaction]:
     """Get non-deleted transaction history for a user."""
     return db.query(Transaction).filter(
@@ -124,13 +386,22 @@ def soft_delete_user(db: Session, user_id: int) -> None:
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    aggregates.remove_user(db, user)
     user.deleted = True  # type: ignore
     db.commit()
+    invalidate_user(user.username)
 
 def soft_delete_transaction(db: Session, txn_id: int) -> None:
     """Soft delete a transaction by setting deleted flag."""
     txn = db.query(Transaction).filter(Transaction.id == txn_id).first()
     if not txn:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    was_deleted = txn.deleted
+    if not txn.deleted:
+        forget_transaction(db, txn)
+        if txn.flagged:
+            add_flag_counts(db, [txn.flag_reason], sign=-1)
     txn.deleted = True  # type: ignore
     db.commit()
+    if not was_deleted and txn.type == "transfer" and txn.target_wallet_id is not None:
+        transfer_graph.transfer_removed(txn.wallet_id, txn.target_wallet_id, txn.amount, txn.timestamp)
@@ -1,17 +1,217 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+from typing import Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from app import config
+from app.cache import TTLCache
+from app.config import (
+    DATABASE_URL, ASYNC_DATABASE_URL, DB_MODE, DB_PROFILE, REPLICA_ENABLED, REPLICA_DATABASE_URL,
+    ASYNC_REPLICA_DATABASE_URL, REPLICA_MAX_LAG_SECONDS, REPLICA_LAG_CHECK_SECONDS,
+)
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./wallet.db"
+SQLALCHEMY_DATABASE_URL = DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _is_memory(url: str) -> bool:
+    return _is_sqlite(url) and (url.rstrip("/").endswith(":memory:") or url.rstrip("/").endswith("sqlite:"))
+
+def engine_options(url: str, profile: str = DB_PROFILE) -> dict:
+    """Keyword arguments for create_engine/create_async_engine under the configured profile."""
+    options = {}
+    if _is_sqlite(url) and not url.startswith("sqlite+aiosqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    if profile != "tuned" or _is_memory(url):
+        return options
+    options.update(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+    if not _is_sqlite(url):
+        # Server databases drop idle connections; SQLite files do not.
+        options.update(pool_pre_ping=config.DB_POOL_PRE_PING, pool_recycle=config.DB_POOL_RECYCLE)
+    return options
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(config.SQLITE_CACHE_SIZE)}")
+    cursor.close()
+
+def configure_engine(engine: Engine, profile: str = DB_PROFILE) -> Engine:
+    """Install the per-connection SQLite PRAGMAs on a (sync) engine under the tuned profile."""
+    if profile == "tuned" and engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
+def describe_engine(engine: Engine) -> dict:
+    """Effective settings as the database reports them, for the startup self-check."""
+    info = {"url": engine.url.render_as_string(hide_password=True), "profile": DB_PROFILE, "pool": engine.pool.status()}
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size"):
+                info[pragma] = conn.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+        if DB_PROFILE == "tuned" and str(info["journal_mode"]).lower() != config.SQLITE_JOURNAL_MODE.lower():
+            # e.g. in-memory databases, or a file system without shared-memory support for WAL
+            info["warning"] = f"journal_mode is {info['journal_mode']}, expected {config.SQLITE_JOURNAL_MODE}"
+    return info
+
+engine = configure_engine(create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# The async engine is only built in async mode so the async driver stays optional.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL)) if DB_MODE == "async" else None
+if async_engine is not None:
+    configure_engine(async_engine.sync_engine)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    if async_engine is not None else None
+)
+
+# --- Read replica ---
+# Admin, history and report reads go to `read_engine` when it is within
+# REPLICA_MAX_LAG_SECONDS of the primary; money-moving writes never touch it.
+
+def replica_url(primary_url: str, url: str) -> Optional[str]:
+    """What the read engine connects to, or None when reads stay on the primary."""
+    if not REPLICA_ENABLED:
+        return None
+    if url:
+        return url
+    if _is_sqlite(primary_url) and not _is_memory(primary_url):
+        return primary_url
+    return None
+
+def _query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def configure_replica(engine: Engine) -> Engine:
+    configure_engine(engine)
+    if engine.dialect.name == "sqlite":
+        # Read-only connections on the same file; in WAL mode they never wait for the writers.
+        event.listen(engine, "connect", _query_only)
+    return engine
+
+_read_url = replica_url(SQLALCHEMY_DATABASE_URL, REPLICA_DATABASE_URL)
+read_engine = configure_replica(create_engine(_read_url, **engine_options(_read_url))) if _read_url else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+_async_read_url = replica_url(ASYNC_DATABASE_URL, ASYNC_REPLICA_DATABASE_URL) if async_engine is not None else None
+async_read_engine = (
+    create_async_engine(_async_read_url, **engine_options(_async_read_url)) if _async_read_url else async_engine
+)
+if async_read_engine is not None and async_read_engine is not async_engine:
+    configure_replica(async_read_engine.sync_engine)
+AsyncReadSessionLocal = (
+    async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    if async_read_engine is not None else None
+)
+
+# Only PostgreSQL replicas report lag; a same-file SQLite pool has none.
+PG_REPLICA_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+_lag = {"checked": float("-inf"), "seconds": 0.0}
+
+def _measure_lag(conn) -> float:
+    return float(conn.execute(PG_REPLICA_LAG).scalar() or 0)
+
+def _lag_failed(exc: Exception) -> float:
+    print(f"[REPLICA] lag check failed, reading from the primary: {getattr(exc, 'orig', exc)}")
+    return float("inf")
+
+def replica_lag() -> float:
+    """Seconds the replica is behind, re-measured at most every REPLICA_LAG_CHECK_SECONDS."""
+    now = time.monotonic()
+    if read_engine.dialect.name == "postgresql" and now - _lag["checked"] >= REPLICA_LAG_CHECK_SECONDS:
+        try:
+            with read_engine.connect() as conn:
+                seconds = _measure_lag(conn)
+        except SQLAlchemyError as exc:
+            seconds = _lag_failed(exc)
+        _lag.update(checked=now, seconds=seconds)
+    return _lag["seconds"]
+
+async def replica_lag_async() -> float:
+    now = time.monotonic()
+    if async_read_engine.dialect.name == "postgresql" and now - _lag["checked"] >= REPLICA_LAG_CHECK_SECONDS:
+        try:
+            async with async_read_engine.connect() as conn:
+                seconds = await conn.run_sync(_measure_lag)
+        except SQLAlchemyError as exc:
+            seconds = _lag_failed(exc)
+        _lag.update(checked=now, seconds=seconds)
+    return _lag["seconds"]
+
+# Read-your-writes: user id -> True while a write of theirs may not have reached the
+# replica yet. Auth puts the caller's id in `session.info`; the events below mark
+# sessions that wrote and note the user when they commit. Per worker.
+recent_writers = TTLCache(100_000, ttl=REPLICA_MAX_LAG_SECONDS + REPLICA_LAG_CHECK_SECONDS)
+
+@event.listens_for(Session, "after_flush")
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _executed(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+@event.listens_for(Session, "after_commit")
+def _committed(session):
+    if session.info.pop("wrote", False) and "user_id" in session.info:
+        recent_writers.set(session.info["user_id"], True)
+
+@event.listens_for(Session, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("wrote", None)
+
+def read_sessionmaker(user_id: Optional[int] = None) -> sessionmaker:
+    """ReadSessionLocal, unless the replica is too far behind or `user_id` wrote recently."""
+    if read_engine is engine or (user_id is not None and recent_writers.get(user_id)):
+        return SessionLocal
+    return ReadSessionLocal if replica_lag() <= REPLICA_MAX_LAG_SECONDS else SessionLocal
+
+async def read_sessionmaker_async(user_id: Optional[int] = None) -> async_sessionmaker:
+    if async_read_engine is async_engine or (user_id is not None and recent_writers.get(user_id)):
+        return AsyncSessionLocal
+    return AsyncReadSessionLocal if await replica_lag_async() <= REPLICA_MAX_LAG_SECONDS else AsyncSessionLocal
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database access requires DB_MODE=async")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_read_db():
+    """Session for reads that are not tied to a user (see auth.get_user_read_db for those)."""
+    db = read_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database access requires DB_MODE=async")
+    async with (await read_sessionmaker_async())() as db:
+        yield db
@@ -0,0 +1,49 @@
+from collections import Counter
+from typing import Dict, Iterable, Optional
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import FlagReasonCount, Transaction
+
+TOTAL = "__all__"
+
+def _tally(flag_reasons: Iterable[Optional[str]]) -> Counter:
+    counts: Counter = Counter()
+    for flag_reason in flag_reasons:
+        if flag_reason:
+            counts[TOTAL] += 1
+            counts.update(flag_reason.split(", "))
+    return counts
+
+def add_flag_counts(db: Session, flag_reasons: Iterable[Optional[str]], sign: int = 1) -> None:
+    """Adjust the per-reason counters for transactions flagged (or, with sign=-1, un-flagged/deleted)."""
+    for reason, n in _tally(flag_reasons).items():
+        stmt = update(FlagReasonCount).where(FlagReasonCount.reason == reason)
+        if db.execute(stmt.values(count=FlagReasonCount.count + sign * n)).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(insert(FlagReasonCount).values(reason=reason, count=max(sign * n, 0)))
+        except IntegrityError:
+            # Another writer created the counter first.
+            db.execute(stmt.values(count=FlagReasonCount.count + sign * n))
+
+def get_flag_counts(db: Session) -> Dict:
+    counts = dict(db.execute(select(FlagReasonCount.reason, FlagReasonCount.count)).all())
+    total = counts.pop(TOTAL, 0)
+    return {"total": total, "by_reason": {reason: n for reason, n in sorted(counts.items()) if n}}
+
+def rebuild_flag_counts(conn) -> None:
+    """Recount from the transactions table, e.g. after a bulk re-score."""
+    grouped = conn.execute(
+        select(Transaction.flag_reason, func.count())
+        .where(Transaction.flagged == True, Transaction.deleted == False)
+        .group_by(Transaction.flag_reason)
+    ).all()
+    counts: Counter = Counter()
+    for flag_reason, n in grouped:
+        for reason, k in _tally([flag_reason]).items():
+            counts[reason] += k * n
+    conn.execute(delete(FlagReasonCount))
+    if counts:
+        conn.execute(insert(FlagReasonCount), [{"reason": r, "count": n} for r, n in counts.items()])
@@ -1,30 +1,260 @@
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+from app.config import CURRENCY_SCALE, FRAUD_RULES_FILE, FRAUD_RULES_RELOAD_SECONDS, FRAUD_RULES_REORDER_EVERY
+from app.metrics import operation_time, rule_hits, timer
 
-def velocity_check(transactions, period_minutes=1, max_txn=3):
-    now = datetime.utcnow()
-    recent = [t for t in transactions if (now - t.timestamp) < timedelta(minutes=period_minutes)]
+# Defaults for the rule parameters; FRAUD_RULES_FILE overrides them at runtime.
+VELOCITY_PERIOD_MINUTES = 1
+VELOCITY_MAX_TXN = 3
+ANOMALY_THRESHOLD = 3
+ODD_HOUR_END = 5
+LARGE_AMOUNT = 10000  # currency units; amounts passed to the checks are minor units
+LARGE_AMOUNT_TYPES = ("deposit", "withdraw", "transfer")
+
+
+@dataclass
+class FraudState:
+    """Running per-wallet aggregates the fraud rules read instead of the full history."""
+    txn_count: int = 0
+    amount_sum: int = 0
+    recent_timestamps: List[datetime] = field(default_factory=list)
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        return cls(
+            txn_count=len(transactions),
+            amount_sum=sum(t.amount for t in transactions),
+            recent_timestamps=[t.timestamp for t in transactions],
+        )
+
+def velocity_check(state, period_minutes=VELOCITY_PERIOD_MINUTES, max_txn=VELOCITY_MAX_TXN, now=None):
+    now = now or datetime.utcnow()
+    window = timedelta(minutes=period_minutes)
+    recent = [ts for ts in state.recent_timestamps if (now - ts) < window]
     return len(recent) > max_txn
 
-def anomaly_amount_check(transactions, new_amount, threshold=3):
-    if not transactions:
+def anomaly_amount_check(state, new_amount, threshold=ANOMALY_THRESHOLD):
+    if not state.txn_count:
         return False
-    avg = sum(t.amount for t in transactions) / len(transactions)
-    return new_amount > threshold * avg
+    # new_amount > threshold * average, kept in integers
+    return new_amount * state.txn_count > threshold * state.amount_sum
 
-def odd_hour_check(transactions, txn_time=None):
+def odd_hour_check(state, txn_time=None, end_hour=ODD_HOUR_END):
     txn_time = txn_time or datetime.utcnow()
-    return txn_time.hour < 5
-
-def advanced_fraud_check(transactions, new_amount, txn_time=None, txn_type=None):
-    flags = []
-    if velocity_check(transactions):
-        flags.append("High transaction frequency")
-    if anomaly_amount_check(transactions, new_amount):
-        flags.append("Unusual transaction amount")
-    if odd_hour_check(transactions, txn_time):
-        flags.append("Transaction at odd hour")
-    # Flag large deposits, withdrawals, and transfers
-    if txn_type in ("deposit", "withdraw", "transfer") and new_amount > 10000:
-        flags.append(f"Large {txn_type} amount")
-    return flags
+    return txn_time.hour < end_hour
+
+# --- Rule engine ---
+#
+# Rules are registered below in the order their reasons appear in flag_reason.
+# A rules file maps rule names to parameter overrides, plus "enabled" and
+# "action" ("flag", or "block" to reject the transaction), e.g.
+#   {"velocity": {"max_txn": 5}, "large_amount": {"limit": 50000, "action": "block"}}
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    check: Callable[..., bool]  # (state, amount, txn_time, txn_type, **params)
+    reason: str  # may use {txn_type}
+    defaults: dict
+
+RULES: Dict[str, Rule] = {}
+
+def rule(name: str, reason: str, **defaults):
+    def register(check):
+        RULES[name] = Rule(name, check, reason, defaults)
+        return check
+    return register
+
+@rule("velocity", "High transaction frequency", period_minutes=VELOCITY_PERIOD_MINUTES, max_txn=VELOCITY_MAX_TXN)
+def _velocity(state, amount, txn_time, txn_type, period_minutes, max_txn):
+    return velocity_check(state, period_minutes, max_txn, now=txn_time)
+
+@rule("anomaly", "Unusual transaction amount", threshold=ANOMALY_THRESHOLD)
+def _anomaly(state, amount, txn_time, txn_type, threshold):
+    return anomaly_amount_check(state, amount, threshold)
+
+@rule("odd_hour", "Transaction at odd hour", end_hour=ODD_HOUR_END)
+def _odd_hour(state, amount, txn_time, txn_type, end_hour):
+    return odd_hour_check(state, txn_time, end_hour)
+
+@rule("large_amount", "Large {txn_type} amount", limit=LARGE_AMOUNT, types=list(LARGE_AMOUNT_TYPES))
+def _large_amount(state, amount, txn_time, txn_type, limit, types):
+    return txn_type in types and amount > limit * CURRENCY_SCALE
+
+class _CompiledRule:
+    """One enabled rule with its parameters bound, plus its running cost and hit counts."""
+    __slots__ = ("name", "check", "reason", "params", "block", "position", "calls", "hits", "seconds")
+
+    def __init__(self, rule: Rule, params: dict, block: bool, position: int):
+        self.name = rule.name
+        self.check = rule.check
+        self.reason = rule.reason
+        self.params = params
+        self.block = block
+        self.position = position
+        self.calls = self.hits = 0
+        self.seconds = 0.0
+
+    def sort_key(self):
+        cost = self.seconds / self.calls if self.calls else 0.0
+        if self.block:
+            # Cheap rules that often block go first: they end evaluation early.
+            return (0, cost / max(self.hits / self.calls if self.calls else 1.0, 1e-6))
+        return (1, cost)
+
+@dataclass
+class Verdict:
+    flags: List[str]
+    blocked: bool = False
+
+# Inclusive (low, high) for numeric parameters; any other number must be positive.
+PARAM_RANGES = {"end_hour": (0, 24)}
+
+def _check_param(rule_name: str, key: str, default, value) -> None:
+    """Raise ValueError unless value has the default's type and a sensible range."""
+    where = f"{rule_name}.{key}"
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{where}: expected a number")
+        low, high = PARAM_RANGES.get(key, (None, None))
+        if low is None and not value > 0:
+            raise ValueError(f"{where}: must be greater than 0")
+        if low is not None and not low <= value <= high:
+            raise ValueError(f"{where}: must be between {low} and {high}")
+    elif isinstance(default, list):
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError(f"{where}: expected a list of strings")
+    elif not isinstance(value, type(default)):
+        raise ValueError(f"{where}: expected {type(default).__name__}")
+
+class Plan:
+    """Enabled rules compiled from one configuration, kept in evaluation order."""
+
+    def __init__(self, config: dict):
+        if not isinstance(config, dict):
+            raise ValueError("fraud rules must be an object of rule name -> settings")
+        unknown = set(config) - set(RULES)
+        if unknown:
+            raise ValueError(f"unknown fraud rules: {', '.join(sorted(unknown))}")
+        self.config = {}
+        self.rules = []
+        for position, (name, rule) in enumerate(RULES.items()):
+            settings = config.get(name) or {}
+            if not isinstance(settings, dict):
+                raise ValueError(f"{name}: settings must be an object")
+            overrides = dict(settings)
+            enabled = overrides.pop("enabled", True)
+            if not isinstance(enabled, bool):
+                raise ValueError(f"{name}.enabled: expected bool")
+            action = overrides.pop("action", "flag")
+            if action not in ("flag", "block"):
+                raise ValueError(f"{name}: action must be 'flag' or 'block'")
+            bad = set(overrides) - set(rule.defaults)
+            if bad:
+                raise ValueError(f"{name}: unknown parameters {', '.join(sorted(bad))}")
+            for key, value in overrides.items():
+                _check_param(name, key, rule.defaults[key], value)
+            params = {**rule.defaults, **overrides}
+            self.config[name] = {**params, "enabled": enabled, "action": action}
+            if enabled:
+                self.rules.append(_CompiledRule(rule, params, action == "block", position))
+        self.evaluations = 0
+        self.reorder()
+
+    def reorder(self) -> None:
+        self.order = sorted(self.rules, key=_CompiledRule.sort_key)
+
+    def stats(self) -> list:
+        return [
+            {
+                "rule": r.name,
+                "action": "block" if r.block else "flag",
+                "calls": r.calls,
+                "hit_rate": r.hits / r.calls if r.calls else 0.0,
+                "mean_us": r.seconds / r.calls * 1e6 if r.calls else 0.0,
+            }
+            for r in self.order
+        ]
+
+class FraudEngine:
+    """Evaluates the current plan; re-reads the rules file when it changes (checked every few seconds)."""
+
+    def __init__(self, path: str = FRAUD_RULES_FILE, reload_seconds: float = FRAUD_RULES_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.plan = Plan({})
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        if path:
+            self.reload()
+
+    def reload(self) -> bool:
+        """Load the rules file now; on a bad file the current plan stays in place."""
+        with self._lock:
+            try:
+                # Remember the version even if it is bad, so it is not retried until edited again.
+                self._mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path) as f:
+                    self.plan = Plan(json.load(f))
+            except (OSError, TypeError, ValueError) as exc:
+                print(f"[FRAUD RULES] keeping current rules, could not load {self.path}: {exc}", file=sys.stderr)
+                return False
+            return True
+
+    def _current(self) -> Plan:
+        if self.path:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.reload_seconds
+                try:
+                    changed = os.stat(self.path).st_mtime_ns != self._mtime
+                except OSError:
+                    changed = False
+                if changed:
+                    self.reload()
+        return self.plan
+
+    def params(self) -> dict:
+        """Rule name -> effective parameters, "enabled" and "action"."""
+        return self._current().config
+
+    def evaluate(self, state, amount, txn_time=None, txn_type=None, short_circuit: bool = True) -> Verdict:
+        plan = self._current()
+        hits, blocked = [], False
+        with timer("fraud.check"):
+            for r in plan.order:
+                started = time.perf_counter()
+                hit = r.check(state, amount, txn_time, txn_type, **r.params)
+                elapsed = time.perf_counter() - started
+                r.calls += 1
+                r.seconds += elapsed
+                operation_time.observe(elapsed, f"fraud.{r.name}")
+                if hit:
+                    r.hits += 1
+                    rule_hits.inc(r.name)
+                    hits.append(r)
+                    if r.block and short_circuit:
+                        blocked = True
+                        break
+                    blocked = blocked or r.block
+        plan.evaluations += 1
+        if plan.evaluations % FRAUD_RULES_REORDER_EVERY == 0:
+            plan.reorder()
+        hits.sort(key=lambda r: r.position)
+        return Verdict([r.reason.format(txn_type=txn_type) for r in hits], blocked)
+
+engine = FraudEngine()
+
+def evaluate(state, new_amount, txn_time=None, txn_type=None) -> Verdict:
+    return engine.evaluate(state, new_amount, txn_time=txn_time, txn_type=txn_type)
 
+def advanced_fraud_check(state, new_amount, txn_time=None, txn_type=None):
+    """Flag reasons for a transaction, every enabled rule evaluated."""
+    return engine.evaluate(state, new_amount, txn_time=txn_time, txn_type=txn_type, short_circuit=False).flags
@@ -0,0 +1,134 @@
+"""Incremental fraud report.
+
+    python -m app.fraud_report [--catch-up]
+
+Each run reads transactions with an id above the job's watermark, a bounded
+batch at a time, folds the flagged ones into per-period, per-reason rows of
+`fraud_report_summaries` and advances the watermark in the same commit. A
+scheduled run stops after FRAUD_REPORT_MAX_BATCHES; a catch-up run keeps
+going (still one short transaction per batch) until it reaches the end.
+
+Ids are assigned before commit, so a row with a lower id can become visible
+after a higher one. Rows younger than FRAUD_REPORT_LAG_SECONDS are left for
+the next run (as the balance checkpoints do), so the watermark never passes a
+row that may still be committing.
+"""
+import argparse
+import threading
+from collections import defaultdict
+from itertools import takewhile
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import FRAUD_REPORT_BATCH_SIZE, FRAUD_REPORT_LAG_SECONDS, FRAUD_REPORT_MAX_BATCHES, FRAUD_REPORT_PERIOD_MINUTES
+from app.flag_counts import TOTAL
+from app.models import FraudReportSummary, JobWatermark, Transaction
+
+JOB_NAME = "fraud_report"
+# Serializes the scheduled run and a startup catch-up inside one process.
+_running = threading.Lock()
+
+def period_start(ts: datetime, minutes: int = FRAUD_REPORT_PERIOD_MINUTES) -> datetime:
+    epoch = datetime(1970, 1, 1)
+    return epoch + (ts - epoch) // timedelta(minutes=minutes) * timedelta(minutes=minutes)
+
+def _watermark(db: Session) -> JobWatermark:
+    mark = db.get(JobWatermark, JOB_NAME)
+    if mark is None:
+        try:
+            with db.begin_nested():
+                mark = JobWatermark(name=JOB_NAME, last_id=0, updated_at=datetime.utcnow())
+                db.add(mark)
+        except IntegrityError:
+            mark = db.get(JobWatermark, JOB_NAME)
+    return mark
+
+def _summarize(db: Session, rows) -> None:
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        bucket = period_start(row.timestamp)
+        for reason in [TOTAL, *(row.flag_reason or "").split(", ")]:
+            if reason:
+                totals[bucket, reason][0] += 1
+                totals[bucket, reason][1] += row.amount or 0
+    for (bucket, reason), (count, amount) in totals.items():
+        summary = db.get(FraudReportSummary, (bucket, reason))
+        if summary is None:
+            db.add(FraudReportSummary(period_start=bucket, reason=reason, count=count, amount=amount))
+        else:
+            summary.count += count
+            summary.amount += amount
+
+def run_report(
+    db: Session, batch_size: int = FRAUD_REPORT_BATCH_SIZE, max_batches: Optional[int] = FRAUD_REPORT_MAX_BATCHES,
+    read_db: Optional[Session] = None,
+) -> dict:
+    """Process transactions past the watermark; returns rows and batches done.
+
+    With `read_db` (e.g. a replica session) the transactions are read there;
+    summaries and the watermark are always written through `db`.
+    """
+    reader = read_db or db
+    cutoff = datetime.utcnow() - timedelta(seconds=FRAUD_REPORT_LAG_SECONDS)
+    processed = batches = 0
+    while max_batches is None or batches < max_batches:
+        last_id = _watermark(db).last_id
+        rows = reader.execute(
+            select(
+                Transaction.id, Transaction.timestamp, Transaction.amount,
+                Transaction.flagged, Transaction.deleted, Transaction.flag_reason,
+            )
+            .where(Transaction.id > last_id)
+            .order_by(Transaction.id)
+            .limit(batch_size)
+        ).all()
+        if reader is not db:
+            reader.rollback()  # one short read transaction per batch
+        fetched = len(rows)
+        rows = list(takewhile(lambda row: row.timestamp is None or row.timestamp < cutoff, rows))
+        if not rows:
+            db.rollback()
+            break
+        # The watermark walks every new row so each batch is a bounded primary-key range.
+        _summarize(db, [row for row in rows if row.flagged and not row.deleted])
+        # Only advance from the mark this batch was read at; another worker that
+        # got there first makes this a no-op and the batch is discarded.
+        moved = db.execute(
+            update(JobWatermark)
+            .where(JobWatermark.name == JOB_NAME, JobWatermark.last_id == last_id)
+            .values(last_id=rows[-1].id, last_timestamp=rows[-1].timestamp, updated_at=datetime.utcnow())
+        ).rowcount
+        if not moved:
+            db.rollback()
+            continue
+        db.commit()
+        processed += len(rows)
+        batches += 1
+        if fetched < batch_size or len(rows) < fetched:
+            break
+    return {"rows": processed, "batches": batches}
+
+def report_job(db: Session, catch_up: bool = False, read_db: Optional[Session] = None) -> Optional[dict]:
+    """Scheduler entry point; skips the run if another one is still going in this process."""
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        return run_report(db, max_batches=None if catch_up else FRAUD_REPORT_MAX_BATCHES, read_db=read_db)
+    finally:
+        _running.release()
+
+def main():
+    from app.database import SessionLocal, read_sessionmaker
+
+    parser = argparse.ArgumentParser(description="Fold new flagged transactions into the fraud report summaries.")
+    parser.add_argument("--catch-up", action="store_true", help="process every pending batch, not just one run's worth")
+    parser.add_argument("--batch-size", type=int, default=FRAUD_REPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    with SessionLocal() as db, read_sessionmaker()() as read_db:
+        result = run_report(db, args.batch_size, None if args.catch_up else FRAUD_REPORT_MAX_BATCHES, read_db)
+    print(f"processed {result['rows']} transactions in {result['batches']} batches")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.archive import archived_totals
+from app.fraud import engine
+from app.models import Transaction, WalletFraudState
+
+# Only timestamps inside the velocity window matter; the cap bounds pathological bursts.
+MAX_RECENT_TIMESTAMPS = 64
+
+def _recent_limits() -> tuple[timedelta, int]:
+    """Velocity window and how many timestamps to keep, from the current rule parameters."""
+    velocity = engine.params()["velocity"]
+    return timedelta(minutes=velocity["period_minutes"]), max(MAX_RECENT_TIMESTAMPS, velocity["max_txn"] + 1)
+
+def get_fraud_state(db: Session, wallet_id: int) -> WalletFraudState:
+    """Load and lock a wallet's fraud state, building it once from history if it does not exist yet.
+
+    Callers update the wallet's balance row first, so locks are always taken in
+    the same order (wallets, then their fraud state).
+    """
+    state = db.get(WalletFraudState, wallet_id, with_for_update=True)
+    if state is not None:
+        return state
+    window, keep = _recent_limits()
+    live = (Transaction.wallet_id == wallet_id, Transaction.deleted == False)
+    count, total = db.query(func.count(Transaction.id), func.sum(Transaction.amount)).filter(*live).one()
+    recent = [
+        ts for (ts,) in db.query(Transaction.timestamp)
+        .filter(*live, Transaction.timestamp > datetime.utcnow() - window)
+        .order_by(Transaction.timestamp)
+    ]
+    archived_count, archived_sum = archived_totals(db, wallet_id)
+    state = WalletFraudState(
+        wallet_id=wallet_id, txn_count=(count or 0) + archived_count, amount_sum=(total or 0) + archived_sum,
+    )
+    state.recent_timestamps = recent[-keep:]
+    try:
+        with db.begin_nested():
+            db.add(state)
+    except IntegrityError:
+        # A concurrent first write on the same wallet created it first.
+        state = db.get(WalletFraudState, wallet_id)
+    return state
+
+def record_transaction(state: WalletFraudState, amount: int, timestamp: datetime) -> None:
+    """Fold a new transaction into the running aggregates."""
+    state.txn_count += 1
+    state.amount_sum += amount
+    window, keep = _recent_limits()
+    recent = [ts for ts in state.recent_timestamps if timestamp - ts < window]
+    recent.append(timestamp)
+    state.recent_timestamps = recent[-keep:]
+
+def forget_transaction(db: Session, txn: Transaction) -> None:
+    """Remove a soft-deleted transaction from its wallet's aggregates."""
+    state = get_fraud_state(db, txn.wallet_id)
+    state.txn_count = max(state.txn_count - 1, 0)
+    state.amount_sum -= txn.amount
+    recent = state.recent_timestamps
+    if txn.timestamp in recent:
+        recent.remove(txn.timestamp)
+        state.recent_timestamps = recent
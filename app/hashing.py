@@ -0,0 +1,79 @@
+"""Awaitable bcrypt helpers backed by a bounded process pool.
+
+bcrypt holds the GIL for its whole ~200 ms, so running it in the request
+threadpool starves every other endpoint. Here it runs in worker processes;
+at most BCRYPT_WORKERS hashes run at once and at most BCRYPT_MAX_PENDING
+more may queue before callers get a 503.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from app.config import BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_MAX_PENDING, BCRYPT_REHASH_ON_LOGIN
+from app.metrics import timer
+
+_contexts: dict = {}
+_executor: ProcessPoolExecutor | None = None
+_in_flight = 0
+
+def _context(rounds: int) -> CryptContext:
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return _contexts[rounds]
+
+# --- Worker-side functions (must be importable top-level callables) ---
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+def _warm(rounds: int) -> None:
+    _context(rounds)
+
+def _verify(password: str, hashed: str, rounds: int) -> tuple[bool, bool]:
+    ctx = _context(rounds)
+    ok = ctx.verify(password, hashed)
+    return ok, ok and ctx.needs_update(hashed)
+
+# --- Event-loop side ---
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the parent has scheduler threads and open DB connections
+        _executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+async def _run(fn, *args):
+    global _in_flight
+    if _in_flight >= BCRYPT_WORKERS + BCRYPT_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Too many logins in progress, retry shortly", headers={"Retry-After": "1"})
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+async def hash_password(password: str) -> str:
+    with timer("bcrypt.hash"):
+        return await _run(_hash, password, BCRYPT_ROUNDS)
+
+async def verify_password(password: str, hashed: str) -> tuple[bool, str | None]:
+    """Check a password; returns (ok, new_hash) where new_hash is set when an opt-in rehash is due."""
+    with timer("bcrypt.verify"):
+        ok, stale = await _run(_verify, password, hashed, BCRYPT_ROUNDS)
+    if ok and stale and BCRYPT_REHASH_ON_LOGIN:
+        return ok, await hash_password(password)
+    return ok, None
+
+def start() -> None:
+    """Spawn the worker processes up front so the first login doesn't pay for it."""
+    executor = _get_executor()
+    for _ in range(BCRYPT_WORKERS):
+        executor.submit(_warm, BCRYPT_ROUNDS)
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
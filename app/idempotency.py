@@ -0,0 +1,157 @@
+"""Idempotency-Key support for money-moving endpoints.
+
+The key's record is added by a `before_flush` hook next to the new
+`Transaction`, so it commits (or rolls back) with it. Completed results are
+kept in an in-process LRU in front of the `idempotency_keys` table; a
+duplicate arriving while the first request is still running waits for it.
+Across workers the (user_id, key) unique constraint decides the winner and
+the loser replays the winner's result.
+"""
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from fastapi import HTTPException
+from sqlalchemy import delete, event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.cache import TTLCache
+from app.config import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_WAIT_SECONDS
+from app.models import IdempotencyKey, Transaction, User
+from app.schemas import TransactionOut
+
+# (user_id, key) -> (fingerprint, TransactionOut)
+results = TTLCache(IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def fingerprint(route: str, payload) -> str:
+    return hashlib.sha256(f"{route}\n{payload.model_dump_json()}".encode()).hexdigest()
+
+@event.listens_for(Session, "before_flush")
+def _attach_record(session: Session, flush_context, instances) -> None:
+    pending = session.info.get("idempotency")
+    if pending is None:
+        return
+    if pending.get("record") is not None and pending["record"] in session:
+        return
+    txn = next((obj for obj in session.new if isinstance(obj, Transaction)), None)
+    if txn is None:
+        return
+    now = datetime.utcnow()
+    record = IdempotencyKey(
+        user_id=pending["user_id"], key=pending["key"], fingerprint=pending["fingerprint"],
+        transaction=txn, created_at=now, expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    )
+    session.add(record)
+    pending["record"] = record
+
+def _replay(cache_key, fp: str, fingerprint_seen: str, result: TransactionOut) -> TransactionOut:
+    if fingerprint_seen != fp:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    results.set(cache_key, (fingerprint_seen, result))
+    return result
+
+def _lookup(db: Session, user_id: int, key: str) -> Optional[tuple]:
+    """(fingerprint, result) stored for a live key; an expired record is removed so the key can be reused."""
+    record = db.scalars(
+        select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).first()
+    if record is None:
+        return None
+    if record.expires_at <= datetime.utcnow():
+        db.delete(record)
+        db.commit()
+        return None
+    return record.fingerprint, TransactionOut.model_validate(record.transaction, from_attributes=True)
+
+def _claim(cache_key) -> Optional[threading.Event]:
+    """Register this request as in flight; returns the other request's event if one already is."""
+    with _inflight_lock:
+        running = _inflight.get(cache_key)
+        if running is None:
+            _inflight[cache_key] = threading.Event()
+        return running
+
+def _release(cache_key) -> None:
+    with _inflight_lock:
+        _inflight.pop(cache_key).set()
+
+def run_idempotent(db: Session, user: User, key: Optional[str], fp: str, operation: Callable[[], Transaction]):
+    """Run `operation` once per (user, key); repeats get the first TransactionOut back."""
+    if not key:
+        return operation()
+    cache_key = (user.id, key)
+    while True:
+        cached = results.get(cache_key)
+        if cached is not None:
+            return _replay(cache_key, fp, *cached)
+        running = _claim(cache_key)
+        if running is None:
+            break
+        if not running.wait(IDEMPOTENCY_WAIT_SECONDS):
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    try:
+        stored = _lookup(db, user.id, key)
+        if stored is not None:
+            return _replay(cache_key, fp, *stored)
+        db.info["idempotency"] = {"user_id": user.id, "key": key, "fingerprint": fp}
+        try:
+            txn = operation()
+        except IntegrityError:
+            # Another worker committed the same key first.
+            db.rollback()
+            stored = _lookup(db, user.id, key)
+            if stored is None:
+                raise
+            return _replay(cache_key, fp, *stored)
+        result = TransactionOut.model_validate(txn, from_attributes=True)
+        results.set(cache_key, (fp, result))
+        return result
+    finally:
+        db.info.pop("idempotency", None)
+        _release(cache_key)
+
+async def run_idempotent_async(
+    db: AsyncSession, user: User, key: Optional[str], fp: str, operation: Callable[[], Awaitable[Transaction]]
+):
+    """`run_idempotent` for the AsyncSession routes."""
+    if not key:
+        return await operation()
+    cache_key = (user.id, key)
+    while True:
+        cached = results.get(cache_key)
+        if cached is not None:
+            return _replay(cache_key, fp, *cached)
+        running = _claim(cache_key)
+        if running is None:
+            break
+        if not await run_in_threadpool(running.wait, IDEMPOTENCY_WAIT_SECONDS):
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    try:
+        stored = await db.run_sync(_lookup, user.id, key)
+        if stored is not None:
+            return _replay(cache_key, fp, *stored)
+        db.info["idempotency"] = {"user_id": user.id, "key": key, "fingerprint": fp}
+        try:
+            txn = await operation()
+        except IntegrityError:
+            await db.rollback()
+            stored = await db.run_sync(_lookup, user.id, key)
+            if stored is None:
+                raise
+            return _replay(cache_key, fp, *stored)
+        result = TransactionOut.model_validate(txn, from_attributes=True)
+        results.set(cache_key, (fp, result))
+        return result
+    finally:
+        db.info.pop("idempotency", None)
+        _release(cache_key)
+
+def purge_expired(db: Session) -> int:
+    """Delete expired records; scheduled from app.main."""
+    deleted = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow())).rowcount
+    db.commit()
+    return deleted
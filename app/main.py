@@ -1,9 +1,12 @@
 from fastapi import FastAPI
-from apscheduler.schedulers.background import BackgroundScheduler
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from app.routers import wallet, admin, auth  # <-- Now includes auth!
-from app.database import SessionLocal
-from app.models import Transaction
+from app import hashing, metrics
+from app.config import DB_MODE, METRICS_ENABLED, SCHEDULER_ENABLED
+from app.database import SessionLocal, describe_engine, engine, read_engine
+from app.transfer_graph import transfer_graph
+from app.tasks import leader
 from app.routers import admin
 
 
@@ -13,29 +16,43 @@ app = FastAPI(
     version="1.0.0"
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+
+# In async mode the AsyncSession variants are registered first so they take
+# precedence; anything without an async variant falls through to the sync routes.
+if DB_MODE == "async":
+    app.include_router(wallet.async_router)
+    app.include_router(admin.async_router)
+    app.include_router(auth.async_router)
 
 # Include your routers so endpoints are visible
 app.include_router(wallet.router)
 app.include_router(admin.router)
 app.include_router(auth.router)
 
-def daily_fraud_report():
-    db: Session = SessionLocal()
-    flagged = db.query(Transaction).filter(Transaction.flagged == True, Transaction.deleted == False).all()
-    print(f"[DAILY FRAUD REPORT] {len(flagged)} flagged transactions:")
-    for txn in flagged:
-        print(f"ID: {txn.id}, User: {txn.wallet_id}, Reason: {txn.flag_reason}")
-    db.close()
-
-def start_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(daily_fraud_report, 'interval', seconds=10)
-    scheduler.start()
-
 @app.on_event("startup")
 def startup_event():
-    start_scheduler()
+    print(f"[DB] {describe_engine(engine)}")
+    if read_engine is not engine:
+        print(f"[DB] reads: {describe_engine(read_engine)}")
+    hashing.start()
+    with SessionLocal() as db:
+        transfer_graph.rebuild(db)
+    # Background jobs run in whichever worker holds the scheduler lease.
+    if SCHEDULER_ENABLED:
+        leader.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    leader.stop()
+    hashing.shutdown()
     
 @app.get("/")
 def read_root():
     return {"message": "API is running!"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,165 @@
+"""In-process metrics in Prometheus text format, served at GET /metrics.
+
+Per route: request count and latency, plus how many SQL statements each
+request ran and how long they took (engine events feed a per-request
+counter held in a ContextVar). `timer()` records anything else, such as
+the fraud rules and bcrypt. Each observation is a few float adds under a
+lock, so this stays on in production. Numbers are per worker process.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.1, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series: dict = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _label_text(self, values, extra: str = "") -> str:
+        pairs = [f'{k}="{v}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = {k: list(v) if isinstance(v, list) else v for k, v in self._series.items()}
+        for values, data in sorted(series.items()):
+            lines.extend(self._render_series(values, data))
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def _render_series(self, values, total):
+        return [f"{self.name}{self._label_text(values)} {total}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels) -> None:
+        # Per series: one count per bucket (+Inf last), then the sum.
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._series.get(labels)
+            if data is None:
+                data = self._series[labels] = [0] * (len(self.buckets) + 2)
+            data[i] += 1
+            data[-1] += value
+
+    def _render_series(self, values, data):
+        lines, running = [], 0
+        for bound, n in zip(self.buckets + ("+Inf",), data):
+            running += n
+            le = f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{self._label_text(values, le)} {running}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {data[-1]}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {running}")
+        return lines
+
+registry: list = []
+
+http_requests = Counter("http_requests_total", "Requests by route and status.", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Request latency by route.", ("method", "route"))
+db_statements = Histogram(
+    "db_statements_per_request", "SQL statements issued per request.", ("method", "route"), buckets=COUNT_BUCKETS
+)
+db_time = Histogram("db_time_per_request_seconds", "Time spent in SQL statements per request.", ("method", "route"))
+background_statements = Counter("db_statements_background_total", "SQL statements issued outside a request.")
+rule_hits = Counter("fraud_rule_hits_total", "Fraud rule hits by rule.", ("rule",))
+operation_time = Histogram("operation_duration_seconds", "Timed operations (fraud rules, bcrypt).", ("op",), buckets=FAST_BUCKETS)
+
+# [statements, seconds] for the request being handled
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    stats = _request_db.get()
+    if stats is None:
+        background_statements.inc()
+        return
+    stats[0] += 1
+    stats[1] += elapsed
+
+@contextmanager
+def timer(op: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation_time.observe(time.perf_counter() - started, op)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and DB usage per route template (not per raw path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            http_requests.inc(*labels, str(status))
+            http_latency.observe(elapsed, *labels)
+            db_statements.observe(stats[0], *labels)
+            db_time.observe(stats[1], *labels)
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def reset() -> None:
+    for metric in registry:
+        metric.clear()
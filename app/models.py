@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Index, UniqueConstraint
+from sqlalchemy import text
 from sqlalchemy.orm import relationship
 from app.database import Base
 import datetime
+import json
 
 class User(Base):
     __tablename__ = "users"
@@ -17,19 +19,158 @@ class Wallet(Base):
     __tablename__ = "wallets"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    balance = Column(Float, default=0.0)
+    balance = Column(Integer, default=0)  # minor units, see CURRENCY_SCALE
     user = relationship("User", back_populates="wallet")
     transactions = relationship("Transaction", back_populates="wallet")
 
+    __table_args__ = (
+        # /admin/top-users reads the largest wallets first
+        Index("ix_wallets_balance", "balance"),
+    )
+
 class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True, index=True)
     wallet_id = Column(Integer, ForeignKey("wallets.id"))
     type = Column(String)  # deposit, withdraw, transfer
-    amount = Column(Float)
+    amount = Column(Integer)  # minor units
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     target_wallet_id = Column(Integer, nullable=True)
     flagged = Column(Boolean, default=False)
     flag_reason = Column(String, nullable=True)
     deleted = Column(Boolean, default=False)  # Soft delete
     wallet = relationship("Wallet", back_populates="transactions")
+
+    __table_args__ = (
+        # Keyset-paginated wallet history: equality on (wallet_id, deleted), range on (timestamp, id)
+        Index("ix_transactions_wallet_history", "wallet_id", "deleted", "timestamp", "id"),
+        # Admin review queue: only flagged, non-deleted rows are indexed
+        Index(
+            "ix_transactions_flagged_queue", "timestamp", "id",
+            sqlite_where=text("flagged = 1 AND deleted = 0"),
+            postgresql_where=text("flagged AND NOT deleted"),
+        ),
+        # Incoming transfers of a wallet, for point-in-time balances
+        Index("ix_transactions_target_wallet", "target_wallet_id", "id"),
+        # Soft-deleted rows waiting to be moved out by app/archive.py
+        Index(
+            "ix_transactions_deleted", "id",
+            sqlite_where=text("deleted = 1"),
+            postgresql_where=text("deleted"),
+        ),
+    )
+
+class WalletFraudState(Base):
+    """Running fraud aggregates per wallet, kept in step with its non-deleted transactions."""
+    __tablename__ = "wallet_fraud_state"
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    txn_count = Column(Integer, default=0, nullable=False)
+    amount_sum = Column(Integer, default=0, nullable=False)
+    recent_json = Column(String, default="[]", nullable=False)  # timestamps inside the velocity window
+
+    @property
+    def recent_timestamps(self):
+        return [datetime.datetime.fromisoformat(ts) for ts in json.loads(self.recent_json or "[]")]
+
+    @recent_timestamps.setter
+    def recent_timestamps(self, timestamps):
+        self.recent_json = json.dumps([ts.isoformat() for ts in timestamps])
+
+class FlagReasonCount(Base):
+    """Number of flagged, non-deleted transactions per fraud reason ("__all__" counts every such transaction)."""
+    __tablename__ = "flag_reason_counts"
+    reason = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+class BalanceTotal(Base):
+    """One shard of the running balance total of active, non-deleted users; the total is the sum over shards."""
+    __tablename__ = "balance_totals"
+    shard = Column(Integer, primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+
+class AlertOutbox(Base):
+    """Alerts written in the same commit as the flagged transaction, delivered by app.alerts."""
+    __tablename__ = "alert_outbox"
+    id = Column(Integer, primary_key=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"))
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    message = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    # Set when delivery is given up after ALERT_MAX_ATTEMPTS; the row then leaves the pending index.
+    dead_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_alert_outbox_pending", "next_attempt_at",
+            sqlite_where=text("sent_at IS NULL AND dead_at IS NULL"),
+            postgresql_where=text("sent_at IS NULL AND dead_at IS NULL"),
+        ),
+    )
+
+class TransactionArchive(Base):
+    """One monthly archive table (transactions_archive_YYYYMM) and how many rows it holds."""
+    __tablename__ = "transaction_archives"
+    month = Column(String, primary_key=True)  # YYYYMM
+    table_name = Column(String, nullable=False)
+    rows = Column(Integer, default=0, nullable=False)
+    newest = Column(DateTime, nullable=True)  # latest non-deleted row, lets history skip the month
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class BalanceCheckpoint(Base):
+    """A wallet's balance after all of its transactions with id up to `last_id`.
+
+    `as_of` is the timestamp of the transaction at `last_id`; see app/checkpoints.py.
+    """
+    __tablename__ = "balance_checkpoints"
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    last_id = Column(Integer, primary_key=True)
+    as_of = Column(DateTime, nullable=False)
+    balance = Column(Integer, nullable=False)  # minor units
+
+    __table_args__ = (
+        Index("ix_balance_checkpoints_wallet_as_of", "wallet_id", "as_of"),
+    )
+
+class SchedulerLease(Base):
+    """The worker running background jobs, until `expires_at` unless it renews; see app/tasks.py."""
+    __tablename__ = "scheduler_leases"
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class JobWatermark(Base):
+    """Last transaction a background job has processed."""
+    __tablename__ = "job_watermarks"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0, nullable=False)
+    last_timestamp = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class FraudReportSummary(Base):
+    """Flagged transactions per report period and fraud reason ("__all__" counts every one)."""
+    __tablename__ = "fraud_report_summaries"
+    period_start = Column(DateTime, primary_key=True)
+    reason = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+    amount = Column(Integer, default=0, nullable=False)
+
+class IdempotencyKey(Base):
+    """First result of a request sent with an Idempotency-Key, committed together with its transaction."""
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)  # hash of the route and body the key was first used with
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    transaction = relationship("Transaction")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
@@ -0,0 +1,24 @@
+"""Conversion between API amounts (currency units) and stored integer minor units."""
+from decimal import Decimal, InvalidOperation
+from app.config import CURRENCY_SCALE, MAX_AMOUNT_MINOR
+
+def to_minor(amount) -> int:
+    """Exact minor units for an amount such as 12.34; rejects finer precision than the scale and amounts above MAX_AMOUNT_MINOR."""
+    if isinstance(amount, bool):
+        raise ValueError("amount must be a number")
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError("amount must be a number")
+    if not value.is_finite():
+        raise ValueError("amount must be a number")
+    largest = Decimal(MAX_AMOUNT_MINOR) / CURRENCY_SCALE
+    if abs(value) > largest:
+        raise ValueError(f"amount must be at most {largest}")
+    scaled = value * CURRENCY_SCALE
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"amount must be a multiple of {Decimal(1) / CURRENCY_SCALE}")
+    return int(scaled)
+
+def to_major(minor) -> float:
+    return minor / CURRENCY_SCALE if minor is not None else None
@@ -0,0 +1,160 @@
+"""Per-user, per-route rate limits checked before any database work.
+
+Limits are token buckets stored as GCRA "theoretical arrival times": one float
+per (route, caller) key. A key whose time is in the past has a full bucket and
+is indistinguishable from a missing key, so idle keys are simply dropped.
+
+The in-memory backend limits each worker process separately. Set
+RATE_LIMIT_BACKEND=redis to share buckets between workers (requires the
+`redis` package).
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from app.auth import decode_token
+from app.config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_BACKEND, RATE_LIMIT_REDIS_URL, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_SWEEP_SECONDS,
+    RATE_LIMIT_DEPOSIT_PER_MINUTE, RATE_LIMIT_DEPOSIT_BURST,
+    RATE_LIMIT_WITHDRAW_PER_MINUTE, RATE_LIMIT_WITHDRAW_BURST,
+    RATE_LIMIT_TRANSFER_PER_MINUTE, RATE_LIMIT_TRANSFER_BURST,
+    RATE_LIMIT_LOGIN_PER_MINUTE, RATE_LIMIT_LOGIN_BURST,
+    RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE, RATE_LIMIT_LOGIN_ACCOUNT_BURST,
+)
+
+@dataclass(frozen=True)
+class Policy:
+    per_minute: float
+    burst: int
+
+    @property
+    def interval(self) -> float:
+        return 60.0 / self.per_minute
+
+POLICIES = {
+    "deposit": Policy(RATE_LIMIT_DEPOSIT_PER_MINUTE, RATE_LIMIT_DEPOSIT_BURST),
+    "withdraw": Policy(RATE_LIMIT_WITHDRAW_PER_MINUTE, RATE_LIMIT_WITHDRAW_BURST),
+    "transfer": Policy(RATE_LIMIT_TRANSFER_PER_MINUTE, RATE_LIMIT_TRANSFER_BURST),
+    "login": Policy(RATE_LIMIT_LOGIN_PER_MINUTE, RATE_LIMIT_LOGIN_BURST),
+    "login_account": Policy(RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE, RATE_LIMIT_LOGIN_ACCOUNT_BURST),
+}
+
+class MemoryBackend:
+    """Buckets in a dict, least recently used first; idle keys are swept periodically."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, sweep_seconds: float = RATE_LIMIT_SWEEP_SECONDS):
+        self.max_keys = max_keys
+        self.sweep_seconds = sweep_seconds
+        self._tat: dict = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def take(self, key, policy: Policy, now: float) -> float:
+        """Spend one token; returns 0 when allowed, otherwise seconds until a token is available."""
+        with self._lock:
+            tat = max(self._tat.pop(key, now), now)
+            new_tat = tat + policy.interval
+            wait = new_tat - policy.burst * policy.interval - now
+            self._tat[key] = tat if wait > 0 else new_tat
+            if now >= self._next_sweep or len(self._tat) > self.max_keys:
+                self._sweep(now)
+            return max(wait, 0.0)
+
+    def _sweep(self, now: float) -> None:
+        self._tat = {k: tat for k, tat in self._tat.items() if tat > now}
+        # Still over the cap: forget the least recently used buckets.
+        for k in list(self._tat)[: max(len(self._tat) - self.max_keys, 0)]:
+            del self._tat[k]
+        self._next_sweep = now + self.sweep_seconds
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tat.clear()
+
+_GCRA = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), now)
+local wait = tat + interval - burst * interval - now
+if wait > 0 then
+    return tostring(wait)
+end
+redis.call('SET', KEYS[1], tostring(tat + interval), 'PX', math.ceil((tat + interval - now) * 1000))
+return '0'
+"""
+
+class RedisBackend:
+    """The same buckets in Redis, updated atomically by a Lua script; keys expire once idle."""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "ratelimit:"):
+        import redis  # only needed for shared limits
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_GCRA)
+
+    def take(self, key, policy: Policy, now: float) -> float:
+        name, caller = key
+        wait = self._script(keys=[f"{self.prefix}{name}:{caller}"], args=[now, policy.interval, policy.burst])
+        return float(wait)
+
+    def clear(self) -> None:
+        for k in self._client.scan_iter(f"{self.prefix}*"):
+            self._client.delete(k)
+
+def _make_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+backend = _make_backend()
+
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+def _caller(request: Request) -> str:
+    """The JWT subject when there is a valid token (from the token cache, no DB), else the client address."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return "user:" + decode_token(token)[0]
+        except HTTPException:
+            pass  # rejected by the auth dependency right after
+    return "ip:" + _client_ip(request)
+
+def check(name: str, caller: str) -> None:
+    """Raise 429 with Retry-After when `caller` is over the `name` policy."""
+    wait = backend.take((name, caller), POLICIES[name], time.time())
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+def rate_limit(name: str):
+    """Route dependency for `dependencies=[...]`, so it runs before the auth and DB dependencies."""
+    async def dependency(request: Request) -> None:
+        if not RATE_LIMIT_ENABLED:
+            return
+        if name == "login":
+            # Keyed by client and account, so bad passwords from one client cannot
+            # lock everyone else out of an account; the looser per-account bucket
+            # still slows guessing spread over many addresses.
+            form = await request.form()
+            username = str(form.get("username", ""))
+            checks = [("login", f"ip:{_client_ip(request)}:{username}"), ("login_account", "login:" + username)]
+        else:
+            checks = [(name, _caller(request))]
+        for policy, caller in checks:
+            if isinstance(backend, MemoryBackend):
+                check(policy, caller)
+            else:
+                await run_in_threadpool(check, policy, caller)
+    return dependency
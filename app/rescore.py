@@ -0,0 +1,261 @@
+"""Vectorized re-scoring of the whole transactions table.
+
+    python -m app.rescore [--chunk-size N] [--dry-run] [--verify N]
+
+Rows are streamed in (wallet_id, timestamp, id) order and scored in NumPy
+chunks. For every non-deleted transaction the "history" is the wallet's
+earlier non-deleted transactions in that order, plus its archived ones
+(app/archive.py), which is exactly what `advanced_fraud_check` saw when
+the row was written. Running per-wallet
+state is carried across chunk boundaries, only rows whose verdict
+changes are written back, and the per-reason flag counters are then
+recounted. Rule parameters come from the same fraud engine configuration
+the API uses (app/fraud.py), read once at the start of a run; blocking rules
+are scored like flagging ones.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.engine import Engine
+from app import fraud
+from app.archive import archived_wallet_totals
+from app.config import CURRENCY_SCALE
+from app.flag_counts import rebuild_flag_counts
+from app.fraud import RULES, FraudState, advanced_fraud_check
+from app.models import Transaction
+from app.transfer_graph import GRAPH_REASONS
+
+# Bit per rule in the verdict mask, in the order reasons appear in flag_reason.
+RULE_BITS = ("velocity", "anomaly", "odd_hour", "large_amount")
+US_PER_HOUR = 3_600_000_000
+# Rows with no amount score (and count towards history) as 0 instead of breaking the int64 arrays.
+AMOUNT = func.coalesce(Transaction.amount, 0).label("amount")
+# Products at or above this are compared with Python ints so they cannot wrap around int64.
+INT64_SAFE = 2.0 ** 62
+
+def _reason_table(types):
+    """Map (type index, 4-bit rule mask) to the flag_reason string per-row scoring would build."""
+    table = np.empty((len(types), 16), dtype=object)
+    for t, txn_type in enumerate(types):
+        for code in range(16):
+            flags = [RULES[name].reason.format(txn_type=txn_type) for bit, name in enumerate(RULE_BITS) if code & (1 << bit)]
+            table[t, code] = ", ".join(flags) if flags else None
+    return table
+
+def _keep_graph_reasons(new, old):
+    """The rules' verdict plus any transfer-graph reasons the row already had (the rules can't recompute those)."""
+    kept = [reason for reason in (old or "").split(", ") if reason in GRAPH_REASONS]
+    if not kept:
+        return new
+    return ", ".join(([new] if new else []) + kept)
+
+def _segment_starts(wallets):
+    return np.flatnonzero(np.r_[True, wallets[1:] != wallets[:-1]])
+
+def _window_counts(groups, ts, window_us):
+    """Per row, how many earlier rows of the same group fall inside the velocity window."""
+    base = ts.min()
+    offset = int(ts.max() - base) + window_us + 1
+    positions = np.arange(len(ts))
+    if int(groups[-1]) * offset < 2 ** 62:
+        # Spread groups apart on one axis so a single searchsorted stays within a group.
+        key = groups.astype(np.int64) * offset + (ts - base)
+        left = np.searchsorted(key, key - window_us, side="right")
+        return positions - left
+    counts = np.empty(len(ts), dtype=np.int64)
+    starts = np.r_[_segment_starts(groups), len(ts)]
+    for s, e in zip(starts[:-1], starts[1:]):
+        left = np.searchsorted(ts[s:e], ts[s:e] - window_us, side="right")
+        counts[s:e] = np.arange(e - s) - left
+    return counts
+
+def _anomaly(amounts, prior_count, prior_sum, threshold):
+    """amount * count > threshold * sum, as anomaly_amount_check computes it, without int64 overflow."""
+    hits = (prior_count > 0) & (amounts * prior_count > threshold * prior_sum)
+    big = (np.abs(amounts.astype(np.float64)) * prior_count >= INT64_SAFE) | (np.abs(threshold * prior_sum.astype(np.float64)) >= INT64_SAFE)
+    for i in np.flatnonzero(big):
+        hits[i] = prior_count[i] > 0 and int(amounts[i]) * int(prior_count[i]) > threshold * int(prior_sum[i])
+    return hits
+
+class _Carry:
+    """State of the last wallet in a chunk, handed to the next chunk."""
+    def __init__(self):
+        self.wallet_id = None
+        self.count = 0
+        self.total = 0
+        self.recent = np.empty(0, dtype=np.int64)
+
+def _score_chunk(wallets, ts, amounts, type_idx, types, carry, window_us, params, archived=None):
+    """Return (flagged, reasons) arrays for one chunk sorted by (wallet, ts, id).
+
+    `archived` maps wallet id to the (count, sum) of its archived transactions,
+    which come before all of its rows here.
+    """
+    n = len(wallets)
+    continues = carry.wallet_id is not None and wallets[0] == carry.wallet_id
+    starts = _segment_starts(wallets)
+    groups = np.cumsum(np.r_[True, wallets[1:] != wallets[:-1]]) - 1
+
+    # Prior count and prior sum per row. Amounts are integer minor units, so one
+    # cumulative sum over the chunk, rebased at each wallet's first row, is exact.
+    prior_count = np.arange(n) - starts[groups]
+    before = np.cumsum(amounts) - amounts
+    prior_sum = before - before[starts][groups]
+    bounds = np.r_[starts, n]
+    if continues:
+        prior_count[: bounds[1]] += carry.count
+        prior_sum[: bounds[1]] += carry.total
+    if archived:
+        offsets = np.array([archived.get(int(w), (0, 0)) for w in wallets[starts]], dtype=np.int64)
+        if continues:
+            offsets[0] = 0  # already part of the carried totals
+        prior_count += offsets[:, 0][groups]
+        prior_sum += offsets[:, 1][groups]
+
+    # Velocity: carried timestamps of the continuing wallet are prepended as extra history.
+    lead = len(carry.recent) if continues else 0
+    ext_groups = np.r_[np.zeros(lead, dtype=np.int64), groups]
+    ext_ts = np.r_[carry.recent if continues else np.empty(0, dtype=np.int64), ts]
+    recent_counts = _window_counts(ext_groups, ext_ts, window_us)[lead:]
+
+    p = params
+    velocity = recent_counts > p["velocity"]["max_txn"]
+    anomaly = _anomaly(amounts, prior_count, prior_sum, p["anomaly"]["threshold"])
+    odd_hour = (ts // US_PER_HOUR) % 24 < p["odd_hour"]["end_hour"]
+    large_types = np.array([t in p["large_amount"]["types"] for t in types], dtype=bool)
+    large = large_types[type_idx] & (amounts > p["large_amount"]["limit"] * CURRENCY_SCALE)
+
+    code = np.zeros(n, dtype=np.int64)
+    for bit, hits in enumerate((velocity, anomaly, odd_hour, large)):
+        if p[RULE_BITS[bit]]["enabled"]:
+            code |= hits.astype(np.int64) << bit
+    reasons = _reason_table(types)[type_idx, code]
+
+    # Hand the last wallet's running state to the next chunk.
+    last = bounds[-2]
+    tail = ext_ts if (continues and last == 0) else ts[last:]
+    carry.wallet_id = wallets[-1]
+    carry.count = int(prior_count[-1]) + 1
+    carry.total = int(prior_sum[-1] + amounts[-1])
+    carry.recent = tail[tail > ts[-1] - window_us]
+    return code != 0, reasons
+
+def rescore(engine: Engine, chunk_size: int = 50_000, dry_run: bool = False, collect_ids=None, write_batch: int = 10_000):
+    """Re-score every non-deleted transaction and write back rows whose verdict changed."""
+    params = fraud.engine.params()
+    with engine.connect() as conn:
+        archived = archived_wallet_totals(conn)
+    window_us = int(timedelta(minutes=params["velocity"]["period_minutes"]) / timedelta(microseconds=1))
+    stmt = (
+        select(
+            Transaction.id, Transaction.wallet_id, Transaction.type, AMOUNT,
+            Transaction.timestamp, Transaction.flagged, Transaction.flag_reason,
+        )
+        .where(Transaction.deleted == False, Transaction.wallet_id.is_not(None))
+        .order_by(Transaction.wallet_id, Transaction.timestamp, Transaction.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    started = time.perf_counter()
+    carry = _Carry()
+    changes, collected = [], {}
+    rows_seen = 0
+    with engine.connect() as conn:
+        for part in conn.execute(stmt).partitions():
+            ids, wallets, types_col, amounts, stamps, old_flagged, old_reasons = zip(*part)
+            ids = np.array(ids, dtype=np.int64)
+            wallets = np.array(wallets, dtype=np.int64)
+            amounts = np.array(amounts, dtype=np.int64)
+            ts = np.array(stamps, dtype="datetime64[us]").astype(np.int64)
+            types, type_idx = np.unique(np.array(types_col, dtype=object).astype(str), return_inverse=True)
+            flagged, reasons = _score_chunk(wallets, ts, amounts, type_idx, list(types), carry, window_us, params, archived)
+
+            old_flagged = np.array([bool(f) for f in old_flagged])
+            old_reasons = np.array(old_reasons, dtype=object)
+            for i in np.flatnonzero((flagged != old_flagged) | (reasons != old_reasons)):
+                reason = _keep_graph_reasons(reasons[i], old_reasons[i])
+                if reason != old_reasons[i]:
+                    changes.append({"b_id": int(ids[i]), "b_flagged": reason is not None, "b_reason": reason})
+            if collect_ids:
+                for i in np.flatnonzero(np.isin(ids, list(collect_ids))):
+                    collected[int(ids[i])] = reasons[i]
+            rows_seen += len(ids)
+
+    if changes and not dry_run:
+        stmt = (
+            update(Transaction)
+            .where(Transaction.id == bindparam("b_id"))
+            .values(flagged=bindparam("b_flagged"), flag_reason=bindparam("b_reason"))
+        )
+        for offset in range(0, len(changes), write_batch):
+            with engine.begin() as conn:  # short write transactions, one per batch
+                conn.execute(stmt, changes[offset: offset + write_batch])
+        with engine.begin() as conn:
+            rebuild_flag_counts(conn)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows_seen,
+        "changed": len(changes),
+        "seconds": elapsed,
+        "rows_per_sec": rows_seen / elapsed if elapsed else 0.0,
+        "dry_run": dry_run,
+        "collected": collected,
+    }
+
+def reference_reason(conn, txn_id):
+    """Score one transaction the slow way, through the per-row rules."""
+    cols = (Transaction.id, Transaction.wallet_id, Transaction.type, AMOUNT, Transaction.timestamp)
+    row = conn.execute(select(*cols).where(Transaction.id == txn_id)).one()
+    history = conn.execute(
+        select(AMOUNT, Transaction.timestamp)
+        .where(
+            Transaction.wallet_id == row.wallet_id,
+            Transaction.deleted == False,
+            (Transaction.timestamp < row.timestamp)
+            | ((Transaction.timestamp == row.timestamp) & (Transaction.id < row.id)),
+        )
+        .order_by(Transaction.timestamp, Transaction.id)
+    ).all()
+    state = FraudState.from_transactions(history)
+    archived_count, archived_sum = archived_wallet_totals(conn).get(row.wallet_id, (0, 0))
+    state.txn_count += archived_count
+    state.amount_sum += archived_sum
+    flags = advanced_fraud_check(state, row.amount, txn_time=row.timestamp, txn_type=row.type)
+    return ", ".join(flags) if flags else None
+
+def verify(engine: Engine, sample: int, chunk_size: int = 50_000):
+    """Compare the vectorized verdicts with per-row scoring on a random sample; return mismatched ids."""
+    with engine.connect() as conn:
+        ids = conn.execute(select(Transaction.id).where(Transaction.deleted == False, Transaction.wallet_id.is_not(None))).scalars().all()
+        picked = set(random.sample(ids, min(sample, len(ids))))
+        result = rescore(engine, chunk_size=chunk_size, dry_run=True, collect_ids=picked)
+        return [i for i in sorted(picked) if result["collected"].get(i) != reference_reason(conn, i)]
+
+def main():
+    from app.database import engine as default_engine
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Re-score all transactions with the current fraud thresholds.")
+    parser.add_argument("--database-url", help="defaults to the app database")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--dry-run", action="store_true", help="compute verdicts without writing them")
+    parser.add_argument("--verify", type=int, metavar="N", help="check N random rows against per-row scoring")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url) if args.database_url else default_engine
+    if args.verify:
+        mismatches = verify(engine, args.verify, args.chunk_size)
+        print(f"verified {args.verify} rows, {len(mismatches)} mismatches {mismatches[:20] if mismatches else ''}")
+        raise SystemExit(1 if mismatches else 0)
+    result = rescore(engine, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    print(
+        f"scored {result['rows']} rows in {result['seconds']:.2f}s "
+        f"({result['rows_per_sec']:.0f} rows/sec), {result['changed']} changed"
+        + (" (dry run)" if args.dry_run else "")
+    )
+
+if __name__ == "__main__":
+    main()
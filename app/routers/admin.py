@@ -1,37 +1,132 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import func
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from app.admin import get_top_users
-from app.models import Transaction, User, Wallet
-from app.database import get_db
-from app.schemas import TransactionOut
-from app.auth import get_current_user
+from typing import List, Optional
+from app import async_crud, fraud
+from app.aggregates import total_balance
+from app.archive import archives
+from app.checkpoints import balance_at
+from app.admin import get_flagged_transactions, get_top_users
+from app.config import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+from app.flag_counts import get_flag_counts
+from app.money import to_major
+from app.crud import soft_delete_transaction, soft_delete_user
+from app.models import SchedulerLease, Transaction, User, Wallet
+from app.database import get_db, get_async_db, get_read_db, get_async_read_db
+from app.schemas import TransactionOut, transaction_json
+from app.tasks import TASKS, leader
+from app.auth import (
+    Principal, auth_cache_stats, get_current_principal, get_current_principal_async, get_current_user, get_current_user_async,
+    get_user_read_db, get_user_read_db_async,
+)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
+# Same endpoints on AsyncSession, mounted ahead of `router` when DB_MODE=async
+async_router = APIRouter(prefix="/admin", tags=["admin"])
 
+def _total_active_balance(db: Session):
+    return to_major(total_balance(db))
+
+# Review queue, newest first. The cursor for the next page is returned in the
+# X-Next-Cursor header so the body keeps its list shape.
 @router.get("/flagged-transactions", response_model=List[TransactionOut])
-def flagged_transactions(db: Session = Depends(get_db)):
-    return db.query(Transaction).filter(Transaction.flagged == True, Transaction.deleted == False).all()
+def flagged_transactions(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    reason: Optional[str] = None,
+    wallet_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    principal: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_user_read_db)
+):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    transactions, next_cursor = get_flagged_transactions(db, limit, cursor, reason, wallet_id, since, until)
+    return _flagged_page(transactions, next_cursor)
+
+def _flagged_page(transactions: list, next_cursor: Optional[str]) -> ORJSONResponse:
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    return ORJSONResponse([transaction_json(row) for row in transactions], headers=headers)
+
+@router.get("/flagged-counts")
+def flagged_counts(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_user_read_db)):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return get_flag_counts(db)
 
 @router.get("/total-balances")
 def total_balances(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_read_db),
     current_user: User = Depends(get_current_user)
 ):
     if not getattr(current_user, "is_admin", False):
         raise HTTPException(status_code=403, detail="Not authorized")
-    total_sum = (
-        db.query(func.sum(Wallet.balance))
-        .join(User, Wallet.user_id == User.id)
-        .filter(User.is_active == True, User.deleted == False)
-        .scalar() or 0
-    )
+    total_sum = _total_active_balance(db)
     return {"total_balance": total_sum}
 
 @router.get("/top-users")
-def top_users(db: Session = Depends(get_db), limit: int = 10):
-    return get_top_users(db, limit)
+def top_users(db: Session = Depends(get_read_db), limit: int = 10):
+    return ORJSONResponse(get_top_users(db, limit))
+
+@router.get("/auth-cache")
+def auth_cache(principal: Principal = Depends(get_current_principal)):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return auth_cache_stats()
+
+@router.get("/fraud-rules")
+def fraud_rules(principal: Principal = Depends(get_current_principal)):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {"rules": fraud.engine.params(), "plan": fraud.engine.plan.stats()}
+
+@router.post("/fraud-rules/reload")
+def reload_fraud_rules(principal: Principal = Depends(get_current_principal)):
+    """Re-read FRAUD_RULES_FILE in this worker now instead of at the next periodic check."""
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not fraud.engine.path:
+        raise HTTPException(status_code=400, detail="FRAUD_RULES_FILE is not set")
+    if not fraud.engine.reload():
+        raise HTTPException(status_code=400, detail="Rules file could not be loaded; current rules kept")
+    return {"rules": fraud.engine.params()}
+
+@router.get("/wallets/{wallet_id}/balance-at")
+def wallet_balance_at(
+    wallet_id: int, at: datetime, principal: Principal = Depends(get_current_principal), db: Session = Depends(get_user_read_db)
+):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if db.get(Wallet, wallet_id) is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return {"wallet_id": wallet_id, "balance": to_major(balance_at(db, wallet_id, at)), "at": at}
+
+@router.get("/scheduler")
+def scheduler_status(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    """Which worker holds the scheduler lease, and whether it is this one."""
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    lease = db.get(SchedulerLease, leader.name)
+    return {
+        "holder": lease.holder if lease else None,
+        "expires_at": lease.expires_at if lease else None,
+        "this_worker": leader.holder,
+        "leader": leader.is_leader,
+        "jobs": {t.name: t.seconds for t in TASKS.values()},
+    }
+
+@router.get("/archive")
+def archive_catalog(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_user_read_db)):
+    """Monthly archive tables and how many transactions each holds."""
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return [
+        {"month": a.month, "table": a.table_name, "rows": a.rows, "newest": a.newest, "updated_at": a.updated_at}
+        for a in archives(db)
+    ]
 
 # --- SOFT DELETE ENDPOINTS ---
 
@@ -43,11 +138,7 @@ def soft_delete_user_endpoint(
 ):
     if not getattr(current_user, "is_admin", False):
         raise HTTPException(status_code=403, detail="Not authorized")
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    user.deleted = True  # type: ignore
-    db.commit()
+    soft_delete_user(db, user_id)
     return {"msg": f"User {user_id} soft deleted"}
 
 @router.delete("/transactions/{txn_id}")
@@ -58,9 +149,70 @@ def soft_delete_transaction_endpoint(
 ):
     if not getattr(current_user, "is_admin", False):
         raise HTTPException(status_code=403, detail="Not authorized")
-    txn = db.query(Transaction).filter(Transaction.id == txn_id).first()
-    if not txn:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    txn.deleted = True  # type: ignore
-    db.commit()
+    soft_delete_transaction(db, txn_id)
+    return {"msg": f"Transaction {txn_id} soft deleted"}
+
+# --- Async variants (DB_MODE=async) ---
+
+@async_router.get("/flagged-transactions", response_model=List[TransactionOut])
+async def flagged_transactions_async(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    reason: Optional[str] = None,
+    wallet_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    principal: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_user_read_db_async)
+):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    transactions, next_cursor = await db.run_sync(
+        get_flagged_transactions, limit, cursor, reason, wallet_id, since, until
+    )
+    return _flagged_page(transactions, next_cursor)
+
+@async_router.get("/flagged-counts")
+async def flagged_counts_async(
+    principal: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_user_read_db_async)
+):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return await db.run_sync(get_flag_counts)
+
+@async_router.get("/total-balances")
+async def total_balances_async(
+    db: AsyncSession = Depends(get_user_read_db_async),
+    current_user: User = Depends(get_current_user_async)
+):
+    if not getattr(current_user, "is_admin", False):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    total_sum = await db.run_sync(_total_active_balance)
+    return {"total_balance": total_sum}
+
+@async_router.get("/top-users")
+async def top_users_async(db: AsyncSession = Depends(get_async_read_db), limit: int = 10):
+    return ORJSONResponse(await db.run_sync(get_top_users, limit))
+
+@async_router.delete("/users/{user_id}")
+async def soft_delete_user_endpoint_async(
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    if not getattr(current_user, "is_admin", False):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    await async_crud.soft_delete_user(db, user_id)
+    return {"msg": f"User {user_id} soft deleted"}
+
+@async_router.delete("/transactions/{txn_id}")
+async def soft_delete_transaction_endpoint_async(
+    txn_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    if not getattr(current_user, "is_admin", False):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    await async_crud.soft_delete_transaction(db, txn_id)
     return {"msg": f"Transaction {txn_id} soft deleted"}
@@ -1,87 +1,91 @@
-import os
 from fastapi import APIRouter, Depends, HTTPException, status, Form
-from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+from app import async_crud, hashing
+from app.auth import create_access_token, get_user
 from app.models import User
-from app.database import get_db
+from app.ratelimit import rate_limit
+from app.database import get_db, get_async_db
 
-# JWT and password hashing config
-SECRET_KEY = os.getenv("SECRET_KEY", "default_fallback_key")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/user/login")
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def create_access_token(data: dict, expires_delta: timedelta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)) -> str:
-    to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-
-def get_user(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
-
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
-    if not user or not verify_password(password, getattr(user, "hashed_password", "")):
-        return None
-    return user
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub", "")
-        if not username:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token: username missing")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token: decoding failed")
+# --- API ROUTER FOR AUTH ---
+router = APIRouter(prefix="/user", tags=["auth"])
+# Same endpoints on AsyncSession, mounted ahead of `router` when DB_MODE=async
+async_router = APIRouter(prefix="/user", tags=["auth"])
 
-    user = get_user(db, username)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+def _add_user(db: Session, username: str, hashed_password: str) -> None:
+    new_user = User(username=username, hashed_password=hashed_password)
+    db.add(new_user)
+    db.commit()
 
-    return user
+def _store_rehash(db: Session, user: User, hashed_password: str) -> None:
+    user.hashed_password = hashed_password  # type: ignore
+    db.commit()
 
-# --- API ROUTER FOR AUTH ---
-router = APIRouter(prefix="/user", tags=["auth"])
+# Handlers are async so bcrypt can be awaited in the hashing process pool
+# (app/hashing.py); their short DB calls still run in the threadpool.
 
 @router.post("/register")
-def register(
+async def register(
     username: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    user = get_user(db, username)
+    user = await run_in_threadpool(get_user, db, username)
     if user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(password)
-    new_user = User(username=username, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    hashed_password = await hashing.hash_password(password)
+    await run_in_threadpool(_add_user, db, username, hashed_password)
     return {"msg": "User registered successfully"}
 
-@router.post("/login")
-def login(
+@router.post("/login", dependencies=[Depends(rate_limit("login"))])
+async def login(
     username: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    user = authenticate_user(db, username, password)
-    if not user:
+    user = await run_in_threadpool(get_user, db, username)
+    ok, new_hash = await hashing.verify_password(password, user.hashed_password) if user else (False, None)
+    if not ok:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password"
+        )
+    if new_hash:
+        await run_in_threadpool(_store_rehash, db, user, new_hash)
+    access_token = create_access_token(data={"sub": user.username})
+    return {"access_token": access_token, "token_type": "bearer"}
+
+# --- Async variants (DB_MODE=async) ---
+
+@async_router.post("/register")
+async def register_async(
+    username: str = Form(...),
+    password: str = Form(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if await async_crud.get_user_by_username(db, username):
+        raise HTTPException(status_code=400, detail="Username already registered")
+    hashed_password = await hashing.hash_password(password)
+    db.add(User(username=username, hashed_password=hashed_password))
+    await db.commit()
+    return {"msg": "User registered successfully"}
+
+@async_router.post("/login", dependencies=[Depends(rate_limit("login"))])
+async def login_async(
+    username: str = Form(...),
+    password: str = Form(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    user = await async_crud.get_user_by_username(db, username)
+    ok, new_hash = await hashing.verify_password(password, user.hashed_password) if user else (False, None)
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
+    if new_hash:
+        user.hashed_password = new_hash  # type: ignore
+        await db.commit()
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from app.auth import get_current_user
-from app.crud import transfer, get_transaction_history
-from app.models import User, Transaction
-from app.schemas import TransactionCreate, TransactionOut, WalletOut
+from app.auth import Principal, get_current_principal, get_current_user, get_user_read_db
+from app.config import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+from app.crud import transfer, get_transaction_page
+from app.routers.wallet import stream_history
+from app.models import User, Transaction, Wallet
+from app.money import to_major
+from app.schemas import TransactionCreate, TransactionOut, WalletOut, transaction_json
 from app.database import get_db
 
 router = APIRouter()
@@ -21,13 +28,20 @@ def transfer_cash(
 
 @router.get("/history", response_model=WalletOut)
 def get_history(
-    user: User = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    stream: bool = False,
+    principal: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_user_read_db)
 ):
-    wallet = user.wallet
-    transactions = get_transaction_history(db, user)
-    
-    # Ensure transactions match expected schema format
-    transactions_out = [TransactionOut(**txn.__dict__) for txn in transactions]
-
-    return WalletOut(balance=wallet.balance, transactions=transactions_out)
+    if stream:
+        return stream_history(principal.wallet_id, cursor, since, until, principal.user_id)
+    balance = db.scalar(select(Wallet.balance).where(Wallet.id == principal.wallet_id))
+    transactions, next_cursor = get_transaction_page(db, principal.wallet_id, limit, cursor, since, until)
+    return ORJSONResponse({
+        "balance": to_major(balance),
+        "transactions": [transaction_json(row) for row in transactions],
+        "next_cursor": next_cursor,
+    })
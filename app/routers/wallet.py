@@ -1,73 +1,229 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.auth import get_current_user
-from app.crud import deposit, withdraw, transfer  # Added transfer
-from app.schemas import TransactionCreate, TransactionOut, TransferRequest  # Added TransferRequest
-from app.database import get_db
-from app.models import User, Transaction
+from app import async_crud
+from app.auth import (
+    Principal, get_current_principal, get_current_principal_async, get_current_user, get_current_user_async,
+    get_user_read_db, get_user_read_db_async,
+)
+from app.checkpoints import balance_at
+from app.config import BATCH_MAX_ITEMS, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+from app.crud import deposit, withdraw, transfer, apply_batch, get_transaction_page, iter_transaction_history  # Added transfer
+from app.schemas import TransactionCreate, TransactionOut, TransferRequest, BatchRequest, BatchResponse, WalletOut, transaction_json  # Added TransferRequest
+from app.ratelimit import rate_limit
+from app.idempotency import fingerprint, run_idempotent, run_idempotent_async
+from app.database import get_db, get_async_db, read_sessionmaker, read_sessionmaker_async
+from app.models import User, Transaction, Wallet
+from app.money import to_major
 
 router = APIRouter()
+# Same endpoints on AsyncSession, mounted ahead of `router` when DB_MODE=async
+async_router = APIRouter()
 
-@router.post("/deposit", response_model=TransactionOut)
+# Money-moving endpoints accept an Idempotency-Key header: a retry with the same
+# key returns the first result instead of moving the money again.
+IdempotencyKeyHeader = Header(None, alias="Idempotency-Key", max_length=255)
+
+@router.post("/deposit", response_model=TransactionOut, dependencies=[Depends(rate_limit("deposit"))])
 def deposit_cash(
     txn: TransactionCreate,
+    idempotency_key: Optional[str] = IdempotencyKeyHeader,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    return deposit(db, user, txn.amount)
+    fp = fingerprint("/deposit", txn)
+    return run_idempotent(db, user, idempotency_key, fp, lambda: deposit(db, user, txn.amount))
 
-@router.post("/withdraw", response_model=TransactionOut)
+@router.post("/withdraw", response_model=TransactionOut, dependencies=[Depends(rate_limit("withdraw"))])
 def withdraw_cash(
     txn: TransactionCreate,
+    idempotency_key: Optional[str] = IdempotencyKeyHeader,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    return withdraw(db, user, txn.amount)
+    fp = fingerprint("/withdraw", txn)
+    return run_idempotent(db, user, idempotency_key, fp, lambda: withdraw(db, user, txn.amount))
 
-@router.post("/transfer", response_model=TransactionOut)
+@router.post("/transfer", response_model=TransactionOut, dependencies=[Depends(rate_limit("transfer"))])
 def transfer_funds(
     req: TransferRequest,
+    idempotency_key: Optional[str] = IdempotencyKeyHeader,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     recipient = db.query(User).filter(User.username == req.recipient_username).first()
     if not recipient:
         raise HTTPException(status_code=404, detail="Recipient not found")
-    txn = transfer(db, user, recipient, req.amount)
-    return txn
+    fp = fingerprint("/transfer", req)
+    return run_idempotent(db, user, idempotency_key, fp, lambda: transfer(db, user, recipient, req.amount))
+
+# --- Endpoint: Apply many operations in one DB transaction ---
+@router.post("/transactions/batch", response_model=BatchResponse)
+def apply_transaction_batch(
+    req: BatchRequest,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    _check_batch_size(req)
+    return {"results": apply_batch(db, user, req.items)}
+
+def _check_batch_size(req: BatchRequest) -> None:
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
 
 # --- Endpoint: Get current user's wallet balance ---
 @router.get("/wallet/balance")
-def get_my_balance(user: User = Depends(get_current_user)):
-    if user.wallet is None:
+def get_my_balance(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    if principal.wallet_id is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return {"balance": to_major(db.query(Wallet.balance).filter(Wallet.id == principal.wallet_id).scalar())}
+
+# --- Endpoint: Get current user's wallet balance at a point in time ---
+@router.get("/wallet/balance-at")
+def get_my_balance_at(at: datetime, principal: Principal = Depends(get_current_principal), db: Session = Depends(get_user_read_db)):
+    if principal.wallet_id is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    return {"balance": user.wallet.balance}
+    return {"balance": to_major(balance_at(db, principal.wallet_id, at)), "at": at}
 
 # --- Endpoint: Get current user's balance AND transaction history ---
-@router.get("/wallet/history")
+# Newest first, `limit` rows per page; pass `next_cursor` back as `cursor` for the
+# next page. With `stream=true` the whole (filtered) history is sent as NDJSON.
+@router.get("/wallet/history", response_model=WalletOut)
 def get_my_wallet_history(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    stream: bool = False,
+    principal: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_user_read_db)
 ):
-    if user.wallet is None:
+    if principal.wallet_id is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    transactions = (
-        db.query(Transaction)
-        .filter(Transaction.wallet_id == user.wallet.id)
-        .order_by(Transaction.timestamp.desc())
-        .all()
+    if stream:
+        return stream_history(principal.wallet_id, cursor, since, until, principal.user_id)
+    return _wallet_history(db, principal.wallet_id, limit, cursor, since, until)
+
+def _wallet_history(db: Session, wallet_id: int, limit: int, cursor=None, since=None, until=None):
+    # Balance and rows come from the same (possibly replica) session, so they agree.
+    balance = db.scalar(select(Wallet.balance).where(Wallet.id == wallet_id))
+    # Rows come from a column projection and are serialized as-is (same shape as WalletOut).
+    transactions, next_cursor = get_transaction_page(db, wallet_id, limit, cursor, since, until)
+    return ORJSONResponse({
+        "balance": to_major(balance),
+        "transactions": [transaction_json(row) for row in transactions],
+        "next_cursor": next_cursor,
+    })
+
+def _ndjson(row: dict) -> bytes:
+    return orjson.dumps(transaction_json(row)) + b"\n"
+
+def stream_history(wallet_id: int, cursor=None, since=None, until=None, user_id=None) -> StreamingResponse:
+    """NDJSON response for a wallet's history, fetched page by page while it is sent.
+
+    The generator runs after the request's session is closed, so it uses its own.
+    """
+    def rows():
+        with read_sessionmaker(user_id)() as db:
+            for row in iter_transaction_history(db, wallet_id, cursor, since, until):
+                yield _ndjson(row)
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+def stream_history_async(wallet_id: int, cursor=None, since=None, until=None, user_id=None) -> StreamingResponse:
+    async def rows():
+        nonlocal cursor
+        async with (await read_sessionmaker_async(user_id))() as db:
+            while True:
+                page, cursor = await db.run_sync(get_transaction_page, wallet_id, 500, cursor, since, until)
+                for row in page:
+                    yield _ndjson(row)
+                if cursor is None:
+                    return
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+# --- Async variants (DB_MODE=async) ---
+
+@async_router.post("/deposit", response_model=TransactionOut, dependencies=[Depends(rate_limit("deposit"))])
+async def deposit_cash_async(
+    txn: TransactionCreate,
+    idempotency_key: Optional[str] = IdempotencyKeyHeader,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    fp = fingerprint("/deposit", txn)
+    return await run_idempotent_async(db, user, idempotency_key, fp, lambda: async_crud.deposit(db, user, txn.amount))
+
+@async_router.post("/withdraw", response_model=TransactionOut, dependencies=[Depends(rate_limit("withdraw"))])
+async def withdraw_cash_async(
+    txn: TransactionCreate,
+    idempotency_key: Optional[str] = IdempotencyKeyHeader,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    fp = fingerprint("/withdraw", txn)
+    return await run_idempotent_async(db, user, idempotency_key, fp, lambda: async_crud.withdraw(db, user, txn.amount))
+
+@async_router.post("/transfer", response_model=TransactionOut, dependencies=[Depends(rate_limit("transfer"))])
+async def transfer_funds_async(
+    req: TransferRequest,
+    idempotency_key: Optional[str] = IdempotencyKeyHeader,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    recipient = await async_crud.get_user_by_username(db, req.recipient_username)
+    if not recipient:
+        raise HTTPException(status_code=404, detail="Recipient not found")
+    fp = fingerprint("/transfer", req)
+    return await run_idempotent_async(
+        db, user, idempotency_key, fp, lambda: async_crud.transfer(db, user, recipient, req.amount)
     )
-    return {
-        "balance": user.wallet.balance,
-        "transactions": [
-            {
-                "id": txn.id,
-                "type": txn.type,
-                "amount": txn.amount,
-                "timestamp": txn.timestamp,
-                "flagged": txn.flagged,
-                "flag_reason": txn.flag_reason,
-            }
-            for txn in transactions
-        ]
-    }
+
+@async_router.post("/transactions/batch", response_model=BatchResponse)
+async def apply_transaction_batch_async(
+    req: BatchRequest,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    _check_batch_size(req)
+    return {"results": await async_crud.apply_batch(db, user, req.items)}
+
+@async_router.get("/wallet/balance")
+async def get_my_balance_async(
+    principal: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if principal.wallet_id is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    balance = await db.scalar(select(Wallet.balance).where(Wallet.id == principal.wallet_id))
+    return {"balance": to_major(balance)}
+
+@async_router.get("/wallet/balance-at")
+async def get_my_balance_at_async(
+    at: datetime,
+    principal: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_user_read_db_async)
+):
+    if principal.wallet_id is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return {"balance": to_major(await db.run_sync(balance_at, principal.wallet_id, at)), "at": at}
+
+@async_router.get("/wallet/history", response_model=WalletOut)
+async def get_my_wallet_history_async(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    stream: bool = False,
+    principal: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_user_read_db_async)
+):
+    if principal.wallet_id is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    if stream:
+        return stream_history_async(principal.wallet_id, cursor, since, until, principal.user_id)
+    return await db.run_sync(_wallet_history, principal.wallet_id, limit, cursor, since, until)
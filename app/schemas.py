@@ -1,6 +1,11 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, BeforeValidator, PlainSerializer, WithJsonSchema
+from typing import Annotated, Optional, List
 import datetime
+from app.money import to_major, to_minor
+
+# Amounts are decimal currency units on the wire and integer minor units inside the app.
+MoneyIn = Annotated[int, BeforeValidator(to_minor), WithJsonSchema({"type": "number"})]
+MoneyOut = Annotated[int, PlainSerializer(to_major, return_type=float), WithJsonSchema({"type": "number"})]
 
 class UserCreate(BaseModel):
     username: str
@@ -16,19 +21,19 @@ class Token(BaseModel):
     
 class TransferRequest(BaseModel):
     recipient_username: str
-    amount: float
+    amount: MoneyIn
     
 
 class TransactionCreate(BaseModel):
     type: str  # deposit, withdraw, transfer
-    amount: float
+    amount: MoneyIn
     target_username: Optional[str] = None
 
 # schemas.py
 class TransactionOut(BaseModel):
     id: int
     type: str
-    amount: float
+    amount: MoneyOut
     timestamp: datetime.datetime
     flagged: bool
     flag_reason: Optional[str] = None  # <-- add this line
@@ -36,6 +41,39 @@ class TransactionOut(BaseModel):
     class Config:
         orm_mode = True
 
+def transaction_json(row) -> dict:
+    """TransactionOut as JSON-ready data, straight from a history row mapping without model validation.
+
+    Read endpoints that return many rows use this with ORJSONResponse; the
+    output is byte-for-byte what the TransactionOut model would produce.
+    """
+    return {
+        "id": row["id"],
+        "type": row["type"],
+        "amount": to_major(row["amount"]),
+        "timestamp": row["timestamp"],
+        "flagged": row["flagged"],
+        "flag_reason": row["flag_reason"],
+    }
+
 class WalletOut(BaseModel):
-    balance: float
+    balance: MoneyOut
     transactions: List[TransactionOut]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
+
+class BatchItem(BaseModel):
+    type: str  # deposit, withdraw, transfer
+    amount: MoneyIn
+    recipient_username: Optional[str] = None  # transfers only
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    transaction: Optional[TransactionOut] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
@@ -0,0 +1,190 @@
+"""Background jobs: what runs on which schedule, and which worker runs them.
+
+Every job is registered here with `@task`. Only one worker process runs them:
+the one holding the `scheduler_leases` row. Every worker keeps one small
+thread that renews the lease if it holds it, or takes it over once the
+holder has stopped renewing (crashed, hung, or shut down). The holder starts
+the APScheduler scheduler; the other workers only handle requests.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app.alerts import dispatch_alerts
+from app.archive import archive_job
+from app.checkpoints import checkpoint_job, reconcile
+from app.config import (
+    ALERT_DISPATCH_INTERVAL_SECONDS, ARCHIVE_INTERVAL_SECONDS, BALANCE_CHECKPOINT_INTERVAL_SECONDS,
+    FRAUD_REPORT_INTERVAL_SECONDS, RECONCILE_INTERVAL_SECONDS, SCHEDULER_HEARTBEAT_SECONDS, SCHEDULER_LEASE_SECONDS,
+)
+from app.database import SessionLocal, read_engine, read_sessionmaker
+from app.fraud_report import report_job
+from app.idempotency import purge_expired
+from app.models import SchedulerLease
+
+# --- Registry ---
+
+@dataclass(frozen=True)
+class Task:
+    name: str
+    func: Callable[..., None]
+    seconds: float
+    # When set, the job also runs once as soon as a worker starts the scheduler, with these arguments.
+    startup_kwargs: Optional[dict] = None
+
+TASKS: Dict[str, Task] = {}
+
+def task(name: str, seconds: float, startup_kwargs: Optional[dict] = None):
+    def register(func):
+        TASKS[name] = Task(name, func, seconds, startup_kwargs)
+        return func
+    return register
+
+@task("fraud_report", FRAUD_REPORT_INTERVAL_SECONDS, startup_kwargs={"catch_up": True})
+def daily_fraud_report(catch_up: bool = False):
+    # The scan reads from the replica (within the staleness bound); summaries go to the primary.
+    with SessionLocal() as db, read_sessionmaker()() as read_db:
+        result = report_job(db, catch_up=catch_up, read_db=read_db)
+    if result and result["rows"]:
+        print(f"[FRAUD REPORT] processed {result['rows']} new transactions in {result['batches']} batches")
+
+@task("alerts", ALERT_DISPATCH_INTERVAL_SECONDS)
+def deliver_alerts():
+    with SessionLocal() as db:
+        dispatch_alerts(db)
+
+@task("idempotency_purge", 3600)
+def purge_idempotency_keys():
+    with SessionLocal() as db:
+        purge_expired(db)
+
+@task("balance_checkpoints", BALANCE_CHECKPOINT_INTERVAL_SECONDS, startup_kwargs={"catch_up": True})
+def balance_checkpoints(catch_up: bool = False):
+    with SessionLocal() as db:
+        result = checkpoint_job(db, catch_up=catch_up)
+    if result and result["wallets"]:
+        print(f"[CHECKPOINTS] checkpointed {result['wallets']} wallets from {result['rows']} transactions")
+
+@task("reconcile", RECONCILE_INTERVAL_SECONDS)
+def reconcile_balances():
+    result = reconcile(read_engine)
+    for m in result["mismatches"]:
+        print(f"[RECONCILE] wallet {m['wallet_id']}: balance {m['balance']}, expected {m['expected']}")
+
+@task("archive", ARCHIVE_INTERVAL_SECONDS)
+def archive_transactions():
+    with SessionLocal() as db:
+        result = archive_job(db)
+    if result and result["rows"]:
+        print(f"[ARCHIVE] moved {result['rows']} transactions in {result['batches']} batches")
+
+def build_scheduler() -> BackgroundScheduler:
+    scheduler = BackgroundScheduler()
+    for t in TASKS.values():
+        scheduler.add_job(t.func, 'interval', seconds=t.seconds, max_instances=1, id=t.name)
+        if t.startup_kwargs is not None:
+            # Work through whatever accumulated while no worker was running jobs.
+            scheduler.add_job(t.func, kwargs=t.startup_kwargs, id=f"{t.name}:startup")
+    return scheduler
+
+# --- Leader election ---
+
+class Leader:
+    """Holds or waits for the scheduler lease; runs the scheduler while holding it."""
+
+    def __init__(self, name: str = "scheduler", lease_seconds: float = SCHEDULER_LEASE_SECONDS,
+                 heartbeat_seconds: float = SCHEDULER_HEARTBEAT_SECONDS):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.scheduler: Optional[BackgroundScheduler] = None
+        self._valid_until = 0.0  # monotonic time our lease runs out if it is not renewed
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.scheduler is not None
+
+    def try_acquire(self) -> bool:
+        """Renew our lease, or take it over if it is free or expired; True if we hold it afterwards."""
+        now = datetime.utcnow()
+        values = dict(holder=self.holder, expires_at=now + timedelta(seconds=self.lease_seconds), updated_at=now)
+        with SessionLocal() as db:
+            # A single conditional UPDATE, so two workers can never both take an expired lease.
+            held = db.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name)
+                .where(or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now))
+                .values(**values)
+            ).rowcount == 1
+            if not held and db.get(SchedulerLease, self.name) is None:
+                try:
+                    with db.begin_nested():
+                        db.add(SchedulerLease(name=self.name, **values))
+                    held = True
+                except IntegrityError:
+                    pass
+            db.commit()
+        return held
+
+    def release(self) -> None:
+        with SessionLocal() as db:
+            db.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+                .values(expires_at=datetime.utcnow())
+            )
+            db.commit()
+
+    def tick(self) -> None:
+        started = time.monotonic()
+        try:
+            held = self.try_acquire()
+        except SQLAlchemyError as exc:
+            print(f"[SCHEDULER] could not reach the lease: {getattr(exc, 'orig', exc)}")
+            # Keep running only while the lease we last renewed is still ours.
+            held = self.is_leader and started < self._valid_until
+        else:
+            if held:
+                self._valid_until = started + self.lease_seconds
+        if held and self.scheduler is None:
+            self.scheduler = build_scheduler()
+            self.scheduler.start()
+            print(f"[SCHEDULER] {self.holder} is running background jobs")
+        elif not held and self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+            print(f"[SCHEDULER] {self.holder} lost the lease; background jobs stopped here")
+
+    def _run(self) -> None:
+        self.tick()
+        while not self._stop.wait(self.heartbeat_seconds):
+            self.tick()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="scheduler-lease", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the jobs and hand the lease back so another worker takes over without waiting for expiry."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+            try:
+                self.release()
+            except SQLAlchemyError:
+                pass
+
+leader = Leader()
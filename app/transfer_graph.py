@@ -0,0 +1,319 @@
+"""Transfer graph: who sent money to whom recently, checked as each transfer arrives.
+
+    python -m app.transfer_graph [--max-length 4] [--budget-seconds 30] [--since 2026-01-01]
+
+The live graph keeps transfers from the last TRANSFER_GRAPH_WINDOW_MINUTES in
+time buckets, with per-wallet outgoing and incoming adjacency. Committed
+transfers are added (staged on the session like the balance aggregates) and
+whole buckets expire as time moves on. `check` looks at a new transfer
+against it for:
+
+- a short cycle: the recipient already reaches the sender in a few hops;
+- fan-in / fan-out bursts: many distinct counterparties in a short time;
+- a pass-through chain: money moved on quickly, hop after hop, at a similar amount.
+
+Each search is bounded by TRANSFER_GRAPH_MAX_VISITS. The command-line batch
+mode enumerates every ring in the whole history within a time budget.
+"""
+import argparse
+import threading
+import time
+from collections import ChainMap, deque
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app.config import (
+    TRANSFER_GRAPH_WINDOW_MINUTES, TRANSFER_GRAPH_BUCKET_SECONDS, TRANSFER_GRAPH_MAX_CYCLE_LENGTH,
+    TRANSFER_GRAPH_FAN_THRESHOLD, TRANSFER_GRAPH_BURST_MINUTES, TRANSFER_GRAPH_CHAIN_HOPS,
+    TRANSFER_GRAPH_PASS_THROUGH_MINUTES, TRANSFER_GRAPH_PASS_THROUGH_RATIO, TRANSFER_GRAPH_MAX_VISITS,
+)
+from app.metrics import rule_hits, timer
+from app.models import Transaction
+
+CYCLE = "Circular transfer flow"
+FAN_IN = "Fan-in transfer burst"
+FAN_OUT = "Fan-out transfer burst"
+PASS_THROUGH = "Rapid pass-through chain"
+# Reasons owned by the graph rather than the rule engine; app.rescore keeps them.
+GRAPH_REASONS = {CYCLE: "cycle", FAN_IN: "fan_in", FAN_OUT: "fan_out", PASS_THROUGH: "pass_through"}
+
+EPOCH = datetime(1970, 1, 1)
+
+def _seconds(ts: datetime) -> float:
+    return (ts - EPOCH).total_seconds()
+
+class TransferGraph:
+    """Recent transfers as a directed graph of wallets; edges are (src, dst, amount, seconds)."""
+
+    def __init__(self, window_minutes: float = TRANSFER_GRAPH_WINDOW_MINUTES, bucket_seconds: float = TRANSFER_GRAPH_BUCKET_SECONDS):
+        self.window = window_minutes * 60
+        self.bucket_seconds = bucket_seconds
+        self.built = False
+        self._buckets: deque = deque()  # (bucket number, [edges]) oldest first
+        self._out: Dict[int, Dict[int, List[tuple]]] = {}
+        self._in: Dict[int, Dict[int, List[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, db: Session) -> None:
+        """Load the transfers inside the window from the database, replacing the current graph."""
+        since = datetime.utcnow() - timedelta(seconds=self.window)
+        rows = db.execute(
+            select(Transaction.wallet_id, Transaction.target_wallet_id, Transaction.amount, Transaction.timestamp)
+            .where(
+                Transaction.type == "transfer", Transaction.deleted == False,
+                Transaction.target_wallet_id.is_not(None), Transaction.timestamp >= since,
+            )
+            .order_by(Transaction.timestamp, Transaction.id)
+        ).all()
+        with self._lock:
+            self._buckets.clear()
+            self._out.clear()
+            self._in.clear()
+            for src, dst, amount, ts in rows:
+                self._add((src, dst, amount, _seconds(ts)))
+            self.built = True
+
+    def ensure_built(self, db: Session) -> None:
+        if not self.built:
+            self.rebuild(db)
+
+    def _add(self, edge: tuple) -> None:
+        src, dst, _, at = edge
+        bucket = int(at // self.bucket_seconds)
+        if self._buckets and self._buckets[-1][0] >= bucket:
+            # Out-of-order commits land in the newest bucket; it expires last.
+            self._buckets[-1][1].append(edge)
+        else:
+            self._buckets.append((bucket, [edge]))
+        self._out.setdefault(src, {}).setdefault(dst, []).append(edge)
+        self._in.setdefault(dst, {}).setdefault(src, []).append(edge)
+        self._expire(at)
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window
+        while self._buckets and (self._buckets[0][0] + 1) * self.bucket_seconds <= cutoff:
+            _, edges = self._buckets.popleft()
+            for src, dst, _, _ in edges:
+                self._prune(self._out, src, dst, cutoff)
+                self._prune(self._in, dst, src, cutoff)
+
+    @staticmethod
+    def _prune(index, a: int, b: int, cutoff: float) -> None:
+        neighbours = index.get(a)
+        if neighbours is None or b not in neighbours:
+            return
+        kept = [e for e in neighbours[b] if e[3] > cutoff]
+        if kept:
+            neighbours[b] = kept
+        else:
+            del neighbours[b]
+            if not neighbours:
+                del index[a]
+
+    def stage(self, db: Session, src: int, dst: int, amount: int, ts: datetime) -> None:
+        """Record a transfer to add once `db` commits (dropped on rollback)."""
+        db.info.setdefault("transfer_edges", []).append((src, dst, amount, _seconds(ts)))
+
+    @staticmethod
+    def staged(db: Session) -> List[tuple]:
+        """Transfers staged on `db` that are not committed yet."""
+        return db.info.get("transfer_edges", [])
+
+    def transfer_committed(self, edge: tuple) -> None:
+        if not self.built:
+            return
+        with self._lock:
+            self._add(edge)
+
+    def transfer_removed(self, src: int, dst: int, amount: int, ts: datetime) -> None:
+        """Forget a soft-deleted transfer."""
+        edge = (src, dst, amount, _seconds(ts))
+        with self._lock:
+            for index, a, b in ((self._out, src, dst), (self._in, dst, src)):
+                edges = index.get(a, {}).get(b)
+                if edges and edge in edges:
+                    edges.remove(edge)
+                    if not edges:
+                        self._prune(index, a, b, float("inf"))
+
+    def check(self, src: int, dst: int, amount: int, ts: datetime, pending: Iterable[tuple] = ()) -> List[str]:
+        """Graph reasons to flag a new transfer src -> dst, given the recent transfers.
+
+        `pending` are edges not committed yet (see `staged`), such as earlier
+        items of the same batch; they count as if they were in the graph.
+        """
+        if src == dst:
+            return []
+        now = _seconds(ts)
+        reasons = []
+        with timer("fraud.transfer_graph"), self._lock:
+            out, inc = self._out, self._in
+            if pending:
+                out, inc = self._overlay(self._out, pending, 0, 1), self._overlay(self._in, pending, 1, 0)
+            if self._reaches(out, dst, src, TRANSFER_GRAPH_MAX_CYCLE_LENGTH - 1, now - self.window):
+                reasons.append(CYCLE)
+            burst_since = now - TRANSFER_GRAPH_BURST_MINUTES * 60
+            if self._distinct(inc.get(dst, {}), src, burst_since) >= TRANSFER_GRAPH_FAN_THRESHOLD:
+                reasons.append(FAN_IN)
+            if self._distinct(out.get(src, {}), dst, burst_since) >= TRANSFER_GRAPH_FAN_THRESHOLD:
+                reasons.append(FAN_OUT)
+            if self._pass_through_hops(inc, src, amount, now) >= TRANSFER_GRAPH_CHAIN_HOPS:
+                reasons.append(PASS_THROUGH)
+        for reason in reasons:
+            rule_hits.inc(f"transfer_graph.{GRAPH_REASONS[reason]}")
+        return reasons
+
+    @staticmethod
+    def _overlay(index, edges: Iterable[tuple], a: int, b: int):
+        """`index` with `edges` added, copying only the wallets they touch."""
+        extra: Dict[int, Dict[int, List[tuple]]] = {}
+        for edge in edges:
+            node = edge[a]
+            if node not in extra:
+                extra[node] = {other: list(e) for other, e in index.get(node, {}).items()}
+            extra[node].setdefault(edge[b], []).append(edge)
+        return ChainMap(extra, index)
+
+    @staticmethod
+    def _distinct(neighbours: dict, new: int, since: float) -> int:
+        """Distinct counterparties since `since`, counting the new transfer's."""
+        return 1 + sum(1 for other, edges in neighbours.items() if other != new and edges[-1][3] >= since)
+
+    @staticmethod
+    def _reaches(out, start: int, goal: int, max_hops: int, since: float) -> bool:
+        """Whether `goal` is reachable from `start` in at most `max_hops` recent transfers."""
+        frontier, seen, visits = [start], {start}, 0
+        for _ in range(max_hops):
+            following = []
+            for node in frontier:
+                for nxt, edges in out.get(node, {}).items():
+                    visits += 1
+                    if visits > TRANSFER_GRAPH_MAX_VISITS:
+                        return False
+                    if edges[-1][3] < since or nxt in seen:
+                        continue
+                    if nxt == goal:
+                        return True
+                    seen.add(nxt)
+                    following.append(nxt)
+            frontier = following
+        return False
+
+    @staticmethod
+    def _pass_through_hops(inc, wallet: int, amount: int, now: float) -> int:
+        """How many hops back the money reached `wallet` quickly and at a similar amount."""
+        gap = TRANSFER_GRAPH_PASS_THROUGH_MINUTES * 60
+        hops, visits, seen = 0, 0, {wallet}
+        while hops < TRANSFER_GRAPH_CHAIN_HOPS:
+            best = None
+            for sender, edges in inc.get(wallet, {}).items():
+                for edge in reversed(edges):
+                    visits += 1
+                    if visits > TRANSFER_GRAPH_MAX_VISITS or edge[3] < now - gap:
+                        break
+                    if edge[3] <= now and sender not in seen and edge[2] * TRANSFER_GRAPH_PASS_THROUGH_RATIO <= amount <= edge[2]:
+                        if best is None or edge[3] > best[3]:
+                            best = edge
+                        break
+            if best is None:
+                break
+            hops += 1
+            wallet, amount, now = best[0], best[2], best[3]
+            seen.add(wallet)
+        return hops
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "wallets": len(set(self._out) | set(self._in)),
+                "edges": sum(len(edges) for neighbours in self._out.values() for edges in neighbours.values()),
+                "buckets": len(self._buckets),
+            }
+
+transfer_graph = TransferGraph()
+
+@event.listens_for(Session, "after_commit")
+def _apply_staged(session: Session) -> None:
+    for edge in session.info.pop("transfer_edges", ()):
+        transfer_graph.transfer_committed(edge)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_staged(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop("transfer_edges", None)
+
+# --- Batch mode ---
+
+def find_rings(db: Session, max_length: int = TRANSFER_GRAPH_MAX_CYCLE_LENGTH, budget_seconds: float = 30.0,
+               since: Optional[datetime] = None) -> dict:
+    """Every simple cycle of up to `max_length` wallets in the transfer history.
+
+    Transfers are collapsed to one edge per (sender, recipient) pair. Each ring
+    is reported once, starting from its smallest wallet id. The search stops
+    when the time budget runs out, and `complete` says whether it finished.
+    """
+    deadline = time.monotonic() + budget_seconds
+    stmt = (
+        select(Transaction.wallet_id, Transaction.target_wallet_id, func.count(), func.sum(Transaction.amount))
+        .where(Transaction.type == "transfer", Transaction.deleted == False, Transaction.target_wallet_id.is_not(None))
+        .group_by(Transaction.wallet_id, Transaction.target_wallet_id)
+    )
+    if since is not None:
+        stmt = stmt.where(Transaction.timestamp >= since)
+    pairs = {}
+    out: Dict[int, List[int]] = {}
+    for src, dst, count, total in db.execute(stmt):
+        if src != dst:
+            pairs[(src, dst)] = (count, total)
+            out.setdefault(src, []).append(dst)
+
+    rings, complete = [], True
+    for start in sorted(out):
+        # Depth-first over wallets with a larger id than `start`, so each ring is found once.
+        stack = [(start, iter(out[start]))]
+        path = [start]
+        while stack:
+            if time.monotonic() > deadline:
+                complete = False
+                break
+            node, neighbours = stack[-1]
+            nxt = next(neighbours, None)
+            if nxt is None:
+                stack.pop()
+                path.pop()
+            elif nxt == start:
+                edges = list(zip(path, path[1:] + [start]))
+                rings.append({
+                    "wallets": list(path),
+                    "transfers": sum(pairs[e][0] for e in edges),
+                    "amount": min(pairs[e][1] for e in edges),
+                })
+            elif nxt > start and nxt not in path and len(path) < max_length:
+                stack.append((nxt, iter(out.get(nxt, ()))))
+                path.append(nxt)
+        if not complete:
+            break
+    return {"rings": rings, "complete": complete, "pairs": len(pairs)}
+
+def main():
+    from app.database import SessionLocal
+    from app.money import to_major
+
+    parser = argparse.ArgumentParser(description="Find transfer rings over the whole transaction history.")
+    parser.add_argument("--max-length", type=int, default=TRANSFER_GRAPH_MAX_CYCLE_LENGTH, help="most wallets in a ring")
+    parser.add_argument("--budget-seconds", type=float, default=30.0)
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only transfers from this time on")
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        result = find_rings(db, args.max_length, args.budget_seconds, args.since)
+    for ring in result["rings"]:
+        path = " -> ".join(str(w) for w in ring["wallets"] + ring["wallets"][:1])
+        print(f"{path}  ({ring['transfers']} transfers, at least {to_major(ring['amount'])} around the ring)")
+    print(
+        f"{len(result['rings'])} rings among {result['pairs']} sender/recipient pairs"
+        + ("" if result["complete"] else " (time budget reached, search incomplete)")
+    )
+
+if __name__ == "__main__":
+    main()
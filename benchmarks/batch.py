@@ -0,0 +1,54 @@
+"""Transactions/sec: one request per deposit vs. POST /transactions/batch.
+
+    python -m benchmarks.batch --transactions 2000 --batch-size 500
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+async def _run(transactions, batch_size):
+    import httpx
+    from app.auth import create_access_token
+    from app.crud import create_user
+    from app.database import Base, engine, SessionLocal
+    from app.main import app
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        create_user(db, "single", "x")
+        create_user(db, "batch", "x")
+    single = {"Authorization": f"Bearer {create_access_token({'sub': 'single'})}"}
+    batch = {"Authorization": f"Bearer {create_access_token({'sub': 'batch'})}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        for _ in range(transactions):
+            await client.post("/deposit", json={"type": "deposit", "amount": 1}, headers=single)
+        single_rate = transactions / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for offset in range(0, transactions, batch_size):
+            items = [{"type": "deposit", "amount": 1}] * min(batch_size, transactions - offset)
+            await client.post("/transactions/batch", json={"items": items}, headers=batch)
+        batch_rate = transactions / (time.perf_counter() - started)
+    return single_rate, batch_rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="vaultguard-bench-"), "bench.db"))
+    with contextlib.redirect_stdout(io.StringIO()):  # silence mock email alerts
+        single_rate, batch_rate = asyncio.run(_run(args.transactions, args.batch_size))
+    print(f"single: {single_rate:8.0f} txn/s")
+    print(f"batch:  {batch_rate:8.0f} txn/s  ({batch_rate / single_rate:.1f}x)")
+
+if __name__ == "__main__":
+    main()
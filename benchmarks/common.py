@@ -0,0 +1,59 @@
+"""Shared helpers for the benchmark scripts: throwaway databases, seeding and timing."""
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import User, Wallet
+
+# How SQLAlchemy stores DateTime in SQLite; raw inserts must match it to sort correctly.
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def temp_database(path=None):
+    """Create a fresh SQLite file with the app schema and return (engine, Session)."""
+    path = path or os.path.join(tempfile.mkdtemp(prefix="vaultguard-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def create_users(db, count, prefix="user", balance=0):
+    """Create `count` users with wallets and return the User objects."""
+    users = [User(username=f"{prefix}{i}", hashed_password="x") for i in range(count)]
+    db.add_all(users)
+    db.flush()
+    db.add_all([Wallet(user_id=u.id, balance=balance) for u in users])
+    db.commit()
+    return users
+
+def seed_history(engine, wallet_id, rows, amount=10_000, chunk=50_000):
+    """Bulk insert `rows` old, unflagged transactions (amount in minor units) for one wallet."""
+    start = datetime.utcnow() - timedelta(days=365)
+    sql = (
+        "INSERT INTO transactions (wallet_id, type, amount, timestamp, flagged, deleted) "
+        "VALUES (?, 'deposit', ?, ?, 0, 0)"
+    )
+    with engine.begin() as conn:
+        for offset in range(0, rows, chunk):
+            batch = [
+                (wallet_id, amount, (start + timedelta(seconds=i)).strftime(TIMESTAMP_FORMAT))
+                for i in range(offset, min(offset + chunk, rows))
+            ]
+            conn.exec_driver_sql(sql, batch)
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def time_calls(fn, repeat):
+    """Call `fn` `repeat` times and return per-call latencies in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
@@ -0,0 +1,86 @@
+"""Compare sync (threadpool) and async (AsyncSession) request handling under concurrency.
+
+    python -m benchmarks.concurrency --requests 1000 --concurrency 100
+
+Each mode runs in its own interpreter because DB_MODE is read at import time.
+Requests go through the ASGI app in-process, so no network stack is measured.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import percentile
+
+async def _drive(requests, concurrency, write_ratio):
+    import httpx
+    from app.auth import create_access_token
+    from app.crud import create_user
+    from app.database import Base, engine, SessionLocal
+    from app.main import app
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = create_user(db, "bench", "x")
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
+
+    latencies, errors = [], 0
+    gate = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i):
+            nonlocal errors
+            async with gate:
+                started = time.perf_counter()
+                if i % 100 < write_ratio * 100:
+                    resp = await client.post("/deposit", json={"type": "deposit", "amount": 1}, headers=headers)
+                else:
+                    resp = await client.get("/wallet/balance", headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += resp.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+    return {
+        "mode": os.environ["DB_MODE"],
+        "requests": requests,
+        "errors": errors,
+        "req_per_sec": requests / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="share of requests that are deposits")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):  # silence mock email alerts
+            result = asyncio.run(_drive(args.requests, args.concurrency, args.write_ratio))
+        print(json.dumps(result))
+        return
+
+    for mode in ("sync", "async"):
+        path = os.path.join(tempfile.mkdtemp(prefix="vaultguard-bench-"), "bench.db")
+        env = dict(os.environ, RATE_LIMIT_ENABLED="false", DB_MODE=mode, DATABASE_URL=f"sqlite:///{path}")
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.concurrency", "--child",
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+             "--write-ratio", str(args.write_ratio)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['mode']:>5}: {r['req_per_sec']:8.0f} req/s  p50 {r['p50_ms']:7.1f} ms  p99 {r['p99_ms']:7.1f} ms  errors {r['errors']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Concurrent deposits, withdrawals and transfers on a handful of hot wallets.
+
+    python -m benchmarks.contention --threads 16 --ops 200 --wallets 4
+
+Every thread drives crud directly with its own session. At the end each
+wallet's balance must equal its opening balance plus the sum of the
+transactions recorded for it, and no balance may be negative.
+"""
+import argparse
+import contextlib
+import io
+import random
+import threading
+import time
+from fastapi import HTTPException
+from sqlalchemy import case, func, select
+from benchmarks.common import temp_database, create_users
+from app import crud
+from app.models import Transaction, User, Wallet
+
+OPENING_BALANCE = 100_000  # minor units
+
+def _worker(Session, usernames, ops, seed, outcome, lock):
+    rng = random.Random(seed)
+    counts = {"ok": 0, "rejected": 0, "busy": 0}
+    with Session() as db:
+        users = {u.username: u for u in db.query(User).filter(User.username.in_(usernames))}
+        for _ in range(ops):
+            user = users[rng.choice(usernames)]
+            amount = rng.randint(1, 30_000)
+            kind = rng.choice(("deposit", "withdraw", "transfer", "transfer"))
+            try:
+                if kind == "deposit":
+                    crud.deposit(db, user, amount)
+                elif kind == "withdraw":
+                    crud.withdraw(db, user, amount)
+                else:
+                    crud.transfer(db, user, users[rng.choice(usernames)], amount)
+                counts["ok"] += 1
+            except HTTPException as exc:
+                db.rollback()
+                counts["busy" if exc.status_code == 503 else "rejected"] += 1
+    with lock:
+        for key, value in counts.items():
+            outcome[key] += value
+
+def _check(db, wallet_ids):
+    """Return (wallet_id, balance, expected) for every wallet whose balance disagrees with its history."""
+    credit = case(
+        (Transaction.type == "deposit", Transaction.amount),
+        else_=-Transaction.amount,
+    )
+    outgoing = dict(db.execute(
+        select(Transaction.wallet_id, func.sum(credit)).where(Transaction.wallet_id.in_(wallet_ids)).group_by(Transaction.wallet_id)
+    ).all())
+    incoming = dict(db.execute(
+        select(Transaction.target_wallet_id, func.sum(Transaction.amount))
+        .where(Transaction.type == "transfer", Transaction.target_wallet_id.in_(wallet_ids))
+        .group_by(Transaction.target_wallet_id)
+    ).all())
+    bad = []
+    for wallet_id, balance in db.execute(select(Wallet.id, Wallet.balance).where(Wallet.id.in_(wallet_ids))):
+        expected = OPENING_BALANCE + outgoing.get(wallet_id, 0) + incoming.get(wallet_id, 0)
+        if balance < 0 or balance != expected:
+            bad.append((wallet_id, balance, expected))
+    return bad
+
+def run(threads, ops, wallets):
+    engine, Session = temp_database()
+    with Session() as db:
+        users = create_users(db, wallets, prefix="hot", balance=OPENING_BALANCE)
+        usernames = [u.username for u in users]
+        wallet_ids = [u.wallet.id for u in users]
+
+    outcome = {"ok": 0, "rejected": 0, "busy": 0}
+    lock = threading.Lock()
+    workers = [
+        threading.Thread(target=_worker, args=(Session, usernames, ops, seed, outcome, lock))
+        for seed in range(threads)
+    ]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    elapsed = time.perf_counter() - started
+
+    with Session() as db:
+        mismatches = _check(db, wallet_ids)
+    engine.dispose()
+    total = threads * ops
+    print(f"{threads} threads x {ops} ops on {wallets} wallets: {total / elapsed:.0f} ops/s")
+    print(f"  committed {outcome['ok']}, rejected (insufficient funds) {outcome['rejected']}, gave up after retries {outcome['busy']}")
+    print(f"  balance mismatches: {len(mismatches)} {mismatches[:5] if mismatches else ''}")
+    return {"ops_per_sec": total / elapsed, **outcome, "mismatches": len(mismatches)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=200, help="operations per thread")
+    parser.add_argument("--wallets", type=int, default=4)
+    args = parser.parse_args()
+    result = run(args.threads, args.ops, args.wallets)
+    raise SystemExit(1 if result["mismatches"] else 0)
+
+if __name__ == "__main__":
+    main()
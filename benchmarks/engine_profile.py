@@ -0,0 +1,108 @@
+"""Read/write throughput with the stock engine settings vs. the tuned profile.
+
+    python -m benchmarks.engine_profile --seconds 5 --readers 8 --writers 4
+
+Writer threads deposit into their own wallets while reader threads page
+through wallet history. Each profile runs in its own interpreter because the
+engine is built at import time.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+def _drive(seconds, readers, writers):
+    from fastapi import HTTPException
+    from sqlalchemy.exc import OperationalError
+    from app import crud
+    from app.database import Base, SessionLocal, describe_engine, engine
+    from app.models import User
+    from benchmarks.common import create_users, seed_history
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        users = create_users(db, writers, prefix="writer")
+        wallet_ids = [u.wallet.id for u in users]
+    for wallet_id in wallet_ids:
+        seed_history(engine, wallet_id, 5_000)
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(username):
+        with SessionLocal() as db:
+            user = db.query(User).filter(User.username == username).one()
+            while time.perf_counter() < deadline:
+                try:
+                    crud.deposit(db, user, 100)
+                    bump("writes")
+                except (HTTPException, OperationalError):
+                    db.rollback()
+                    bump("errors")
+
+    def reader(index):
+        with SessionLocal() as db:
+            while time.perf_counter() < deadline:
+                try:
+                    crud.get_transaction_page(db, wallet_ids[index % len(wallet_ids)], 100)
+                    db.rollback()  # end the read transaction so WAL checkpoints can proceed
+                    bump("reads")
+                except OperationalError:
+                    db.rollback()
+                    bump("errors")
+
+    threads = [threading.Thread(target=writer, args=(u.username,)) for u in users]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    info = describe_engine(engine)
+    return {
+        "profile": os.environ["DB_PROFILE"],
+        "journal_mode": info.get("journal_mode"),
+        "reads_per_sec": counts["reads"] / seconds,
+        "writes_per_sec": counts["writes"] / seconds,
+        "errors": counts["errors"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_drive(args.seconds, args.readers, args.writers)))
+        return
+
+    for profile in ("stock", "tuned"):
+        path = os.path.join(tempfile.mkdtemp(prefix="vaultguard-bench-"), "bench.db")
+        env = dict(os.environ, DB_PROFILE=profile, DATABASE_URL=f"sqlite:///{path}")
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.engine_profile", "--child", "--seconds", str(args.seconds),
+             "--readers", str(args.readers), "--writers", str(args.writers)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"{r['profile']:>5} ({r['journal_mode']}): {r['reads_per_sec']:8.0f} reads/s "
+            f"{r['writes_per_sec']:8.0f} writes/s  errors {r['errors']}"
+        )
+
+if __name__ == "__main__":
+    main()
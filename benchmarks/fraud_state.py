@@ -0,0 +1,42 @@
+"""Deposit latency as wallet history grows.
+
+    python -m benchmarks.fraud_state --sizes 10 1000 100000 1000000
+
+With the running fraud state, per-write latency should stay flat regardless
+of how many rows the wallet already has.
+"""
+import argparse
+import contextlib
+import io
+from benchmarks.common import temp_database, create_users, seed_history, time_calls, percentile
+from app import crud
+
+def run(sizes, writes):
+    results = []
+    for size in sizes:
+        engine, Session = temp_database()
+        db = Session()
+        user = create_users(db, 1)[0]
+        seed_history(engine, user.wallet.id, size)
+        with contextlib.redirect_stdout(io.StringIO()):  # silence mock email alerts
+            crud.deposit(db, user, 10_000)  # first write builds the fraud state from history
+            latencies = time_calls(lambda: crud.deposit(db, user, 10_000), writes)
+        db.close()
+        engine.dispose()
+        results.append({
+            "history_rows": size,
+            "mean_ms": sum(latencies) / len(latencies),
+            "p95_ms": percentile(latencies, 95),
+        })
+        print(f"{size:>10} rows  mean {results[-1]['mean_ms']:.3f} ms  p95 {results[-1]['p95_ms']:.3f} ms")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1_000, 100_000, 1_000_000])
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.writes)
+
+if __name__ == "__main__":
+    main()
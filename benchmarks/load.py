@@ -0,0 +1,202 @@
+"""Mixed-endpoint load test against the ASGI app, with a regression check.
+
+    python -m benchmarks.load --users 100 --history 500 --requests 5000 --concurrency 50 --out run.json
+    python -m benchmarks.load --baseline run.json --tolerance 0.2   # exit 1 on regression
+
+A fresh SQLite database is seeded with `--users` users (wallet and
+`--history` old transactions each). Requests are drawn from `--mix` with a
+fixed `--seed`, so two runs issue the same sequence, and sent concurrently
+through the app in-process. Per endpoint the report has count, errors,
+throughput and p50/p95/p99 latency. With `--baseline`, an endpoint whose p95
+rises, or whose throughput falls, by more than `--tolerance` fails the run.
+The run happens in a child interpreter because settings are read at import.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import percentile
+
+DEFAULT_MIX = "register=2,login=3,deposit=25,withdraw=15,transfer=15,history=25,balance=10,admin=5"
+DEFAULT_MIX_NAMES = [part.split("=")[0] for part in DEFAULT_MIX.split(",")]
+PASSWORD = "bench-password"
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(DEFAULT_MIX_NAMES)
+    if unknown:
+        raise SystemExit(f"unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def _seed(users, history):
+    from app.auth import create_access_token, get_password_hash
+    from app.database import Base, engine, SessionLocal
+    from app.models import User
+    from benchmarks.common import create_users, seed_history
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        admin = User(username="bench-admin", hashed_password=get_password_hash(PASSWORD), is_admin=True)
+        db.add(admin)
+        db.commit()
+        seeded = create_users(db, users, prefix="bench", balance=10**9)
+        hashed = get_password_hash(PASSWORD)
+        for user in seeded:
+            user.hashed_password = hashed
+        db.commit()
+        names = [u.username for u in seeded]
+        wallet_ids = [u.wallet.id for u in seeded]
+        admin_name = admin.username
+    for wallet_id in wallet_ids:
+        seed_history(engine, wallet_id, history)
+    token = lambda name: {"Authorization": f"Bearer {create_access_token({'sub': name})}"}
+    return names, {name: token(name) for name in names}, token(admin_name)
+
+def _request(kind, rng, names, headers, admin_headers, i):
+    """(method, url, kwargs) for one request of `kind`."""
+    name = rng.choice(names)
+    if kind == "register":
+        return "POST", "/user/register", {"data": {"username": f"new{i}", "password": PASSWORD}}
+    if kind == "login":
+        return "POST", "/user/login", {"data": {"username": name, "password": PASSWORD}}
+    if kind in ("deposit", "withdraw"):
+        amount = rng.randint(1, 500)
+        return "POST", f"/{kind}", {"json": {"type": kind, "amount": amount}, "headers": headers[name]}
+    if kind == "transfer":
+        body = {"recipient_username": rng.choice(names), "amount": rng.randint(1, 500)}
+        return "POST", "/transfer", {"json": body, "headers": headers[name]}
+    if kind == "history":
+        return "GET", "/wallet/history", {"params": {"limit": 50}, "headers": headers[name]}
+    if kind == "balance":
+        return "GET", "/wallet/balance", {"headers": headers[name]}
+    url = rng.choice(["/admin/top-users", "/admin/total-balances", "/admin/flagged-transactions"])
+    return "GET", url, {"headers": admin_headers}
+
+async def _drive(args):
+    import httpx
+    from app import hashing
+    from app.main import app
+
+    names, headers, admin_headers = _seed(args.users, args.history)
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+    plan = [(kind, _request(kind, rng, names, headers, admin_headers, i)) for i, kind in enumerate(kinds)]
+
+    results = {kind: {"latencies": [], "errors": 0} for kind in mix}
+    gate = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(kind, method, url, kwargs):
+            async with gate:
+                started = time.perf_counter()
+                resp = await client.request(method, url, **kwargs)
+                results[kind]["latencies"].append((time.perf_counter() - started) * 1000)
+                # Insufficient funds is a legitimate answer, not a failure of the endpoint.
+                results[kind]["errors"] += resp.status_code >= 500 or resp.status_code in (401, 404, 422)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(kind, *req) for kind, req in plan))
+        elapsed = time.perf_counter() - started
+    hashing.shutdown()
+
+    endpoints = {}
+    for kind, r in results.items():
+        if not r["latencies"]:
+            continue
+        endpoints[kind] = {
+            "requests": len(r["latencies"]),
+            "errors": r["errors"],
+            "req_per_sec": len(r["latencies"]) / elapsed,
+            "p50_ms": percentile(r["latencies"], 50),
+            "p95_ms": percentile(r["latencies"], 95),
+            "p99_ms": percentile(r["latencies"], 99),
+        }
+    return {
+        "config": {k: getattr(args, k) for k in ("users", "history", "requests", "concurrency", "mix", "seed", "db_mode")},
+        "seconds": elapsed,
+        "req_per_sec": args.requests / elapsed,
+        "endpoints": endpoints,
+    }
+
+def compare(baseline, current, tolerance):
+    """Return a list of regressions of `current` against `baseline`."""
+    problems = []
+    if current["req_per_sec"] < baseline["req_per_sec"] * (1 - tolerance):
+        problems.append(f"overall: {current['req_per_sec']:.0f} req/s vs {baseline['req_per_sec']:.0f}")
+    for kind, base in baseline["endpoints"].items():
+        now = current["endpoints"].get(kind)
+        if now is None:
+            continue
+        if now["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{kind}: p95 {now['p95_ms']:.1f} ms vs {base['p95_ms']:.1f} ms")
+        if now["req_per_sec"] < base["req_per_sec"] * (1 - tolerance):
+            problems.append(f"{kind}: {now['req_per_sec']:.0f} req/s vs {base['req_per_sec']:.0f}")
+        if now["errors"] > base["errors"]:
+            problems.append(f"{kind}: {now['errors']} errors vs {base['errors']}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--history", type=int, default=200, help="seeded transactions per wallet")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,... (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db-mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="low by default so logins measure the app, not bcrypt")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    if args.child:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):  # silence mock email alerts
+            result = asyncio.run(_drive(args))
+        print(json.dumps(result))
+        return
+
+    path = os.path.join(tempfile.mkdtemp(prefix="vaultguard-bench-"), "bench.db")
+    env = dict(
+        os.environ, RATE_LIMIT_ENABLED="false", DB_MODE=args.db_mode, DATABASE_URL=f"sqlite:///{path}",
+        BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+    )
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.load", "--child", *sys.argv[1:]],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{'endpoint':>10} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for kind, r in sorted(result["endpoints"].items()):
+        print(
+            f"{kind:>10} {r['requests']:8d} {r['errors']:6d} {r['req_per_sec']:8.0f} "
+            f"{r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f}"
+        )
+    print(f"{'total':>10} {args.requests:8d} {'':>6} {result['req_per_sec']:8.0f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(json.load(f), result, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        raise SystemExit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Login throughput vs. bcrypt workers, and wallet latency during a login storm.
+
+    python -m benchmarks.login_storm --workers 1 2 4 --logins 64
+
+Each worker count runs in its own interpreter (BCRYPT_WORKERS is read at
+import time). While the logins run, one client polls /wallet/balance and its
+p99 is compared with the same poll on an idle server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import percentile
+
+async def _poll_balance(client, headers, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/wallet/balance", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.005)
+
+async def _drive(logins, concurrency, users):
+    import httpx
+    from app import hashing
+    from app.auth import create_access_token, get_password_hash
+    from app.database import Base, engine, SessionLocal
+    from app.main import app
+    from app.models import User, Wallet
+
+    Base.metadata.create_all(engine)
+    hashed = get_password_hash("secret")
+    with SessionLocal() as db:
+        rows = [User(username=f"user{i}", hashed_password=hashed) for i in range(users)]
+        db.add_all(rows)
+        db.flush()
+        db.add_all([Wallet(user_id=u.id) for u in rows])
+        db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'user0'})}"}
+
+    hashing.start()
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/user/login", data={"username": "user0", "password": "secret"})  # warm the pool
+
+        idle, stop = [], asyncio.Event()
+        poller = asyncio.create_task(_poll_balance(client, headers, stop, idle))
+        await asyncio.sleep(1)
+        stop.set()
+        await poller
+
+        gate = asyncio.Semaphore(concurrency)
+        statuses = []
+
+        async def login(i):
+            async with gate:
+                resp = await client.post("/user/login", data={"username": f"user{i % users}", "password": "secret"})
+                statuses.append(resp.status_code)
+
+        storm, stop = [], asyncio.Event()
+        poller = asyncio.create_task(_poll_balance(client, headers, stop, storm))
+        started = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await poller
+    hashing.shutdown()
+    return {
+        "workers": hashing.BCRYPT_WORKERS,
+        "logins_per_sec": logins / elapsed,
+        "login_errors": sum(s != 200 for s in statuses),
+        "balance_p99_idle_ms": percentile(idle, 99),
+        "balance_p99_storm_ms": percentile(storm, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_drive(args.logins, args.concurrency, args.users))))
+        return
+
+    for workers in args.workers:
+        path = os.path.join(tempfile.mkdtemp(prefix="vaultguard-bench-"), "bench.db")
+        env = dict(os.environ, RATE_LIMIT_ENABLED="false", BCRYPT_WORKERS=str(workers), DATABASE_URL=f"sqlite:///{path}")
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.login_storm", "--child", "--logins", str(args.logins),
+             "--concurrency", str(args.concurrency), "--users", str(args.users)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"workers {r['workers']:>2}: {r['logins_per_sec']:6.1f} logins/s  errors {r['login_errors']}  "
+            f"balance p99 idle {r['balance_p99_idle_ms']:6.1f} ms / storm {r['balance_p99_storm_ms']:6.1f} ms"
+        )
+
+if __name__ == "__main__":
+    main()
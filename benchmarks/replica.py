@@ -0,0 +1,121 @@
+"""Deposit latency while admin dashboards poll, with and without the read replica engine.
+
+    python -m benchmarks.replica --seconds 5 --writers 4 --pollers 16 --interval 0.2
+
+Writer threads deposit into their own wallets and record each call's
+latency. Poller threads loop over the admin reads (flagged transactions,
+top users by balance, a per-wallet aggregate over the whole table), pausing
+`--interval` seconds between rounds like a dashboard would, through
+`read_sessionmaker()`. That is the primary engine when REPLICA_ENABLED=false
+and the read-only pool otherwise. A run without pollers is the baseline.
+Each setting runs in its own interpreter because the engines are built at
+import time.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+def _drive(seconds, writers, pollers, users, interval):
+    from fastapi import HTTPException
+    from sqlalchemy import func, select
+    from sqlalchemy.exc import OperationalError
+    from app import crud
+    from app.admin import get_flagged_transactions, get_top_users
+    from app.database import Base, SessionLocal, engine, read_engine, read_sessionmaker
+    from app.models import Transaction, User
+    from benchmarks.common import create_users, percentile, seed_history
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        names = [u.username for u in create_users(db, writers, prefix="writer")]
+        wallet_ids = [u.wallet.id for u in create_users(db, users, prefix="holder", balance=10**6)]
+    for wallet_id in wallet_ids:
+        seed_history(engine, wallet_id, 200)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE transactions SET flagged = 1, flag_reason = 'odd_hour' WHERE id % 10 = 0")
+
+    latencies, polls, errors = [], [0], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def writer(username):
+        with SessionLocal() as db:
+            user = db.query(User).filter(User.username == username).one()
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    crud.deposit(db, user, 100)
+                except (HTTPException, OperationalError):
+                    db.rollback()
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+    def poller():
+        while time.perf_counter() < deadline:
+            with read_sessionmaker()() as db:
+                get_flagged_transactions(db, 100)
+                get_top_users(db, 500)
+                db.execute(
+                    select(Transaction.wallet_id, func.count(), func.sum(Transaction.amount)).group_by(Transaction.wallet_id)
+                ).all()
+            with lock:
+                polls[0] += 1
+            time.sleep(interval)
+
+    threads = [threading.Thread(target=writer, args=(name,)) for name in names]
+    threads += [threading.Thread(target=poller) for _ in range(pollers)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return {
+        "replica": read_engine is not engine,
+        "pollers": pollers,
+        "writes_per_sec": len(latencies) / seconds,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "polls_per_sec": polls[0] / seconds,
+        "errors": errors[0],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--pollers", type=int, default=16)
+    parser.add_argument("--users", type=int, default=500, help="wallets with seeded history for the admin reads to scan")
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds each poller waits between rounds")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_drive(args.seconds, args.writers, args.pollers, args.users, args.interval)))
+        return
+
+    for label, replica, pollers in (("no polling", "false", 0), ("shared engine", "false", args.pollers), ("replica", "true", args.pollers)):
+        path = os.path.join(tempfile.mkdtemp(prefix="vaultguard-bench-"), "bench.db")
+        env = dict(os.environ, REPLICA_ENABLED=replica, DATABASE_URL=f"sqlite:///{path}")
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.replica", "--child", "--seconds", str(args.seconds),
+             "--writers", str(args.writers), "--pollers", str(pollers), "--users", str(args.users), "--interval", str(args.interval)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"{label:>13}: {r['writes_per_sec']:7.0f} writes/s  p50 {r['p50_ms']:6.2f} ms  p99 {r['p99_ms']:7.2f} ms  "
+            f"{r['polls_per_sec']:6.1f} polls/s  errors {r['errors']}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+# The app builds its engines at import time; keep them away from ./wallet.db.
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="vaultguard-test-"), "wallet.db"))
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import User, Wallet
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as session:
+        yield session
+
+@pytest.fixture
+def make_users(db):
+    """make_users(count, prefix, balance): users with wallets holding `balance` minor units."""
+    def make(count, prefix="user", balance=0):
+        users = [User(username=f"{prefix}{i}", hashed_password="x") for i in range(count)]
+        db.add_all(users)
+        db.flush()
+        db.add_all([Wallet(user_id=u.id, balance=balance) for u in users])
+        db.commit()
+        return users
+    return make
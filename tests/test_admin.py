@@ -0,0 +1,54 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+from app import crud
+from app.admin import get_flagged_transactions, get_top_users
+from app.aggregates import total_balance
+from app.flag_counts import add_flag_counts
+from app.models import Transaction
+from app.schemas import BatchItem
+
+def test_top_users_never_include_the_password_hash(db, make_users):
+    make_users(3, balance=500)
+    users = get_top_users(db, 2)
+    assert len(users) == 2
+    assert all(set(u) == {"id", "username", "is_active", "is_admin", "deleted"} for u in users)
+
+def test_total_balance_is_shared_through_the_database(db, engine, make_users):
+    alice, bob = make_users(2)
+    crud.deposit(db, alice, 10_000)
+    crud.transfer(db, alice, bob, 2_500)
+    crud.withdraw(db, bob, 500)
+    crud.apply_batch(db, alice, [BatchItem(type="deposit", amount=1), BatchItem(type="transfer", amount=2, recipient_username="user1")])
+    # Another worker's session sees the same total.
+    with sessionmaker(bind=engine)() as other:
+        assert total_balance(other) == 10_000 - 500 + 100
+
+    crud.soft_delete_user(db, bob.id)
+    assert total_balance(db) == 7_500 - 100
+    crud.deposit(db, bob, 1_000)  # a stale user object does not put a deleted wallet back
+    assert total_balance(db) == 7_400
+
+def test_failed_write_leaves_the_total_alone(db, make_users):
+    (alice,) = make_users(1)
+    crud.deposit(db, alice, 1_000)
+    with pytest.raises(HTTPException):
+        crud.withdraw(db, alice, 5_000)
+    assert total_balance(db) == 1_000
+
+def test_reason_filter_matches_whole_reasons(db, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    reasons = ["Large deposit amount", "Odd, Large deposit amount", "Large deposit amount, Odd", "Very Odd", "Odd"]
+    db.add_all(Transaction(wallet_id=wallet_id, type="deposit", amount=1, flagged=True, flag_reason=r) for r in reasons)
+    add_flag_counts(db, reasons)
+    db.commit()
+    rows, _ = get_flagged_transactions(db, reason="Odd")
+    assert sorted(r["flag_reason"] for r in rows) == ["Large deposit amount, Odd", "Odd", "Odd, Large deposit amount"]
+    assert get_flagged_transactions(db, reason="Od") == ([], None)
+    assert get_flagged_transactions(db, reason="%") == ([], None)
+
+def test_flagged_transactions_need_an_admin():
+    from app.main import app
+    response = TestClient(app).get("/admin/flagged-transactions", params={"wallet_id": 1})
+    assert response.status_code == 401
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+import pytest
+from app import alerts
+from app.alerts import FakeSink, dispatch_alerts, enqueue_alert
+from app.config import ALERT_COLLAPSE_SECONDS, ALERT_MAX_ATTEMPTS
+from app.models import AlertOutbox
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls what app.alerts sees as the current time."""
+    class Clock(datetime):
+        now = T0
+
+        @classmethod
+        def utcnow(cls):
+            return cls.now
+
+    monkeypatch.setattr(alerts, "datetime", Clock)
+    return Clock
+
+def at(clock, seconds):
+    clock.now = T0 + timedelta(seconds=seconds)
+
+def test_alerts_for_one_wallet_within_the_window_are_one_message(db, clock, make_users):
+    w1, w2 = (u.wallet.id for u in make_users(2))
+    enqueue_alert(db, w1, "first")
+    at(clock, 10)
+    enqueue_alert(db, w1, "second")
+    enqueue_alert(db, w2, "other wallet")
+    db.commit()
+    sink = FakeSink()
+
+    at(clock, 5)
+    assert dispatch_alerts(db, sink)["sent"] == 0  # still held for the window
+
+    at(clock, ALERT_COLLAPSE_SECONDS)
+    result = dispatch_alerts(db, sink)
+    assert result == {"sent": 2, "failed": 0, "messages": 1, "dead": 0}
+    assert "2 alerts for wallet" in sink.sent[0][2]
+    assert "first" in sink.sent[0][2] and "second" in sink.sent[0][2]
+
+    at(clock, 10 + ALERT_COLLAPSE_SECONDS)
+    assert dispatch_alerts(db, sink)["messages"] == 1
+    assert sink.sent[1][2] == "other wallet"
+
+def test_alert_outside_the_window_is_a_separate_message(db, clock, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    enqueue_alert(db, wallet_id, "early")
+    at(clock, ALERT_COLLAPSE_SECONDS + 1)
+    enqueue_alert(db, wallet_id, "late")
+    db.commit()
+    sink = FakeSink()
+    result = dispatch_alerts(db, sink)
+    assert (result["sent"], result["messages"]) == (1, 1)
+    assert sink.sent == [(alerts.ADMIN_EMAIL, alerts.FLAGGED_SUBJECT, "early")]
+
+def test_failed_sends_back_off_exponentially(db, clock, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    enqueue_alert(db, wallet_id, "flaky")
+    db.commit()
+    sink = FakeSink(fail_times=2)
+
+    at(clock, ALERT_COLLAPSE_SECONDS)
+    assert dispatch_alerts(db, sink)["failed"] == 1
+    row = db.query(AlertOutbox).one()
+    first_retry = row.next_attempt_at - clock.now
+    assert row.attempts == 1
+
+    clock.now = row.next_attempt_at
+    assert dispatch_alerts(db, sink)["failed"] == 1
+    db.refresh(row)
+    assert row.attempts == 2
+    assert row.next_attempt_at - clock.now == 2 * first_retry
+
+    clock.now = row.next_attempt_at - timedelta(seconds=1)
+    assert dispatch_alerts(db, sink)["sent"] == 0  # not due yet
+    clock.now = row.next_attempt_at
+    assert dispatch_alerts(db, sink)["sent"] == 1
+    assert sink.sent[0][2] == "flaky"
+
+def test_alert_is_dead_lettered_after_max_attempts(db, clock, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    enqueue_alert(db, wallet_id, "never delivered")
+    db.commit()
+    sink = FakeSink(fail_times=ALERT_MAX_ATTEMPTS + 5)
+
+    at(clock, ALERT_COLLAPSE_SECONDS)
+    dead = 0
+    for _ in range(ALERT_MAX_ATTEMPTS):
+        dead += dispatch_alerts(db, sink)["dead"]
+        row = db.query(AlertOutbox).one()
+        clock.now = max(clock.now, row.next_attempt_at)
+    assert dead == 1
+    assert row.attempts == ALERT_MAX_ATTEMPTS
+    assert row.dead_at is not None and row.sent_at is None
+
+    clock.now += timedelta(days=365)
+    assert dispatch_alerts(db, sink) == {"sent": 0, "failed": 0, "messages": 0, "dead": 0}
+    assert sink.fail_times == 5  # not tried again
+
+def test_failed_send_leaves_held_rows_untouched(db, clock, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    enqueue_alert(db, wallet_id, "due")
+    at(clock, 10)
+    enqueue_alert(db, wallet_id, "held")
+    db.commit()
+    held = db.query(AlertOutbox).filter_by(message="held").one()
+    held_due = held.next_attempt_at
+
+    at(clock, ALERT_COLLAPSE_SECONDS)
+    assert dispatch_alerts(db, FakeSink(fail_times=1))["failed"] == 1
+    due = db.query(AlertOutbox).filter_by(message="due").one()
+    db.refresh(held)
+    assert due.attempts == 1 and due.next_attempt_at > clock.now
+    assert (held.attempts, held.next_attempt_at) == (0, held_due)
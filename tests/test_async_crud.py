@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app import async_crud, crud
+from app.config import WRITE_RETRY_ATTEMPTS
+
+def run(engine, work):
+    async def main():
+        async_engine = create_async_engine(str(engine.url).replace("sqlite://", "sqlite+aiosqlite://"))
+        try:
+            async with AsyncSession(async_engine, expire_on_commit=False) as db:
+                return await work(db)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+@pytest.fixture
+def no_blocking_sleep(monkeypatch):
+    def sleep(seconds):
+        raise AssertionError("blocking sleep on the event loop")
+    monkeypatch.setattr(crud.time, "sleep", sleep)
+
+def flaky(monkeypatch, failures):
+    calls = []
+    real = crud.deposit.__wrapped__
+
+    def deposit(db, user, amount):
+        calls.append(amount)
+        if len(calls) <= failures:
+            raise OperationalError("UPDATE wallets", {}, Exception("database is locked"))
+        return real(db, user, amount)
+
+    monkeypatch.setattr(crud.deposit, "__wrapped__", deposit)
+    return calls
+
+def test_async_write_retries_with_an_awaited_backoff(engine, make_users, monkeypatch, no_blocking_sleep):
+    calls = flaky(monkeypatch, failures=2)
+    username = make_users(1)[0].username
+
+    async def work(db):
+        user = await async_crud.get_user_by_username(db, username)
+        txn = await async_crud.deposit(db, user, 500)
+        return txn.amount
+
+    assert run(engine, work) == 500
+    assert len(calls) == 3
+
+def test_async_write_gives_up_with_503(engine, make_users, monkeypatch, no_blocking_sleep):
+    calls = flaky(monkeypatch, failures=WRITE_RETRY_ATTEMPTS)
+    username = make_users(1)[0].username
+
+    async def work(db):
+        user = await async_crud.get_user_by_username(db, username)
+        with pytest.raises(HTTPException) as exc:
+            await async_crud.deposit(db, user, 500)
+        return exc.value.status_code
+
+    assert run(engine, work) == 503
+    assert len(calls) == WRITE_RETRY_ATTEMPTS
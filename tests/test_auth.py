@@ -0,0 +1,20 @@
+from app.auth import create_access_token, get_current_principal, principal_cache
+
+def test_admin_flag_change_drops_the_cached_principal(db, make_users):
+    (user,) = make_users(1)
+    token = create_access_token({"sub": user.username})
+    assert get_current_principal(token, db).is_admin is False
+    assert principal_cache.get(user.username) is not None
+
+    user.is_admin = True
+    assert principal_cache.get(user.username) is not None  # not before the commit
+    db.commit()
+    assert principal_cache.get(user.username) is None
+    assert get_current_principal(token, db).is_admin is True
+
+def test_deactivation_drops_the_cached_principal(db, make_users):
+    (user,) = make_users(1)
+    get_current_principal(create_access_token({"sub": user.username}), db)
+    user.is_active = False
+    db.commit()
+    assert principal_cache.get(user.username) is None
@@ -0,0 +1,32 @@
+from sqlalchemy import event
+from app.crud import apply_batch
+from app.models import Transaction, Wallet
+from app.schemas import BatchItem
+from app.config import TRANSFER_GRAPH_FAN_THRESHOLD
+from app.transfer_graph import FAN_OUT, transfer_graph
+
+def test_batch_locks_all_wallets_in_id_order_before_the_fraud_state(db, engine, make_users):
+    recipient, sender = make_users(2, balance=10_000)  # recipient has the lower wallet id
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, sql, *args: statements.append(sql))
+    results = apply_batch(db, sender, [
+        BatchItem(type="transfer", amount=30, recipient_username=recipient.username),
+        BatchItem(type="withdraw", amount=1_000_000),
+    ])
+    assert [r["ok"] for r in results] == [True, False]
+    wallet_lock = next(i for i, sql in enumerate(statements) if "FROM wallets" in sql and "ORDER BY wallets.id" in sql)
+    fraud_state = next(i for i, sql in enumerate(statements) if "wallet_fraud_state" in sql)
+    assert wallet_lock < fraud_state
+    assert db.get(Wallet, sender.wallet.id).balance == 10_000 - 3000
+    assert db.get(Wallet, recipient.wallet.id).balance == 10_000 + 3000
+
+def test_batch_items_see_earlier_transfers_in_the_same_batch(db, make_users):
+    sender, *recipients = make_users(TRANSFER_GRAPH_FAN_THRESHOLD + 2, balance=10_000)
+    transfer_graph.rebuild(db)  # drop edges other tests left in the shared graph
+    results = apply_batch(db, sender, [
+        BatchItem(type="transfer", amount=1, recipient_username=r.username) for r in recipients
+    ])
+    assert all(r["ok"] for r in results)
+    reasons = [t.flag_reason or "" for t in db.query(Transaction).order_by(Transaction.id)]
+    flagged = [FAN_OUT in reason for reason in reasons]
+    assert flagged == [False] * (TRANSFER_GRAPH_FAN_THRESHOLD - 1) + [True, True]
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+from app.archive import archive_transactions
+from app.checkpoints import balance_at, run_checkpoints
+from app.models import JobWatermark, Transaction
+
+def deposit(db, wallet_id, amount, at):
+    db.add(Transaction(wallet_id=wallet_id, type="deposit", amount=amount, timestamp=at))
+    db.commit()
+
+def test_balance_at_counts_rows_archived_after_its_checkpoint(db, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    now = datetime.utcnow()
+    deposit(db, wallet_id, 10_000, now - timedelta(days=400))
+    run_checkpoints(db)
+    deposit(db, wallet_id, 5_000, now - timedelta(days=399))
+    deposit(db, wallet_id, 700, now - timedelta(days=398))
+    run_checkpoints(db)
+    at = now - timedelta(days=398, hours=12)
+    assert balance_at(db, wallet_id, at) == 15_000
+
+    db.add(JobWatermark(name="fraud_report", last_id=db.get(JobWatermark, "balance_checkpoint").last_id, updated_at=now))
+    db.commit()
+    assert archive_transactions(db, horizon_days=30)["rows"] == 3
+    assert db.query(Transaction).count() == 0
+    assert balance_at(db, wallet_id, at) == 15_000
+    assert balance_at(db, wallet_id, now - timedelta(days=399, hours=12)) == 10_000
+    assert balance_at(db, wallet_id, now) == 15_700
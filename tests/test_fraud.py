@@ -0,0 +1,48 @@
+import json
+import pytest
+from app.fraud import FraudEngine, Plan
+
+@pytest.mark.parametrize("config", [
+    [1, 2],
+    "velocity",
+    {"velocity": 5},
+    {"velocity": [1, 2]},
+    {"nope": {}},
+    {"velocity": {"max_txn": True}},
+    {"velocity": {"max_txn": "5"}},
+    {"velocity": {"max_txn": 0}},
+    {"anomaly": {"threshold": -1}},
+    {"large_amount": {"limit": float("nan")}},
+    {"odd_hour": {"end_hour": 25}},
+    {"large_amount": {"types": "deposit"}},
+    {"large_amount": {"types": [1]}},
+    {"velocity": {"enabled": "false"}},
+    {"velocity": {"action": "drop"}},
+    {"velocity": {"window": 3}},
+])
+def test_bad_rules_are_a_value_error(config):
+    with pytest.raises(ValueError):
+        Plan(config)
+
+def test_valid_rules_override_defaults():
+    plan = Plan({"velocity": {"max_txn": 5}, "odd_hour": {"end_hour": 0, "enabled": False}, "large_amount": {"action": "block"}})
+    assert plan.config["velocity"]["max_txn"] == 5
+    assert plan.config["odd_hour"]["enabled"] is False
+    assert [r.name for r in plan.rules if r.block] == ["large_amount"]
+
+@pytest.mark.parametrize("content", ['{"velocity": 5}', "[1, 2]", "{not json", '{"anomaly": {"threshold": true}}'])
+def test_bad_rules_file_keeps_the_current_plan(tmp_path, content):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"velocity": {"max_txn": 7}}))
+    engine = FraudEngine(str(path))
+    assert engine.params()["velocity"]["max_txn"] == 7
+
+    path.write_text(content)
+    assert engine.reload() is False
+    assert engine.params()["velocity"]["max_txn"] == 7
+
+def test_bad_rules_file_at_startup_uses_defaults(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"velocity": 5}')
+    engine = FraudEngine(str(path))
+    assert engine.params() == Plan({}).config
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from app.fraud_report import run_report
+from app.models import FraudReportSummary, JobWatermark, Transaction
+
+def flagged(db, wallet_id, at):
+    txn = Transaction(wallet_id=wallet_id, type="deposit", amount=100, timestamp=at, flagged=True, flag_reason="Odd")
+    db.add(txn)
+    db.commit()
+    return txn
+
+def reported(db):
+    summaries = db.query(FraudReportSummary).filter(FraudReportSummary.reason == "Odd").all()
+    return sum(s.count for s in summaries)
+
+def test_report_leaves_rows_inside_the_commit_lag_for_the_next_run(db, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    now = datetime.utcnow()
+    old = flagged(db, wallet_id, now - timedelta(minutes=5))
+    recent = flagged(db, wallet_id, now)
+    assert run_report(db)["rows"] == 1
+    assert db.get(JobWatermark, "fraud_report").last_id == old.id
+    assert reported(db) == 1
+
+    # Once it is older than the lag it is picked up, not skipped.
+    recent.timestamp = now - timedelta(minutes=1)
+    db.commit()
+    assert run_report(db)["rows"] == 1
+    assert db.get(JobWatermark, "fraud_report").last_id == recent.id
+    assert reported(db) == 2
@@ -0,0 +1,43 @@
+from decimal import Decimal
+import pytest
+from pydantic import ValidationError
+from app.config import CURRENCY_SCALE, MAX_AMOUNT_MINOR
+from app.money import to_major, to_minor
+from app.schemas import TransactionCreate
+
+@pytest.mark.parametrize("amount, minor", [
+    (12.34, 1234), ("12.34", 1234), (Decimal("0.01"), 1), (5, 500), (-7.5, -750),
+])
+def test_to_minor_is_exact(amount, minor):
+    assert to_minor(amount) == minor
+
+@pytest.mark.parametrize("amount", [0.001, "1.005", Decimal("0.0001"), 0.1 + 0.2])
+def test_to_minor_rejects_finer_precision_than_the_scale(amount):
+    with pytest.raises(ValueError, match="multiple of"):
+        to_minor(amount)
+
+@pytest.mark.parametrize("amount", [True, False])
+def test_to_minor_rejects_bools(amount):
+    with pytest.raises(ValueError):
+        to_minor(amount)
+
+@pytest.mark.parametrize("amount", [float("inf"), float("-inf"), float("nan"), "nan", "Infinity", "abc", None])
+def test_to_minor_rejects_non_finite_and_non_numbers(amount):
+    with pytest.raises(ValueError):
+        to_minor(amount)
+
+def test_to_minor_bounds():
+    largest = Decimal(MAX_AMOUNT_MINOR) / CURRENCY_SCALE
+    assert to_minor(largest) == MAX_AMOUNT_MINOR
+    assert MAX_AMOUNT_MINOR <= 2**63 - 1
+    for amount in (largest + Decimal(1) / CURRENCY_SCALE, 1e20, -1e20, "1e999999"):
+        with pytest.raises(ValueError, match="at most"):
+            to_minor(amount)
+
+def test_oversized_amount_is_a_validation_error():
+    with pytest.raises(ValidationError):
+        TransactionCreate(type="deposit", amount=1e20)
+
+def test_to_major():
+    assert to_major(1234) == 12.34
+    assert to_major(None) is None
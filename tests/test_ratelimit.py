@@ -0,0 +1,32 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from app import ratelimit
+from app.ratelimit import POLICIES, rate_limit
+
+app = FastAPI()
+
+@app.post("/user/login", dependencies=[Depends(rate_limit("login"))])
+def login():
+    return {}
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "backend", ratelimit.MemoryBackend())
+
+def attempts(client, username, n):
+    return [client.post("/user/login", data={"username": username, "password": "wrong"}).status_code for _ in range(n)]
+
+def test_bad_logins_from_one_client_do_not_lock_out_others():
+    burst = POLICIES["login"].burst
+    attacker = TestClient(app, client=("203.0.113.9", 5000))
+    owner = TestClient(app, client=("198.51.100.7", 5000))
+    assert attempts(attacker, "alice", burst + 1) == [200] * burst + [429]
+    assert attempts(owner, "alice", 1) == [200]
+    assert attempts(attacker, "bob", 1) == [200]
+
+def test_per_account_bucket_caps_guessing_from_many_clients():
+    burst = POLICIES["login_account"].burst
+    codes = [attempts(TestClient(app, client=(f"10.0.0.{i}", 5000)), "alice", 1)[0] for i in range(burst + 1)]
+    assert codes == [200] * burst + [429]
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+import numpy as np
+from app.models import Transaction
+from app.rescore import _anomaly, reference_reason, rescore
+
+def test_anomaly_products_do_not_wrap_around_int64():
+    amounts = np.array([2**40, 2**40, 10], dtype=np.int64)
+    prior_count = np.array([2**30, 2**30, 2], dtype=np.int64)
+    prior_sum = np.array([2**62, 2**69 // 3 >> 8, 100], dtype=np.int64)
+    expected = [int(a) * int(c) > 3 * int(s) for a, c, s in zip(amounts, prior_count, prior_sum)]
+    assert _anomaly(amounts, prior_count, prior_sum, 3).tolist() == expected
+    assert _anomaly(amounts, prior_count, prior_sum, 2.5).tolist() == [int(a) * int(c) > 2.5 * int(s) for a, c, s in zip(amounts, prior_count, prior_sum)]
+
+def test_rescore_treats_a_missing_amount_as_zero(db, engine, make_users):
+    wallet_id = make_users(1)[0].wallet.id
+    start = datetime(2026, 1, 1, 12)
+    amounts = [100, None, 100, 5_000]
+    rows = [Transaction(wallet_id=wallet_id, type="deposit", amount=a, timestamp=start + timedelta(hours=i)) for i, a in enumerate(amounts)]
+    db.add_all(rows)
+    db.commit()
+    ids = [row.id for row in rows]
+
+    result = rescore(engine, dry_run=True, collect_ids=set(ids))
+    assert result["rows"] == len(amounts)
+    with engine.connect() as conn:
+        assert [result["collected"][i] for i in ids] == [reference_reason(conn, i) for i in ids]
+    assert result["collected"][ids[-1]] == "Unusual transaction amount"